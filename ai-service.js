@@ -1,11 +1,15 @@
 import express from 'express';
 import fetch from 'node-fetch';
 import dotenv from 'dotenv';
-import { exec } from 'child_process';
+import { spawn } from 'child_process';
+import readline from 'readline';
 dotenv.config();
 
 const app = express();
-app.use(express.json());
+// Connectors upload gzip-encoded chunks (inflated by body-parser), optionally as NDJSON
+const BODY_LIMIT = process.env.BODY_LIMIT || '50mb';
+app.use(express.json({ limit: BODY_LIMIT }));
+app.use(express.text({ type: 'application/x-ndjson', limit: BODY_LIMIT }));
 
 // =================== NANGO CONFIG ===================
 const PORT = process.env.PORT || 3002;
@@ -22,10 +26,10 @@ const HRFLOW_USER_EMAIL = process.env.HRFLOW_USER_EMAIL;
 const HRFLOW_SOURCE_KEY = process.env.HRFLOW_SOURCE_KEY;
 
 
-// Optional HRFlow connector path (Python)
-const HRFLOW_CONNECTOR_PATH =
-  process.env.HRFLOW_CONNECTOR_PATH ||
-  '../connectors/hrflow-connectors/src/hrflow_connectors/v1/connectors/recruitee/connector.py';
+// Long-lived Python connector worker (JSON-RPC over stdin/stdout)
+const CONNECTOR_WORKER_PATH =
+  process.env.CONNECTOR_WORKER_PATH ||
+  new URL('./connectors/connector_worker.py', import.meta.url).pathname;
 
 // =================== HELPER FUNCTION ===================
 async function fetchFromNango(endpoint) {
@@ -47,6 +51,93 @@ async function fetchFromNango(endpoint) {
   return await resp.json();
 }
 
+// =================== CONNECTOR WORKER ===================
+// One Python process keeps connector imports, HTTP sessions and auth warm across fetches
+let connectorWorker = null;
+let nextRequestId = 1;
+const pendingRequests = new Map();
+
+function getConnectorWorker() {
+  if (connectorWorker) return connectorWorker;
+
+  connectorWorker = spawn('python3', [CONNECTOR_WORKER_PATH], { stdio: ['pipe', 'pipe', 'inherit'] });
+  readline.createInterface({ input: connectorWorker.stdout }).on('line', (line) => {
+    let msg;
+    try {
+      msg = JSON.parse(line);
+    } catch {
+      console.warn('⚠️ Non-JSON line from connector worker:', line);
+      return;
+    }
+    const pending = pendingRequests.get(msg.id);
+    if (!pending) return;
+    if (msg.event) return pending.onEvent(msg);
+
+    pendingRequests.delete(msg.id);
+    if (msg.error) pending.reject(Object.assign(new Error(msg.error), { type: msg.type }));
+    else pending.resolve(msg.result);
+  });
+
+  const worker = connectorWorker;
+  // A worker that could not start (ENOENT) or went away (EPIPE on the next write) is dropped and respawned on demand
+  const fail = (message) => {
+    if (connectorWorker !== worker) return;
+    connectorWorker = null;
+    for (const pending of pendingRequests.values()) pending.reject(new Error(message));
+    pendingRequests.clear();
+  };
+  worker.on('exit', (code) => {
+    console.error(`Connector worker exited (${code})`);
+    fail('Connector worker exited');
+  });
+  worker.on('error', (err) => {
+    console.error('Connector worker error:', err.message);
+    fail(`Connector worker error: ${err.message}`);
+  });
+  worker.stdin.on('error', (err) => {
+    console.error('Connector worker stdin error:', err.message);
+    fail(`Connector worker error: ${err.message}`);
+  });
+
+  return worker;
+}
+
+// Errors the worker raised carry its exception type; without one the worker itself failed
+function workerErrorStatus(err) {
+  return err.type ? 500 : 502;
+}
+
+function callConnectorWorker(method, params, onEvent = () => {}) {
+  return new Promise((resolve, reject) => {
+    const id = nextRequestId++;
+    pendingRequests.set(id, { resolve, reject, onEvent });
+    getConnectorWorker().stdin.write(JSON.stringify({ id, method, params }) + '\n');
+  });
+}
+
+// ?mode=incremental for delta pulls, ?stream=1 to receive NDJSON batches as they arrive
+async function respondWithPull(req, res, source, analyze = false) {
+  const mode = req.query.mode === 'incremental' ? 'incremental' : 'full';
+  const stream = req.query.stream === '1';
+  if (req.query.analyze !== undefined) analyze = req.query.analyze === '1';
+  const data = { profiles: [], jobs: [], applications: [] };
+
+  if (stream) res.type('application/x-ndjson');
+  try {
+    const result = await callConnectorWorker('pull', { source, mode, analyze }, (msg) => {
+      if (stream) res.write(JSON.stringify({ kind: msg.kind, records: msg.records }) + '\n');
+      else for (const record of msg.records) data[msg.kind].push(record);
+    });
+    console.log(`✅ ${source} pull complete:`, result.counts);
+    if (stream) return res.end(JSON.stringify({ result }) + '\n');
+    res.json({ ...result, ...data });
+  } catch (err) {
+    console.error(`❌ ${source} connector error:`, err.message);
+    if (stream) return res.end(JSON.stringify({ error: err.message }) + '\n');
+    res.status(500).json({ error: `Failed to run ${source} connector`, details: err.message });
+  }
+}
+
 // =================== HRFLOW PROFILE UPLOAD ===================
 async function sendProfileToHrFlow(profileData) {
   const url = `${HRFLOW_BASE_URL}/profile/indexing`;
@@ -107,6 +198,72 @@ async function sendProfileToHrFlow(profileData) {
 }
 
 
+// One {"type": "profiles"|"jobs"|"applications", "record": {...}} object per line, or for
+// the grouped layout {"type": "profile", "id": ..., "record": {...}} and {"type": "group", "record": {...}}
+function parseNdjson(text) {
+  const body = {};
+  for (const line of text.split('\n')) {
+    if (!line.trim()) continue;
+    const { type, id, record } = JSON.parse(line);
+    if (type === 'profile') {
+      (body.profiles ||= {})[id] = record;
+    } else if (type === 'group') {
+      body.layout = 'grouped';
+      (body.groups ||= []).push(record);
+    } else {
+      (body[type] ||= []).push(record);
+    }
+  }
+  return body;
+}
+
+// Connectors pre-join their data: jobs with their applications, which name a profile by canonical id
+function groupedJobs(body) {
+  const profiles = body.profiles || {};
+  return (body.groups || []).map(({ job_id, job, applications }) => ({
+    jobId: job_id,
+    job: job || {},
+    entries: applications.map((app) => ({ app, candidateId: app.profile, candidate: profiles[app.profile] || app })),
+  }));
+}
+
+// Older payloads send flat lists; join them here, probing every id alias
+function flatJobs(body) {
+  const profiles = body.profiles || [];
+  const jobs = body.jobs || [];
+  const applications = body.applications || [];
+
+  const jobMap = {};
+  for (const job of jobs) {
+    const id = job.id || job.job_id || job.JobID || job.code || job.reference;
+    jobMap[id] = job;
+  }
+
+  const profileMap = {};
+  for (const p of profiles) {
+    const id = p.id || p.employee_id || p.candidate_id || p.ProfileID;
+    profileMap[id] = p;
+  }
+
+  // Group applications by job_id
+  const jobGroups = {};
+  for (const app of applications) {
+    const jobId = app.job_id || app.JobID || app.job?.id;
+    if (!jobGroups[jobId]) jobGroups[jobId] = [];
+    jobGroups[jobId].push(app);
+  }
+
+  return Object.entries(jobGroups).map(([jobId, apps]) => ({
+    jobId,
+    job: jobMap[jobId] || {},
+    entries: apps.map((app) => {
+      const candidateId = app.candidate_id || app.employee_id || app.ProfileID;
+      return { app, candidateId, candidate: profileMap[candidateId] || app };
+    }),
+  }));
+}
+
+
 // =================== HEALTH CHECK ===================
 app.get('/health', (req, res) => {
   res.json({ ok: true, message: ' Mock AI ready and listening' });
@@ -115,47 +272,13 @@ app.get('/health', (req, res) => {
 // =================== HRFLOW CANDIDATE FETCH ===================
 app.get('/fetch-hrflow-candidates', async (req, res) => {
   console.log('⚙️ Running HRFlow Recruitee connector...');
-  exec(`python3 ${HRFLOW_CONNECTOR_PATH}`, (error, stdout, stderr) => {
-    if (error) {
-      console.error(' HRFlow connector error:', stderr || error.message);
-      return res
-        .status(500)
-        .json({ error: 'Failed to run HRFlow connector', details: stderr });
-    }
-    // Try to parse JSON output; fallback to text
-    try {
-      const parsed = JSON.parse(stdout);
-      res.json({ total: parsed.length || 0, results: parsed });
-    } catch (e) {
-      res.json({ raw_output: stdout });
-    }
-  });
+  await respondWithPull(req, res, 'recruitee');
 });
 
 // =================== CEIPAL FETCH (Python connector) ===================
 app.get('/fetch-ceipal-candidates', async (req, res) => {
   console.log('⚙️ Running HRFlow Ceipal connector...');
-
-  const { exec } = await import('child_process');
-
-  // Call your Ceipal connector
-  exec(`python3 ${process.env.HRFLOW_CONNECTOR_PATH}`, (error, stdout, stderr) => {
-    if (error) {
-      console.error('❌ Ceipal connector error:', stderr || error.message);
-      return res
-        .status(500)
-        .json({ error: 'Failed to run Ceipal connector', details: stderr });
-    }
-
-    try {
-      const parsed = JSON.parse(stdout);
-      console.log(`✅ Retrieved ${parsed.length} profiles from Ceipal`);
-      res.json({ total: parsed.length, results: parsed });
-    } catch (e) {
-      console.warn('⚠️ Non-JSON output from connector, returning raw text');
-      res.json({ raw_output: stdout });
-    }
-  });
+  await respondWithPull(req, res, 'ceipal');
 });
 
 
@@ -257,37 +380,20 @@ app.get('/analyze', async (req, res) => {
 
 app.post("/analyze", async (req, res) => {
   try {
-    const profiles = req.body.profiles || [];
-    const jobs = req.body.jobs || [];
-    const applications = req.body.applications || [];
-
-    console.log(`\n📥 Received ${profiles.length} Employees, ${jobs.length} jobs, ${applications.length} applications`);
-    // console.log(JSON.stringify(jobs[0].title.label, null, 2));
-
-    // Build lookup maps
-    const jobMap = {};
-    for (const job of jobs) {
-      const id = job.id || job.job_id || job.JobID || job.code || job.reference;
-      jobMap[id] = job;
-    }
-
-    const profileMap = {};
-    for (const p of profiles) {
-      const id = p.id || p.employee_id || p.candidate_id || p.ProfileID;
-      profileMap[id] = p;
-    }
-
-    // Group applications by job_id
-    const jobGroups = {};
-    for (const app of applications) {
-      const jobId = app.job_id || app.JobID || app.job?.id;
-      if (!jobGroups[jobId]) jobGroups[jobId] = [];
-      jobGroups[jobId].push(app);
+    const body = req.is('application/x-ndjson') ? parseNdjson(req.body) : req.body;
+    const grouped = body.layout === 'grouped';
+    const groups = (grouped ? groupedJobs(body) : flatJobs(body)).filter((group) => group.entries.length);
+
+    if (grouped) {
+      const applications = groups.reduce((n, group) => n + group.entries.length, 0);
+      console.log(`\n📥 Received ${Object.keys(body.profiles || {}).length} Employees, ${(body.groups || []).length} jobs, ${applications} applications`);
+    } else {
+      console.log(`\n📥 Received ${(body.profiles || []).length} Employees, ${(body.jobs || []).length} jobs, ${(body.applications || []).length} applications`);
     }
 
     const analyzed = [];
-    for (const [jobId, apps] of Object.entries(jobGroups)) {
-      const job = jobMap[jobId] || {};
+    const statusUpdates = [];
+    for (const { jobId, job, entries } of groups) {
       const jobName = job.title || job.job_title || job.name || job.job_name || "Unknown Job";
       const JD = job.description || "no description";
 
@@ -295,10 +401,7 @@ app.post("/analyze", async (req, res) => {
       console.log(`Job Description: ${JD || "Unknown"}`);
       console.log("--------------------------------------------------");
 
-      for (const app of apps) {
-        const candidateId = app.candidate_id || app.employee_id || app.ProfileID;
-        const candidate = profileMap[candidateId] || app;
-
+      for (const { app, candidateId, candidate } of entries) {
         const candidateName =
           candidate.first_name && candidate.last_name
             ? `${candidate.first_name} ${candidate.last_name}`
@@ -307,10 +410,12 @@ app.post("/analyze", async (req, res) => {
         const candidateEmail = candidate.email || candidate.work_email || "N/A";
 
 
-        // Simple AI mock scoring
-        const aiScore = Math.floor(Math.random() * 100);
+        // Connectors send a deterministic TF-IDF match score; mock one only when it is missing
+        const aiScore = typeof app.ai_score === 'number' ? app.ai_score : Math.floor(Math.random() * 100);
         const recommendation = aiScore > 70 ? "Strong Fit" : "Consider";
-        const application_id = candidate.application_id
+        const application_id = app.application_id ?? candidate.application_id;
+        // Only BambooHR ids can be written back; other sources' ids would hit unrelated BambooHR applications
+        const writeBack = (app.source || candidate.source) === 'bamboohr';
 
         console.log(`Candidate Name: ${candidateName} \nCandidate Email: ${candidateEmail} `);
         console.log(`AI Score: ${aiScore} | (${recommendation})`);
@@ -318,21 +423,19 @@ app.post("/analyze", async (req, res) => {
         console.log(`Profile URL: ${candidate.profile_url || "No profile found"}\n`);
 
         
-        if (application_id) {
+        if (application_id && writeBack) {
           let newStatus = 1; // default: NEW
       
           if (aiScore > 70) newStatus = 3;   // Example: Interview
           if (aiScore < 30) newStatus = 5;   // Example: Rejected
-      
-          fetch("http://localhost:3002/bamboohr/update-status", {
-              method: "POST",
-              headers: {"Content-Type": "application/json"},
-              body: JSON.stringify({
-                  application_id,
-                  status_id: newStatus
-              })
-          }).then(r => r.json()).then(console.log).catch(console.error);
-        } 
+
+          const currentStatus = candidate.status?.id ?? candidate.status_id ?? app.status?.id ?? app.status_id;
+          statusUpdates.push({ application_id, status_id: newStatus, current_status_id: currentStatus });
+          // Repeat BambooHR applications merged away by dedupe get the same status
+          for (const duplicate_id of app.duplicate_application_ids || []) {
+            statusUpdates.push({ application_id: duplicate_id, status_id: newStatus });
+          }
+        }
         analyzed.push({
           job_id: jobId,
           jobName: jobName,
@@ -348,10 +451,21 @@ app.post("/analyze", async (req, res) => {
 
     console.log(`Analysis complete for ${analyzed.length} total applicants.\n`);
 
+    // Write statuses back as one bounded batch instead of one request per applicant
+    if (statusUpdates.length) {
+      updateBambooStatuses(statusUpdates)
+        .then((report) => {
+          const counts = report.reduce((acc, r) => ({ ...acc, [r.result]: (acc[r.result] || 0) + 1 }), {});
+          console.log('BambooHR status write-back:', counts);
+        })
+        .catch(console.error);
+    }
+
     res.status(200).json({
       analyzed: analyzed.length,
-      grouped_jobs: Object.keys(jobGroups).length,
+      grouped_jobs: groups.length,
       candidates: analyzed,
+      status_updates: statusUpdates,
     });
   } catch (err) {
     console.error("❌ Error in POST /analyze:", err);
@@ -403,24 +517,7 @@ app.post('/send-to-hrflow', async (req, res) => {
 
 app.get('/fetch-bamboohr-data', async (req, res) => {
   console.log('⚙️ Running BambooHR → Mock AI integration...');
-  const CONNECTOR_PATH = '/Users/apbudget/Desktop/mock-ai/connectors/bamboohr_to_mockai_local.py';
-
-  exec(`python3 ${CONNECTOR_PATH}`, (error, stdout, stderr) => {
-    if (error) {
-      console.error('❌ BambooHR connector error:', stderr || error.message);
-      return res.status(500).json({ error: 'Failed to run BambooHR connector', details: stderr });
-    }
-
-    // Try to capture JSON payloads from the connector runner
-    try {
-      const parsed = JSON.parse(stdout);
-      console.log(`✅ Retrieved BambooHR data:`, Object.keys(parsed));
-      res.json(parsed);
-    } catch {
-      console.warn('⚠️ Non-JSON output, returning raw text');
-      res.json({ raw_output: stdout });
-    }
-  });
+  await respondWithPull(req, res, 'bamboohr', true);
 });
 
 app.get('/auth/bamboohr', (req, res) => {
@@ -480,6 +577,76 @@ app.get('/oauth/callback', async (req, res) => {
   }
 });
 
+// =================== BAMBOOHR STATUS WRITE-BACK ===================
+const BAMBOOHR_STATUS_CONCURRENCY = Number(process.env.BAMBOOHR_STATUS_CONCURRENCY || 4);
+const BAMBOOHR_STATUS_INTERVAL_MS = Number(process.env.BAMBOOHR_STATUS_INTERVAL_MS || 200);
+
+async function updateBambooStatus(application_id, status_id) {
+  const url = `https://${process.env.BAMBOOHR_COMPANY_DOMAIN}.bamboohr.com/api/v1/applicant_tracking/applications/${application_id}/status`;
+
+  const response = await fetch(url, {
+      method: "POST",
+      headers: {
+          "Content-Type": "application/json",
+          "Accept": "application/json",
+          "Authorization": `Bearer ${process.env.ACCESS_TOKEN}`
+      },
+      body: JSON.stringify({ status_id })
+  });
+
+  // BambooHR often returns empty text or "OK", not JSON
+  let text = await response.text();
+
+  return {
+      ok: response.ok,
+      http_status: response.status,
+      bamboohr_reply: text || "No response body",
+      application_id,
+      updated_to: status_id
+  };
+}
+
+// Runs `worker` over `items` with at most `limit` in flight, starting no faster than one per `intervalMs`
+async function mapWithLimit(items, limit, intervalMs, worker) {
+  const results = new Array(items.length);
+  let next = 0;
+  let lastStart = 0;
+
+  async function run() {
+    while (next < items.length) {
+      const index = next++;
+      const wait = lastStart + intervalMs - Date.now();
+      lastStart = Math.max(Date.now(), lastStart + intervalMs);
+      if (wait > 0) await new Promise((resolve) => setTimeout(resolve, wait));
+      results[index] = await worker(items[index]);
+    }
+  }
+
+  await Promise.all(Array.from({ length: Math.min(limit, items.length) }, run));
+  return results;
+}
+
+// Takes [{ application_id, status_id, current_status_id? }]; the last update per application wins
+async function updateBambooStatuses(updates) {
+  const latest = new Map();
+  for (const u of updates) latest.set(u.application_id, u);
+
+  return mapWithLimit([...latest.values()], BAMBOOHR_STATUS_CONCURRENCY, BAMBOOHR_STATUS_INTERVAL_MS, async (u) => {
+    if (!u.application_id || !u.status_id) {
+      return { application_id: u.application_id, status_id: u.status_id, result: 'invalid' };
+    }
+    if (u.current_status_id != null && String(u.current_status_id) === String(u.status_id)) {
+      return { application_id: u.application_id, status_id: u.status_id, result: 'skipped' };
+    }
+    try {
+      const reply = await updateBambooStatus(u.application_id, u.status_id);
+      return { ...reply, status_id: u.status_id, result: reply.ok ? 'updated' : 'failed' };
+    } catch (err) {
+      return { application_id: u.application_id, status_id: u.status_id, result: 'failed', error: err.message };
+    }
+  });
+}
+
 app.post('/bamboohr/update-status', async (req, res) => {
   const { application_id, status_id } = req.body;
 
@@ -487,30 +654,9 @@ app.post('/bamboohr/update-status', async (req, res) => {
       return res.status(400).json({ error: "application_id and status_id required" });
   }
 
-  const url = `https://${process.env.BAMBOOHR_COMPANY_DOMAIN}.bamboohr.com/api/v1/applicant_tracking/applications/${application_id}/status`;
-
   try {
-      const response = await fetch(url, {
-          method: "POST",
-          headers: {
-              "Content-Type": "application/json",
-              "Accept": "application/json",
-              "Authorization": `Bearer ${process.env.ACCESS_TOKEN}`
-          },
-          body: JSON.stringify({ status_id })
-      });
-
-      // BambooHR often returns empty text or "OK", not JSON
-      let text = await response.text();
-
       // Always return valid JSON to your AI-service
-      return res.json({
-          ok: response.ok,
-          http_status: response.status,
-          bamboohr_reply: text || "No response body",
-          application_id,
-          updated_to: status_id
-      });
+      return res.json(await updateBambooStatus(application_id, status_id));
 
   } catch (err) {
       console.error("❌ BambooHR update error:", err);
@@ -521,21 +667,39 @@ app.post('/bamboohr/update-status', async (req, res) => {
   }
 });
 
-app.get('/fetch-workable-data', (req, res) => {
-  const PATH = process.env.WORKABLE_CONNECTOR_PATH;
+app.post('/bamboohr/update-status/bulk', async (req, res) => {
+  const updates = req.body.updates || req.body.status_updates;
 
-  exec(`python3 ${PATH}`, (error, stdout, stderr) => {
-    if (error) {
-      console.error("❌ Workable connector error:", stderr || error.message);
-      return res.status(500).json({ error: "Workable connector failed", details: stderr });
-    }
+  if (!Array.isArray(updates)) {
+      return res.status(400).json({ error: "updates array required" });
+  }
 
-    try {
-      res.json(JSON.parse(stdout));
-    } catch {
-      res.json({ raw_output: stdout });
-    }
-  });
+  const report = await updateBambooStatuses(updates);
+  res.json({ total: report.length, results: report });
+});
+
+app.get('/fetch-workable-data', async (req, res) => {
+  await respondWithPull(req, res, 'workable', true);
+});
+
+// Best indexed candidates for a job, from the feature index the syncs keep up to date
+app.get('/jobs/:source/:jobId/top-candidates', async (req, res) => {
+  const k = Number(req.query.k) || 10;
+  try {
+    res.json(await callConnectorWorker('top_candidates', { source: req.params.source, job_id: req.params.jobId, k }));
+  } catch (err) {
+    res.status(err.type === 'NotIndexed' ? 404 : workerErrorStatus(err)).json({ error: err.message });
+  }
+});
+
+// Connector worker metrics in Prometheus text format (CONNECTOR_METRICS=1)
+app.get('/metrics', async (req, res) => {
+  try {
+    const { text } = await callConnectorWorker('metrics', {});
+    res.type('text/plain; version=0.0.4').send(text);
+  } catch (err) {
+    res.status(workerErrorStatus(err)).json({ error: err.message });
+  }
 });
 
 // =================== START SERVER ===================
@@ -1,238 +1,335 @@
-import sys, os, json, requests
+import sys, os, json, logging, requests
+from contextlib import nullcontext
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+import http_client, mockai_upload, normalize, feature_index, resumes, metrics, progress
+from cli_output import RecordWriter, output_mode, setup_logging
+from sync_state import SyncCheckpoint
+from staging import StagingStore
 
 subdomain = os.getenv("WORKABLE_SUBDOMAIN", "techclub-inc")
 api_key = os.getenv("WORKABLE_API_KEY", "oHqvHlSpVrbr3AuKRbiqoXRZYWGVlRVRwj3ffDGzpmI")
 MOCK_AI_URL = "http://localhost:3002/analyze"
+# Overridable to point the connector at a proxy or at benchmark.py's stub server
+WORKABLE_BASE_URL = os.getenv("WORKABLE_BASE_URL", f"https://{subdomain}.workable.com/spi/v3")
 
+log = logging.getLogger("workable")
 
-import time
+# Request pacing for the SPI lives in http_client.HOST_RATE_LIMITS
+WORKABLE_MAX_IN_FLIGHT = int(os.getenv("WORKABLE_MAX_IN_FLIGHT", "8"))
+WORKABLE_PAGE_SIZE = int(os.getenv("WORKABLE_PAGE_SIZE", "100"))
 
-def fetch_workable_jobs():
-    url = f"https://{subdomain}.workable.com/spi/v3/jobs"
-    headers = {
+
+def workable_headers():
+    return {
         "Accept": "application/json",
         "Authorization": f"Bearer {api_key}",
     }
 
-    retries = 5
-    delay = 2
 
-    print("🔍 Fetching jobs from Workable...")
+class EnrichError(Exception):
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
 
-    for attempt in range(retries):
-        response = requests.get(url, headers=headers)
 
-        if response.ok:
-            jobs = response.json().get("jobs", [])
-            print(f"Retrieved {len(jobs)} jobs")
-            return jobs
+# The candidate is gone or unusable; retrying will not help
+PERMANENT_STATUSES = (400, 404, 410, 422)
 
-        if response.status_code == 429:
-            print(f"⏳ Rate limit hit. Retry {attempt+1}/{retries} in {delay}s...")
-            time.sleep(delay)
-            delay *= 2
-            continue
 
-        print(f"Error fetching jobs: {response.status_code} - {response.text}")
-        return []
+def enrich_candidate(url, headers, cand, strict=False):
+    """Attach resume/experience/education details from /candidates/{id} to one candidate.
 
-    print("Could not fetch jobs after retries.")
-    return []
+    A failed detail call leaves the candidate without details, or with `strict` raises
+    requests.RequestException / EnrichError so the caller can record it.
+    """
+    cid = cand.get("id")
+    if not cid:
+        return cand
 
-def fetch_workable_candidates():
-    """Fetch candidates directly from Workable API"""
-    url = f"https://{subdomain}.workable.com/spi/v3/candidates?limit=50"
-    headers = {
-        "Accept": "application/json",
-        "Authorization": f"Bearer {api_key}",
-    }
-    
-    print("🔍 Fetching candidates from Workable...")
-    response = requests.get(url, headers=headers)
-    
+    # A 429 only backs off this candidate; the other workers keep draining the queue
+    try:
+        # Keyed on updated_at as well, so an unchanged candidate's detail comes from the cache
+        detail_resp = http_client.get(f"{url}/{cid}", headers=headers, cache_tag=cand.get("updated_at"))
+    except requests.RequestException as e:
+        if strict:
+            raise
+        log.warning(f"Error enriching candidate {cid}: {e}")
+        detail_resp = None
+
+    if strict and not detail_resp.ok:
+        raise EnrichError(f"{detail_resp.status_code} - {detail_resp.text[:200]}",
+                          permanent=detail_resp.status_code in PERMANENT_STATUSES)
+
+    if detail_resp is not None and detail_resp.ok:
+        detail = detail_resp.json().get("candidate", {})
+        cand["resume_url"] = detail.get("resume_url")
+        cand["experience_entries"] = detail.get("experience_entries")
+        cand["education_entries"] = detail.get("education_entries")
+        cand["summary"] = detail.get("summary")
+        cand["social_profiles"] = detail.get("social_profiles")
+    else:
+        cand["resume_url"] = None
+
+    return cand
+
+
+def iter_workable_pages(path, key, params=None):
+    """Yield each page of a Workable listing, following `paging.next` until exhausted."""
+    url = f"{WORKABLE_BASE_URL}/{path}"
+    params = {"limit": WORKABLE_PAGE_SIZE, **(params or {})}
+    headers = workable_headers()
+
+    while url:
+        with metrics.span("fetch", source="workable", kind=key):
+            response = http_client.get(url, headers=headers, params=params)
+            if not response.ok:
+                log.error(f"Error fetching {path}: {response.status_code} - {response.text}")
+                return
+            body = response.json()
+        yield body.get(key, [])
+        # `paging.next` already carries the cursor and limit
+        url = (body.get("paging") or {}).get("next")
+        params = None
+
+
+def iter_workable_jobs():
+    log.info("🔍 Fetching jobs from Workable...")
+    total = 0
+    for page in iter_workable_pages("jobs", "jobs"):
+        total += len(page)
+        yield from page
+    log.info(f"Retrieved {total} jobs")
+
+
+def fetch_workable_jobs():
+    return list(iter_workable_jobs())
+
+
+def fetch_workable_job(shortcode):
+    """One job by shortcode, or None when Workable does not return it."""
+    response = http_client.get(f"{WORKABLE_BASE_URL}/jobs/{shortcode}", headers=workable_headers())
     if not response.ok:
-        print(f"Error fetching candidates: {response.status_code} - {response.text}")
-        return []
-    
-    candidates = response.json().get("candidates", [])
-    print(f"Retrieved {len(candidates)} candidates")
-    
-    enriched = []
+        log.warning(f"Error fetching job {shortcode}: {response.status_code} - {response.text[:200]}")
+        return None
+    body = response.json()
+    return body.get("job", body)
+
+
+def iter_workable_candidate_pages(max_in_flight=WORKABLE_MAX_IN_FLIGHT, prefetch=True, updated_after=None, skip_ids=(),
+                                  shortcodes=None, ledger=None):
+    """Yield enriched candidate pages as they arrive; the next page is fetched while this one is enriched.
+
+    Candidates in `skip_ids` (already staged by an interrupted run) are not enriched again.
+    With `shortcodes` only those jobs' candidates are listed, one job after another.
+    With a `ledger` (progress.Ledger) a candidate whose detail call fails is recorded and
+    left out instead of yielded without details; candidates earlier runs failed to
+    enrich are retried first, and dead-lettered ones are skipped.
+    """
+    url = f"{WORKABLE_BASE_URL}/candidates"
+    headers = workable_headers()
+
+    log.info("🔍 Fetching candidates from Workable...")
+    params = {"updated_after": updated_after} if updated_after else {}
+    if shortcodes is None:
+        pages = iter_workable_pages("candidates", "candidates", params)
+    else:
+        pages = chain.from_iterable(iter_workable_pages("candidates", "candidates", {**params, "shortcode": shortcode})
+                                    for shortcode in shortcodes)
+    retries = None
+    if ledger is not None:
+        # Retried from the ledger's copy: an incremental listing may no longer include them
+        retries = [entry["record"] for rid, entry in ledger.pending("enrich").items()
+                   if entry.get("record") and rid not in skip_ids
+                   and (shortcodes is None or (entry["record"].get("job") or {}).get("shortcode") in shortcodes)]
+        skip_ids = set(skip_ids) | ledger.dead_letters["enrich"].keys() | {str(c.get("id")) for c in retries}
+        if retries:
+            log.info(f"Retrying {len(retries)} candidates that failed enrichment before")
+            pages = chain([retries], pages)
+    total = 0
 
-    for cand in candidates:
-        cid = cand.get("id")
-        if not cid:
-            enriched.append(cand)
-            continue
+    def enrich(cand):
+        if ledger is None:
+            return enrich_candidate(url, headers, cand)
+        try:
+            return enrich_candidate(url, headers, cand, strict=True)
+        except (requests.RequestException, EnrichError) as e:
+            if not ledger.fail("enrich", cand.get("id"), e, record=cand, permanent=getattr(e, "permanent", False)):
+                log.warning(f"Error enriching candidate {cand.get('id')}: {e} (will retry on the next run)")
+            return None
 
-        detail_url = f"{url}/{cid}"
-        detail_resp = requests.get(detail_url, headers=headers)
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool, ThreadPoolExecutor(max_workers=1) as prefetcher:
+        pending = prefetcher.submit(next, pages, None)
+        while True:
+            candidates = pending.result()
+            if candidates is None:
+                break
+            if prefetch:
+                pending = prefetcher.submit(next, pages, None)
 
-        if detail_resp.ok:
-            detail = detail_resp.json().get("candidate", {})
-            cand["resume_url"] = detail.get("resume_url")
-            cand["experience_entries"] = detail.get("experience_entries")
-            cand["education_entries"] = detail.get("education_entries")
-            cand["summary"] = detail.get("summary")
-            cand["social_profiles"] = detail.get("social_profiles")
-        else:
-            cand["resume_url"] = None
+            if candidates is not retries:
+                candidates = [cand for cand in candidates if str(cand.get("id")) not in skip_ids]
+            with metrics.span("enrich", source="workable"):
+                enriched = [cand for cand in pool.map(enrich, candidates) if cand is not None]
+            if ledger is not None:
+                ledger.done("enrich", [cand.get("id") for cand in enriched if cand.get("id")])
+            total += len(enriched)
+            log.info(f"Retrieved and enriched {total} candidates so far")
+            if enriched:
+                yield enriched
 
-        enriched.append(cand)
+            if not prefetch:
+                pending = prefetcher.submit(next, pages, None)
 
-    print("Finished enriching candidates with resume_url")
-   
-    return enriched
+    log.info("Finished enriching candidates with resume_url")
+
+
+def iter_workable_candidates(**kwargs):
+    for page in iter_workable_candidate_pages(**kwargs):
+        yield from page
+
+
+def fetch_workable_candidates(**kwargs):
+    """Fetch candidates directly from Workable API"""
+    return list(iter_workable_candidates(**kwargs))
 
 
 def transform_candidates_to_profiles(candidates):
-    profiles = []
-    
+    """Lazily map Workable candidates to Mock AI profiles; `candidates` may be any iterable."""
     for candidate in candidates:
-        profile = {
-            "id": candidate.get("id"),
-            "candidate_id": candidate.get("id"),
-            "name": candidate.get("name"),
-            "first_name": candidate.get("firstname"),
-            "last_name": candidate.get("lastname"),
-            "email": candidate.get("email"),
-            "phone": candidate.get("phone"),
-            "headline": candidate.get("headline"),
-            
-            "job_id": candidate.get("job", {}).get("shortcode"),
-            "job_title": candidate.get("job", {}).get("title"),
-            
-            "stage": candidate.get("stage"),
-            "stage_kind": candidate.get("stage_kind"),
-            "disqualified": candidate.get("disqualified", False),
-            
-            "profile_url": candidate.get("profile_url"),
-            "resume_url": candidate.get("resume_url"),
-            "sourced": candidate.get("sourced"),
-            "created_at": candidate.get("created_at"),
-        }
-        
-        if candidate.get("education_entries"):
-            profile["education"] = candidate["education_entries"]
-        
-        if candidate.get("experience_entries"):
-            profile["experience"] = candidate["experience_entries"]
-        
-        profiles.append(profile)
-    
-    return profiles
+        yield normalize.profile_from_workable(candidate, "workable").to_dict()
 
 
 def transform_jobs(jobs):
-    transformed = []
-    
     for job in jobs:
-        job_data = {
-            "job_id": job.get("shortcode"),
-            "code": job.get("code"),
-            "reference": job.get("shortcode"),
-            "title": job.get("title"),
-            "description": job.get("description"),
-            "requirements": job.get("requirements"),
-            "benefits": job.get("benefits"),
-            "employment_type": job.get("employment_type"),
-            "department": job.get("department"),
-            "location": job.get("location", {}).get("location_str"),
-            "state": job.get("state"),
-            "url": job.get("url"),
-            "created_at": job.get("created_at"),
-        }
-        transformed.append(job_data)
-    
-    return transformed
+        yield normalize.job_from_workable(job, "workable").to_dict()
 
 
 def create_applications_from_candidates(candidates):
-    applications = []
-    
     for candidate in candidates:
-        job = candidate.get("job", {})
-        app = {
-            "application_id": candidate.get("id"),
-            "candidate_id": candidate.get("id"),
-            "job_id": candidate.get("job", {}).get("shortcode"),
-            "stage": candidate.get("stage"),
-            "stage_kind": candidate.get("stage_kind"),
-            "disqualified": candidate.get("disqualified", False),
-            "created_at": candidate.get("created_at"),
-            "job_title": job.get("title"), 
-
-            "resume_url": candidate.get("resume_url"),
-            "profile_url": candidate.get("profile_url"),
-        }
-        applications.append(app)
-    
-    return applications
+        yield normalize.application_from_workable(candidate, "workable").to_dict()
 
 
-def send_to_mock_ai(profiles, jobs, applications):
-    payload = {
-        "profiles": profiles,
-        "jobs": jobs,
-        "applications": applications
-    }
+def send_to_mock_ai(stage, ledger=None):
+    profiles, jobs, applications = stage.count("profiles"), stage.count("jobs"), stage.count("applications")
+    log.info(f"📤 Sending {profiles + jobs + applications} records to Mock AI "
+             f"({profiles} profiles, {jobs} jobs, {applications} applications)")
     
-    total_records = len(profiles) + len(jobs) + len(applications)
-    print(f"\n📤 Sending {total_records} records to Mock AI...")
-    print(f"   - {len(profiles)} profiles")
-    print(f"   - {len(jobs)} jobs")
-    print(f"   - {len(applications)} applications")
-    
-    try:
-        resp = requests.post(MOCK_AI_URL, json=payload)
-        resp.raise_for_status()
-        
-        analysis = resp.json()
-        print("\nAI Analysis Complete:")
-        print(json.dumps(analysis, indent=2))
-        
-        return analysis
-        
-    except Exception as e:
-        print(f"Error sending to Mock AI: {e}")
+    analysis = mockai_upload.send_staged(stage, url=MOCK_AI_URL, ledger=ledger)
+    if analysis is None:
+        log.error("Error sending to Mock AI: every chunk failed")
         return None
+    
+    log.info(f"AI Analysis Complete: {analysis['analyzed']} candidates across {analysis['grouped_jobs']} jobs")
+    for candidate in analysis["candidates"]:
+        log.debug(json.dumps(candidate))
+    if analysis["failed_chunks"]:
+        log.warning(f"⚠️  {analysis['failed_chunks']} of {analysis['chunks']} chunks failed"
+                    + (" — rerun with --resume to send only those" if ledger is not None else ""))
+    
+    return analysis
 
 
-if __name__ == "__main__":
-    print("Using Workable:", subdomain)
-    print("=" * 60)
+def iter_batches(checkpoint=None, stage=None, jobs=None, ledger=None):
+    """Yield ("profiles" | "applications" | "jobs", records) batches as candidate pages arrive.
+
+    With a checkpoint only candidates updated since its high-water mark are requested,
+    unchanged ones are dropped, and jobs are limited to changed or referenced ones.
+    With a stage every batch is appended to it before being yielded, and whatever a
+    resumed stage already holds is not fetched again.
+    Given already-listed Workable `jobs`, only those jobs and their candidates are
+    pulled, as workable_partitioned's shards do. A `ledger` tracks enrichment per candidate.
+    """
+    shortcodes = None if jobs is None else [job.get("shortcode") for job in jobs]
+    stage = stage or StagingStore("workable")
+    updated_after = checkpoint.high_water_mark if checkpoint else None
+    if updated_after:
+        log.info(f"Incremental sync: candidates updated after {updated_after}")
+
+    job_ids = {app.get("job_id") for app in stage.iter("applications")}
+    if not stage.is_complete("profiles"):
+        staged = stage.ids.get("profiles", set())
+        with resumes.ResumePipeline(stage.source) if resumes.RESUME_PIPELINE else nullcontext() as resume_pipeline:
+            for page in iter_workable_candidate_pages(updated_after=updated_after, skip_ids=staged, shortcodes=shortcodes,
+                                                      ledger=ledger):
+                if checkpoint:
+                    checkpoint.advance(max((c.get("updated_at") or c.get("created_at") or "" for c in page), default=None))
+                    # resume_url is a short-lived signed link, so it changes on every fetch
+                    page = list(checkpoint.changed("candidates", page, exclude=("resume_url",)))
+                if not page:
+                    continue
+                with metrics.span("transform", source="workable", kind="candidates"):
+                    applications = list(create_applications_from_candidates(page))
+                    profiles = list(transform_candidates_to_profiles(page))
+                applications = stage.append("applications", applications)
+                job_ids.update(app.get("job_id") for app in applications)
+                if resume_pipeline:
+                    resume_pipeline.attach(profiles)
+                yield "profiles", stage.append("profiles", profiles)
+                yield "applications", applications
+        # Candidates still to retry keep the listing open, so --resume gets back to them
+        if ledger is None or not ledger.pending("enrich"):
+            stage.mark_complete("profiles")
+
+    if not stage.is_complete("jobs"):
+        jobs = list(iter_workable_jobs()) if jobs is None else jobs
+        with metrics.span("transform", source="workable", kind="jobs"):
+            jobs = list(transform_jobs(jobs))
+        if checkpoint:
+            changed_jobs = {job.get("job_id") for job in checkpoint.changed("jobs", jobs)}
+            jobs = [job for job in jobs if job.get("job_id") in changed_jobs or job.get("job_id") in job_ids]
+        jobs = stage.append("jobs", jobs)
+        stage.mark_complete("jobs")
+        if jobs:
+            yield "jobs", jobs
+
+
+def main(incremental=False, output="text", resume=False):
+    log.info(f"Using Workable: {subdomain}")
     
-    # 1: Fetch raw data from Workable
-    raw_candidates = fetch_workable_candidates()
-    raw_jobs = fetch_workable_jobs()
+    checkpoint = SyncCheckpoint("workable") if incremental else None
+    writer = RecordWriter(output)
     
-    if not raw_candidates:
-        print(" No candidates found. Check your API credentials.")
-        exit(1)
+    # 1-3: Stream candidate pages from Workable, transform each page as it arrives and
+    # stage it on disk, so memory stays flat and an interrupted run can --resume
+    stage = StagingStore("workable", resume=resume)
+    # Per-candidate progress: a --resume run only enriches and uploads what is still missing
+    ledger = progress.for_run("workable", resume)
+    for kind, records in iter_batches(checkpoint, stage, ledger=ledger):
+        writer.write(kind, records)
+    profiles, jobs, applications = stage.count("profiles"), stage.count("jobs"), stage.count("applications")
+    
+    if checkpoint and not profiles and not jobs:
+        checkpoint.save()
+        log.info("No changes since last sync.")
+        writer.close()
+        return None
     
-    # 2: Transform data
-    print("\n Transforming data...")
-    profiles = transform_candidates_to_profiles(raw_candidates)
-    jobs = transform_jobs(raw_jobs)
-    applications = create_applications_from_candidates(raw_candidates)
+    if not profiles and not checkpoint:
+        log.error("No candidates found. Check your API credentials.")
+        exit(1)
     
-    print(f"Transformed:")
-    print(f"   - {len(profiles)} profiles")
-    print(f"   - {len(jobs)} jobs")
-    print(f"   - {len(applications)} applications")
+    log.info(f"Staged {profiles} profiles, {jobs} jobs, {applications} applications in {stage.dir}")
     
-    # 3: Save locally for inspection
-    with open("workable_data.json", "w") as f:
-        json.dump({
-            "profiles": profiles,
-            "jobs": jobs,
-            "applications": applications
-        }, f, indent=2)
-    print("\nSaved to workable_data.json")
+    # 4: Refresh the feature index, then send to Mock AI
+    # Candidates still failing enrichment are not staged, so only prune after a clean full pull
+    feature_index.update_from_stage("workable", stage, full=not checkpoint and not ledger.pending("enrich"))
+    analysis = send_to_mock_ai(stage, ledger)
+    stage.close()
+    ledger.close()
     
-    # 4: Send to Mock AI
-    print("\n" + "=" * 60)
-    analysis = send_to_mock_ai(profiles, jobs, applications)
+    if analysis is not None and checkpoint and not analysis["failed_chunks"]:
+        checkpoint.save()
     
-    if analysis and "candidates" in analysis:
-        print(f"\n Analyzed {analysis.get('analyzed', 0)} candidates")
\ No newline at end of file
+    if analysis is not None:
+        writer.write("candidates", analysis["candidates"])
+        summary = {k: v for k, v in analysis.items() if k not in ("candidates", "status_updates")}
+        writer.result("analysis", summary, f"Analyzed {analysis['analyzed']} candidates")
+    writer.close()
+    return analysis
+
+
+if __name__ == "__main__":
+    setup_logging()
+    with metrics.run("workable"):
+        main(incremental="--incremental" in sys.argv, output=output_mode(sys.argv), resume="--resume" in sys.argv)
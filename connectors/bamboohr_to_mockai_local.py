@@ -1,80 +1,80 @@
-import sys, os, json, requests
+import sys, os, json, logging, argparse
+from concurrent.futures import ThreadPoolExecutor
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "hrflow-connectors/src")))
 
-from hrflow_connectors.v1.connectors.bamboohr.connector import BambooHR
-from hrflow_connectors.v1.connectors.hrflow.warehouse import HrFlowProfileWarehouse, HrFlowJobWarehouse
-
-
-class LocalWriter:
-    def __init__(self, name):
-        self.name = name
-        self.collected = []
-
-    def parameters(self, **kwargs):
-        return self
-
-    def __call__(self, profiles, *args, **kwargs):
-        all_data = []
-        for key in ["profiles","data","items","candidates","employees","jobs","applicants","applications"]:
-            if key in kwargs and isinstance(kwargs[key], list):
-                all_data.extend(kwargs[key])
-        for arg in args:
-            if isinstance(arg, list):
-                all_data.extend(arg)
-        if isinstance(profiles, list):
-            all_data.extend(profiles)
-        elif isinstance(profiles, dict):
-            all_data.append(profiles)
-
-        simplified = []
-        for p in all_data:
-            if hasattr(p, "to_dict"):
-                simplified.append(p.to_dict())
-            elif isinstance(p, dict):
-                simplified.append(p)
-            elif hasattr(p, "__dict__"):
-                simplified.append({k: str(v) for k, v in p.__dict__.items() if not k.startswith("_")})
-        self.collected.extend(simplified)
-        return []
+import http_client, mockai_upload, feature_index, metrics, progress
+from sync_state import SyncCheckpoint
+from staging import StagingStore
+from normalize import LocalWriter
+from cli_output import RecordWriter, parse_command, setup_logging, sync_options
+
+log = logging.getLogger("bamboohr")
 
 
 company_subdomain = os.getenv("BAMBOOHR_SUBDOMAIN", "sonia")
 api_key = os.getenv("BAMBOOHR_API_KEY", "53180a4692db2060d2443fe4b56fa401c74565b2")
 access_token = os.getenv("ACCESS_TOKEN", "305fa32abcf52d1d791f8d9caaeeb38979eccc3b")
 MOCK_AI_URL = "http://localhost:3002/analyze"
+# Write-back pacing itself comes from http_client.HOST_RATE_LIMITS["bamboohr.com"]
+BAMBOOHR_MAX_IN_FLIGHT = int(os.getenv("BAMBOOHR_MAX_IN_FLIGHT", "4"))
+
+
+def load_hrflow():
+    """Import the HrFlow connector tree on first use; it is slow and only pulls need it."""
+    from hrflow_connectors.v1.connectors.bamboohr.connector import BambooHR
+    from hrflow_connectors.v1.connectors.hrflow.warehouse import HrFlowProfileWarehouse, HrFlowJobWarehouse
+    return BambooHR, HrFlowProfileWarehouse, HrFlowJobWarehouse
 
 
-def run_profile_connector(action_fn, label):
-    writer = LocalWriter(label)
+def run_profile_connector(action_fn, label, kind="profiles", stage=None, ledger=None):
+    _, HrFlowProfileWarehouse, _ = load_hrflow()
+    writer = LocalWriter("bamboohr", kind, stage, ledger)
     HrFlowProfileWarehouse.write = writer
     try:
-        action_fn(
-            workflow_id=f"bamboohr_{label.lower()}",
-            action_parameters={"read_mode": "sync"},
-            origin_parameters={"company_subdomain": company_subdomain, "access_token": access_token,},
-            target_parameters={"api_user": "dummy", "api_secret": "dummy", "source_key": "dummy_key"},
-        )
+        with http_client.route_requests():
+            action_fn(
+                workflow_id=f"bamboohr_{label.lower()}",
+                action_parameters={"read_mode": "sync"},
+                origin_parameters={"company_subdomain": company_subdomain, "access_token": access_token,},
+                target_parameters={"api_user": "dummy", "api_secret": "dummy", "source_key": "dummy_key"},
+            )
     except Exception as e:
-        print(f"Error fetching {label}: {e}")
-    print(f"{label}: {len(writer.collected)} records pulled")
+        log.error(f"Error fetching {label}: {e}")
+        return None
+    log.info(f"{label}: {len(writer)} records pulled")
     return writer.collected
 
 
-def run_job_connector(action_fn, label):
-    writer = LocalWriter(label)
+def run_job_connector(action_fn, label, stage=None, ledger=None):
+    _, _, HrFlowJobWarehouse = load_hrflow()
+    writer = LocalWriter("bamboohr", "jobs", stage, ledger)
     HrFlowJobWarehouse.write = writer
     try:
-        action_fn(
-            workflow_id=f"bamboohr_{label.lower()}",
-            action_parameters={"read_mode": "sync"},
-            origin_parameters={"company_subdomain": company_subdomain, "access_token": access_token,},
-            target_parameters={"api_user": "dummy", "api_secret": "dummy", "board_key": "dummy_board"},
-        )
+        with http_client.route_requests():
+            action_fn(
+                workflow_id=f"bamboohr_{label.lower()}",
+                action_parameters={"read_mode": "sync"},
+                origin_parameters={"company_subdomain": company_subdomain, "access_token": access_token,},
+                target_parameters={"api_user": "dummy", "api_secret": "dummy", "board_key": "dummy_board"},
+            )
     except Exception as e:
-        print(f" Error fetching {label}: {e}")
-    print(f"{label}: {len(writer.collected)} records pulled")
+        log.error(f"Error fetching {label}: {e}")
+        return None
+    log.info(f"{label}: {len(writer)} records pulled")
     return writer.collected
 
+def fetch_application(company_subdomain, access_token, application_id):
+    """One application with its applicant, job and status, straight from the ATS API.
+
+    Raises requests.HTTPError when BambooHR does not return it.
+    """
+    url = f"https://{company_subdomain}.bamboohr.com/api/v1/applicant_tracking/applications/{application_id}"
+    headers = {"Accept": "application/json", "Authorization": f"Bearer {access_token}"}
+    resp = http_client.get(url, headers=headers, cache=False)
+    resp.raise_for_status()
+    return resp.json()
+
+
 def update_application_status(company_subdomain, access_token, application_id, status_id):
     url = f"https://{company_subdomain}.bamboohr.com/api/v1/applicant_tracking/applications/{application_id}/status"
 
@@ -88,67 +88,220 @@ def update_application_status(company_subdomain, access_token, application_id, s
         "status": {"id": status_id}
     }
 
-    print(f" Updating BambooHR Application {application_id} → Status {status_id}")
-    print(f" POST {url}")
+    log.debug(f"Updating BambooHR Application {application_id} → Status {status_id}: POST {url}")
 
-    resp = requests.post(url, json=payload, headers=headers)
+    resp = http_client.post(url, json=payload, headers=headers)
 
     if resp.status_code not in [200, 201]:
-        print(f"Failed: {resp.status_code} - {resp.text}")
-        return {"success": False, "error": resp.text}
+        log.warning(f"Status update for {application_id} failed: {resp.status_code} - {resp.text}")
+        return {"success": False, "error": resp.text, "status": resp.status_code}
 
-    print(f"Status updated successfully: {resp.text}")
+    log.debug(f"Status updated successfully: {resp.text}")
     return {"success": True, "response": resp.json() if resp.text else {}}
 
 
-print("ACCESS_TOKEN =", os.getenv("ACCESS_TOKEN"))
-
-employees = run_profile_connector(BambooHR.pull_profile_list, "Employees")
-
-try:
-    jobs = run_job_connector(BambooHR.pull_job_list, "Jobs")
-except AttributeError:
-    jobs = []
-
-try:
-    applications = run_profile_connector(BambooHR.pull_application_list, "Applications")
-except AttributeError:
-    applications = []
-
-
-
+# The application or status does not exist; sending it again will not help
+PERMANENT_STATUSES = (400, 404, 422)
+
+
+def update_application_statuses(company_subdomain, access_token, updates, current_statuses=None, max_in_flight=BAMBOOHR_MAX_IN_FLIGHT,
+                                ledger=None):
+    """Apply many (application_id, status_id) updates concurrently and return one report entry per application.
+
+    The last update per application wins, and updates matching `current_statuses`
+    (application_id -> status_id) are skipped without calling BambooHR. With a `ledger`
+    (progress.Ledger) updates it already recorded as written are skipped too, and failed
+    ones are kept for `update_status --retry` until they are dead-lettered.
+    """
+    current_statuses = {str(k): str(v) for k, v in (current_statuses or {}).items() if v is not None}
+    latest = {}
+    for application_id, status_id in updates:
+        latest[str(application_id)] = (application_id, status_id)
+
+    report, pending = [], []
+    for key, (application_id, status_id) in latest.items():
+        if current_statuses.get(key) == str(status_id) or (ledger is not None and ledger.is_done("write_back", key, str(status_id))):
+            report.append({"application_id": application_id, "status_id": status_id, "result": "skipped"})
+        else:
+            pending.append((application_id, status_id))
+
+    def apply(update):
+        application_id, status_id = update
+        try:
+            outcome = update_application_status(company_subdomain, access_token, application_id, status_id)
+        except Exception as e:
+            outcome = {"success": False, "error": str(e)}
+        if ledger is not None:
+            if outcome["success"]:
+                ledger.done("write_back", [application_id], value=str(status_id))
+            else:
+                ledger.fail("write_back", application_id, outcome["error"],
+                            record={"application_id": application_id, "status_id": status_id},
+                            permanent=outcome.get("status") in PERMANENT_STATUSES)
+        return {"application_id": application_id, "status_id": status_id,
+                "result": "updated" if outcome["success"] else "failed", **outcome}
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        report.extend(pool.map(apply, pending))
+
+    log.info(f"Status write-back: {sum(r['result'] == 'updated' for r in report)} updated, "
+             f"{sum(r['result'] == 'skipped' for r in report)} unchanged, "
+             f"{sum(r['result'] == 'failed' for r in report)} failed")
+    return report
+
+
+def load_status_updates(path):
+    """Read updates from a JSON list or an /analyze response carrying `status_updates`."""
+    with open(path) as f:
+        data = json.load(f)
+    items = data.get("status_updates", []) if isinstance(data, dict) else data
+
+    updates, current = [], {}
+    for item in items:
+        updates.append((item["application_id"], item["status_id"]))
+        if item.get("current_status_id") is not None:
+            current[item["application_id"]] = item["current_status_id"]
+    return updates, current
+
+
+def pull(stage, ledger=None):
+    """Pull every BambooHR record kind into `stage`, skipping kinds a resumed run already staged.
+
+    A kind whose pull fails keeps what it staged; --resume pulls it again and dedupes.
+    """
+    BambooHR, _, _ = load_hrflow()
+    pulls = {
+        "profiles": lambda: run_profile_connector(BambooHR.pull_profile_list, "Employees", stage=stage, ledger=ledger),
+        "jobs": lambda: run_job_connector(BambooHR.pull_job_list, "Jobs", stage, ledger),
+        "applications": lambda: run_profile_connector(BambooHR.pull_application_list, "Applications", "applications",
+                                                      stage, ledger),
+    }
+    for kind, run in pulls.items():
+        if stage.is_complete(kind):
+            log.info(f"{kind}: {stage.count(kind)} already staged, skipping pull")
+            continue
+        try:
+            pulled = run()
+        except AttributeError:
+            # Older HrFlow connector versions have no job/application actions
+            pulled = []
+        if pulled is not None:
+            stage.mark_complete(kind)
+        else:
+            log.warning(f"{kind}: kept {stage.count(kind)} staged records; rerun with --resume to finish this pull")
+    return stage
+
+
+def iter_batches(checkpoint=None, stage=None, ledger=None):
+    """Yield ("profiles" | "jobs" | "applications", records) batches from the staged pull.
+
+    BambooHR has no change feed through the HrFlow connector, so with a checkpoint
+    everything is still pulled but only records whose content changed are staged.
+    """
+    stage = stage or StagingStore("bamboohr")
+    stage.checkpoint = checkpoint
+    pull(stage, ledger)
+    yield from stage.iter_batches()
 
 
 # === Send to Mock AI ===
-payload = {"profiles": employees, "jobs": jobs, "applications": applications}
+def send_to_mock_ai(stage, ledger=None):
+    log.info(f"Sending {stage.count()} records to Mock AI...")
+    analysis = mockai_upload.send_staged(stage, url=MOCK_AI_URL, ledger=ledger)
+    if analysis is None:
+        log.error("❌ Error sending data to Mock AI: every chunk failed")
+        return None
+
+    if analysis["failed_chunks"]:
+        log.warning(f"⚠️  {analysis['failed_chunks']} of {analysis['chunks']} chunks failed")
+
+    log.info(f"AI Candidate Analysis: {analysis['analyzed']} candidates across {analysis['grouped_jobs']} jobs")
+    for c in analysis["candidates"]:
+        log.debug(json.dumps(c))
+    return analysis
+
+
+def main(incremental=False, output="text", resume=False, dry_run=False):
+    log.debug(f"ACCESS_TOKEN is {'set' if os.getenv('ACCESS_TOKEN') else 'not set'}")
+
+    checkpoint = SyncCheckpoint("bamboohr") if incremental else None
+    stage = StagingStore("bamboohr", resume=resume)
+    ledger = progress.for_run("bamboohr", resume)
+    writer = RecordWriter(output)
+    for kind, records in iter_batches(checkpoint, stage, ledger):
+        writer.write(kind, records)
+
+    if checkpoint and not stage.count():
+        log.info("No changes since last sync.")
+        stage.close()
+        ledger.close()
+        writer.close()
+        return None
+
+    if dry_run:
+        log.info(f"Dry run: {stage.count()} records staged in {stage.dir}, nothing sent")
+        stage.close()
+        ledger.close()
+        writer.close()
+        return None
+
+    feature_index.update_from_stage("bamboohr", stage, full=not checkpoint)
+    analysis = send_to_mock_ai(stage, ledger)
+    stage.close()
+    ledger.close()
+    if analysis is not None:
+        if checkpoint and not analysis["failed_chunks"]:
+            checkpoint.save()
+        writer.write("candidates", analysis["candidates"])
+        writer.write("status_updates", analysis["status_updates"])
+        summary = {k: v for k, v in analysis.items() if k not in ("candidates", "status_updates")}
+        writer.result("analysis", summary, f"Analyzed {analysis['analyzed']} candidates")
+    writer.close()
+    return analysis
+
+
+def run_update_status(args):
+    ledger = progress.Ledger("bamboohr")
+    if args.path or args.retry:
+        if args.retry:
+            # Updates earlier write-backs could not apply (including replayed dead letters)
+            updates = [(e["record"]["application_id"], e["record"]["status_id"])
+                       for e in ledger.pending("write_back").values() if e.get("record")]
+            current = {}
+        else:
+            updates, current = load_status_updates(args.path)
+        report = update_application_statuses(company_subdomain, access_token, updates, current, ledger=ledger)
+        ledger.close()
+        print(json.dumps(report))
+        return 0 if all(r["result"] != "failed" for r in report) else 1
+
+    result = update_application_status(company_subdomain, access_token, args.application_id, args.status_id)
+    print(json.dumps(result))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Sync BambooHR employees, jobs and applications with Mock AI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("pull", parents=[sync_options()], help="pull, stage and send to Mock AI (default)")
+    commands.add_parser("dry-run", parents=[sync_options()], help="pull and stage without sending or saving the checkpoint")
+    update = commands.add_parser("update_status", help="write application statuses back to BambooHR")
+    update.add_argument("application_id", type=int, nargs="?")
+    update.add_argument("status_id", type=int, nargs="?")
+    update.add_argument("--from", dest="path", help="JSON list of updates, or an /analyze response with status_updates")
+    update.add_argument("--retry", action="store_true", help="retry write-backs that failed before")
+    return parser
 
-try:
-    print(f"\n Sending {len(employees) + len(jobs) + len(applications)} records to Mock AI...")
-    resp = requests.post(MOCK_AI_URL, json=payload)
-    resp.raise_for_status()
-    analysis = resp.json()
-
-    if "candidates" in analysis:
-        print("\n AI Candidate Analysis:\n")
-        for c in analysis["candidates"]:
-            print(json.dumps(c, indent=2))
-    else:
-        print("\n Full AI Response:\n", json.dumps(analysis, indent=2))
 
-except Exception as e:
-    print(f"❌ Error sending data to Mock AI: {e}")
+if __name__ == "__main__":
+    setup_logging()
+    parser = build_parser()
+    args = parse_command(parser)
 
+    if args.command == "update_status":
+        if not args.path and not args.retry and (args.application_id is None or args.status_id is None):
+            parser.error("update_status needs <application_id> <status_id>, --from FILE or --retry")
+        sys.exit(run_update_status(args))
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1 and sys.argv[1] == "update_status":
-        application_id = int(sys.argv[2])
-        status_id = int(sys.argv[3])
-
-        result = update_application_status(
-            company_subdomain,
-            access_token,
-            application_id,
-            status_id
-        )
-        print(json.dumps(result))
-        sys.exit(0)
+    with metrics.run("bamboohr"):
+        main(incremental=args.incremental, output=args.output, resume=args.resume, dry_run=args.command == "dry-run")
@@ -0,0 +1,719 @@
+"""Offline throughput benchmark for the connector pipeline, against a local stub ATS.
+
+    python3 connectors/benchmark.py [run] [--sources workable,bamboohr] [--scales 1k,10k,100k]
+                                    [--latency 0.02] [--jitter 0.01] [--throttle 0.05] [--retry-after 0]
+                                    [--modes stages,pipeline] [--analyze-url URL] [--save FILE] [--baseline FILE]
+    python3 connectors/benchmark.py fixtures --source workable --scale 10k --out fixtures/
+    python3 connectors/benchmark.py formats [--source workable] [--scale 100k]
+
+Synthetic Workable, BambooHR, Ceipal and Recruitee payloads are served by a threaded
+HTTP stub with configurable latency and injected 429s, which also answers /analyze
+unless --analyze-url points at a running ai-service.js. Each (source, scale) runs in a
+fresh process so its peak RSS is its own.
+
+"stages" times fetch, enrich, transform, stage-to-disk, upload and /analyze one after
+another; "pipeline" times Workable's streaming iter_batches + send_staged end to end;
+"partitioned" times workable_partitioned.sync with --workers processes.
+The HrFlow-backed sources need hrflow_connectors for their real pull, so their pages
+are fetched from the stub directly and normalized exactly as LocalWriter does.
+p50/p99 are per request for HTTP stages and per page for the others.
+
+"formats" times dumping and loading one staged table in every serializers format
+against the stdlib json.dump(indent=2) files the connectors used to write. Row formats
+are loaded the way the pipeline reads staged files, one record at a time; whole-file
+formats can only be loaded all at once.
+"""
+import os, re, json, time, gzip, random, shutil, logging, argparse, tempfile, threading, importlib
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from urllib.parse import parse_qs, urlencode, urlsplit
+import metrics, serializers
+from cli_output import RecordWriter, OUTPUT_MODES, parse_command, setup_logging
+
+SOURCES = ("workable", "bamboohr", "ceipal", "recruitee")
+STAGES = ("fetch", "enrich", "transform", "stage", "upload", "analyze")
+PAGE_SIZE = int(os.getenv("BENCHMARK_PAGE_SIZE", "100"))
+
+log = logging.getLogger("benchmark")
+
+WORDS = ("python java sql react kubernetes aws terraform sales marketing finance hiring analytics "
+         "leadership negotiation design figma support onboarding payroll compliance forecasting "
+         "docker linux golang excel salesforce hubspot seo content recruiting security testing "
+         "automation agile scrum product roadmap customer growth data pipelines spark tableau").split()
+TITLES = ("Account Executive", "Software Engineer", "Data Analyst", "Product Manager", "Recruiter",
+          "Marketing Manager", "DevOps Engineer", "Customer Success Manager", "Designer", "Accountant")
+DEPARTMENTS = ("Sales", "Engineering", "Product", "People", "Marketing", "Finance", "Support")
+STAGE_NAMES = ("Applied", "Phone Screen", "Assessment", "Interview", "Offer", "Hired")
+NAMES = ("Elvie", "Lennert", "Edna", "Kofi", "Mei", "Arjun", "Sofia", "Tomas", "Amara", "Yusuf", "Ines", "Noah")
+
+
+def parse_scale(value):
+    value = value.strip().lower()
+    return int(float(value[:-1]) * 1000) if value.endswith("k") else int(value)
+
+
+def scale_label(n):
+    return f"{n // 1000}k" if n % 1000 == 0 else str(n)
+
+
+def words(rng, low, high):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def timestamp(rng):
+    return f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z"
+
+
+# =================== FIXTURES ===================
+
+def workable_fixture(n, rng):
+    """Candidate listing, per-candidate details and jobs shaped like Workable's SPI v3."""
+    jobs = [{
+        "shortcode": f"J{i:06X}",
+        "code": f"REQ-{i}",
+        "title": rng.choice(TITLES),
+        "description": words(rng, 60, 120),
+        "requirements": words(rng, 20, 40),
+        "benefits": words(rng, 10, 20),
+        "employment_type": "Full-time",
+        "department": rng.choice(DEPARTMENTS),
+        "location": {"location_str": "Remote"},
+        "state": "published",
+        "url": f"https://example.workable.com/j/J{i:06X}",
+        "created_at": timestamp(rng),
+    } for i in range(max(5, n // 200))]
+
+    candidates, details = [], {}
+    for i in range(n):
+        first, last = rng.choice(NAMES), rng.choice(NAMES)
+        job = rng.choice(jobs)
+        cid = f"{i:08x}"
+        candidates.append({
+            "id": cid,
+            "name": f"{first} {last}",
+            "firstname": first,
+            "lastname": last,
+            "email": f"{first}.{last}.{i}@example.com".lower(),
+            "phone": "+15550100",
+            "headline": rng.choice(TITLES),
+            "job": {"shortcode": job["shortcode"], "title": job["title"]},
+            "stage": rng.choice(STAGE_NAMES),
+            "stage_kind": "assessment",
+            "disqualified": rng.random() < 0.1,
+            "sourced": rng.random() < 0.2,
+            "profile_url": f"https://example.workable.com/backend/candidates/{cid}",
+            "created_at": timestamp(rng),
+            "updated_at": timestamp(rng),
+        })
+        details[cid] = {
+            "resume_url": None,
+            "summary": words(rng, 30, 80),
+            "experience_entries": [{"title": rng.choice(TITLES), "company": "Acme", "summary": words(rng, 10, 30)}
+                                   for _ in range(rng.randint(1, 4))],
+            "education_entries": [{"degree": "BSc", "school": "State University", "field_of_study": rng.choice(WORDS)}],
+            "social_profiles": [],
+        }
+    return {"candidates": candidates, "details": details, "jobs": jobs}
+
+
+def hrflow_fixture(source, n, rng):
+    """Profiles, jobs and applications in the raw shapes the HrFlow normalizers accept for `source`."""
+    n_jobs = max(5, n // 200)
+    if source == "bamboohr":
+        jobs = [{"id": i, "title": {"label": rng.choice(TITLES)}, "status": {"label": "Open"},
+                 "department": {"label": rng.choice(DEPARTMENTS)}, "location": {"name": "Remote"},
+                 "employmentStatus": {"label": "Full-Time"}, "postedDate": timestamp(rng),
+                 "description": words(rng, 60, 120)} for i in range(n_jobs)]
+        profiles = [{"id": str(i), "displayName": f"{rng.choice(NAMES)} {rng.choice(NAMES)}",
+                     "firstName": rng.choice(NAMES), "lastName": rng.choice(NAMES), "workEmail": f"e{i}@example.com",
+                     "mobilePhone": "+15550100", "jobTitle": rng.choice(TITLES), "hireDate": timestamp(rng)}
+                    for i in range(n)]
+        applications = [{"id": 10 ** 7 + i, "applicant": {"id": str(i)},
+                         "job": {"id": (job := rng.randrange(n_jobs)), "title": {"label": jobs[job]["title"]["label"]}},
+                         "status": {"id": 1, "label": rng.choice(STAGE_NAMES)}, "appliedDate": timestamp(rng)}
+                        for i in range(n)]
+    elif source == "ceipal":
+        jobs = [{"reference": f"C{i}", "name": rng.choice(TITLES), "summary": words(rng, 60, 120),
+                 "location": {"text": "Remote"}, "created_at": timestamp(rng)} for i in range(n_jobs)]
+        profiles = [{"reference": f"P{i}", "info": {"full_name": f"{rng.choice(NAMES)} {rng.choice(NAMES)}",
+                                                    "email": f"p{i}@example.com", "phone": "+15550100",
+                                                    "summary": rng.choice(TITLES), "location": {"text": "Remote"}},
+                     "experiences": [{"title": rng.choice(TITLES), "company": "Acme", "description": words(rng, 10, 30)}],
+                     "educations": [{"title": "BSc", "school": "State University"}],
+                     "skills": [{"name": rng.choice(WORDS)} for _ in range(5)], "created_at": timestamp(rng)}
+                    for i in range(n)]
+        applications = [{"application_id": f"A{i}", "candidate_id": f"P{i}", "job_id": f"C{rng.randrange(n_jobs)}",
+                         "status": {"label": rng.choice(STAGE_NAMES)}, "created_at": timestamp(rng)} for i in range(n)]
+    else:
+        jobs = [{"id": 500 + i, "title": rng.choice(TITLES), "description": words(rng, 60, 120),
+                 "requirements": words(rng, 20, 40), "department": rng.choice(DEPARTMENTS), "state": "published",
+                 "created_at": timestamp(rng)} for i in range(n_jobs)]
+        profiles = [{"id": 9000 + i, "name": f"{rng.choice(NAMES)} {rng.choice(NAMES)}", "email": f"r{i}@example.com",
+                     "phone": "+15550100", "headline": rng.choice(TITLES), "text": words(rng, 30, 80),
+                     "created_at": timestamp(rng), "updated_at": timestamp(rng)} for i in range(n)]
+        applications = [{"id": 70000 + i, "candidate_id": 9000 + i, "job_id": 500 + rng.randrange(n_jobs),
+                         "stage": rng.choice(STAGE_NAMES), "created_at": timestamp(rng)} for i in range(n)]
+    return {"profiles": profiles, "jobs": jobs, "applications": applications}
+
+
+def generate(source, n, seed=0):
+    rng = random.Random(f"{source}:{n}:{seed}")
+    return workable_fixture(n, rng) if source == "workable" else hrflow_fixture(source, n, rng)
+
+
+# =================== STUB SERVER ===================
+
+def route(method, path):
+    """Which benchmark stage a request belongs to."""
+    if method == "POST":
+        return "analyze"
+    if re.search(r"/candidates/[^/]+$", path):
+        return "enrich"
+    return "fetch"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, keep-alive requests stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=None, headers=None):
+        data = json.dumps(body, separators=(",", ":")).encode() if body is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if not size:
+                    self.rfile.readline()
+                    break
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+            body = b"".join(parts)
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        server.count(route("GET", parts.path), 0)
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+        if server.throttle and random.random() < server.throttle:
+            server.count(route("GET", parts.path), 429)
+            return self.reply(429, {"error": "rate limited"}, {"Retry-After": str(server.retry_after)})
+
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        limit, offset = int(query.get("limit", PAGE_SIZE)), int(query.get("offset", 0))
+        segments = [s for s in parts.path.split("/") if s]
+
+        if segments[:2] == ["spi", "v3"] and "workable" in server.fixtures:
+            data = server.fixtures["workable"]
+            if segments[2:3] == ["candidates"] and len(segments) == 4:
+                candidate = server.by_id.get(segments[3])
+                if candidate is None:
+                    return self.reply(404, {"error": "not found"})
+                return self.reply(200, {"candidate": {**candidate, **data["details"][segments[3]]}})
+            if segments[2:3] in (["candidates"], ["jobs"]):
+                key = segments[2]
+                # Workable's per-job filter, used by workable_partitioned
+                records = server.by_job.get(query["shortcode"], []) if "shortcode" in query else data[key]
+                more = offset + limit < len(records)
+                next_url = f"{server.base_url}/spi/v3/{key}?{urlencode({**query, 'limit': limit, 'offset': offset + limit})}"
+                return self.reply(200, {key: records[offset:offset + limit], "paging": {"next": next_url if more else None}})
+
+        if len(segments) == 2 and segments[0] in server.fixtures and segments[1] in ("profiles", "jobs", "applications"):
+            records = server.fixtures[segments[0]][segments[1]]
+            more = offset + limit < len(records)
+            next_url = f"{server.base_url}/{segments[0]}/{segments[1]}?limit={limit}&offset={offset + limit}" if more else None
+            return self.reply(200, {"data": records[offset:offset + limit], "next": next_url})
+
+        self.reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        self.server.count("analyze", 0)
+        body = self.read_body()
+        if self.headers.get("Content-Type", "").startswith("application/x-ndjson"):
+            payload = defaultdict(list)
+            for line in body.splitlines():
+                if line.strip():
+                    item = json.loads(line)
+                    payload[item["type"]].append(item["record"])
+        else:
+            payload = json.loads(body)
+        # Same response shape as ai-service.js, without the per-candidate console output
+        if "group" in payload or payload.get("layout") == "grouped":
+            candidates = [{"candidate_id": app.get("profile"), "job_id": group["job_id"],
+                           "application_id": app.get("application_id"), "ai_score": app.get("ai_score")}
+                          for group in payload.get("groups") or payload.get("group") or [] for app in group["applications"]]
+        else:
+            candidates = [{"candidate_id": app.get("candidate_id"), "job_id": app.get("job_id"),
+                           "application_id": app.get("application_id"), "ai_score": app.get("ai_score")}
+                          for app in payload.get("applications", [])]
+        self.reply(200, {"analyzed": len(candidates), "candidates": candidates, "status_updates": []})
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fixtures, latency=0.0, jitter=0.0, throttle=0.0, retry_after=0):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.fixtures = fixtures
+        self.latency, self.jitter, self.throttle, self.retry_after = latency, jitter, throttle, retry_after
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.by_id, self.by_job = {}, defaultdict(list)
+        for candidate in fixtures.get("workable", {}).get("candidates", []):
+            self.by_id[candidate["id"]] = candidate
+            self.by_job[candidate["job"]["shortcode"]].append(candidate)
+
+    def count(self, name, status):
+        with self.lock:
+            self.requests[name, status] += 1
+
+    def take_counts(self):
+        """Requests per route since the last call: {route: {"requests": n, "throttled": n}}."""
+        with self.lock:
+            counts, self.requests = self.requests, Counter()
+        report = defaultdict(lambda: {"requests": 0, "throttled": 0})
+        for (name, status), n in counts.items():
+            report[name]["throttled" if status == 429 else "requests"] += n
+        return dict(report)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+# =================== MEASUREMENT ===================
+
+def peak_rss_mb():
+    return round(metrics.peak_rss_bytes() / 2 ** 20, 1)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class Timings:
+    """Wall time, record count, per-page samples and peak RSS per stage, plus per-route request latencies."""
+    def __init__(self):
+        self.stages = {}
+        self.requests = defaultdict(list)
+
+    @contextmanager
+    def stage(self, name):
+        entry = {"records": 0, "samples": []}
+        start = time.perf_counter()
+        yield entry
+        entry["seconds"] = time.perf_counter() - start
+        entry["peak_rss_mb"] = peak_rss_mb()
+        self.stages[name] = entry
+
+    def page(self, entry, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        entry["samples"].append(time.perf_counter() - start)
+        return result
+
+    def record_requests(self, http_client):
+        """Time every request http_client sends, retries included, by the stage its URL belongs to."""
+        send = http_client.request
+
+        def timed(method, url, **kwargs):
+            start = time.perf_counter()
+            try:
+                return send(method, url, **kwargs)
+            finally:
+                self.requests[route(method, urlsplit(url).path)].append((start, time.perf_counter()))
+
+        http_client.request = timed
+
+    def report(self, applications):
+        """Per-stage summary; fetch/enrich/analyze take their latencies from the requests they sent."""
+        stages = {}
+        spans = {name: samples for name, samples in self.requests.items() if samples}
+        if "analyze" in spans:
+            # The /analyze window: first chunk sent to last response received
+            self.stages["analyze"] = {
+                "records": applications,
+                "seconds": max(end for _, end in spans["analyze"]) - min(start for start, _ in spans["analyze"]),
+                "peak_rss_mb": next((self.stages[s]["peak_rss_mb"] for s in ("upload", "pipeline", "partitioned")
+                                     if s in self.stages), None),
+                "samples": [],
+            }
+        for name, entry in self.stages.items():
+            samples = [end - start for start, end in spans[name]] if name in spans else entry["samples"]
+            seconds = entry["seconds"]
+            stages[name] = {
+                "seconds": round(seconds, 3),
+                "records": entry["records"],
+                "records_per_sec": round(entry["records"] / seconds, 1) if seconds else None,
+                "p50_ms": round(percentile(samples, 50) * 1000, 2) if samples else None,
+                "p99_ms": round(percentile(samples, 99) * 1000, 2) if samples else None,
+                "peak_rss_mb": entry["peak_rss_mb"],
+            }
+        return stages
+
+
+# =================== BENCHMARK CASES ===================
+
+def pages(records, size=PAGE_SIZE):
+    for start in range(0, len(records), size):
+        yield records[start:start + size]
+
+
+def iter_stub_pages(http_client, base_url, source, kind):
+    url, params = f"{base_url}/{source}/{kind}", {"limit": PAGE_SIZE}
+    while url:
+        response = http_client.get(url, params=params)
+        if not response.ok:
+            raise RuntimeError(f"{source} {kind}: {response.status_code}")
+        body = response.json()
+        yield body["data"]
+        url, params = body.get("next"), None
+
+
+def run_stages(source, base_url, analyze_url, staging_dir, timings):
+    import http_client, mockai_upload, normalize
+    from staging import StagingStore
+
+    raw = {}
+    with timings.stage("fetch") as entry:
+        if source == "workable":
+            workable = importlib.import_module("Workable_to_mockai")
+            raw["candidates"] = [c for page in workable.iter_workable_pages("candidates", "candidates") for c in page]
+            raw["jobs"] = list(workable.iter_workable_jobs())
+        else:
+            for kind in ("profiles", "jobs", "applications"):
+                raw[kind] = [r for page in iter_stub_pages(http_client, base_url, source, kind) for r in page]
+        entry["records"] = sum(map(len, raw.values()))
+
+    if source == "workable":
+        with timings.stage("enrich") as entry:
+            url, headers = f"{workable.WORKABLE_BASE_URL}/candidates", workable.workable_headers()
+            with ThreadPoolExecutor(max_workers=workable.WORKABLE_MAX_IN_FLIGHT) as pool:
+                raw["candidates"] = list(pool.map(lambda c: workable.enrich_candidate(url, headers, c), raw["candidates"]))
+            entry["records"] = len(raw["candidates"])
+
+    normalized = defaultdict(list)
+    with timings.stage("transform") as entry:
+        if source == "workable":
+            for page in pages(raw.pop("candidates")):
+                timings.page(entry, lambda: (normalized["profiles"].extend(workable.transform_candidates_to_profiles(page)),
+                                             normalized["applications"].extend(workable.create_applications_from_candidates(page))))
+            normalized["jobs"] = list(workable.transform_jobs(raw.pop("jobs")))
+        else:
+            for kind in ("profiles", "jobs", "applications"):
+                for page in pages(raw.pop(kind)):
+                    timings.page(entry, lambda: normalized[kind].extend(
+                        normalize.normalize(item, kind, source).to_dict() for item in page))
+        entry["records"] = sum(map(len, normalized.values()))
+
+    store = StagingStore(source, staging_dir)
+    with timings.stage("stage") as entry:
+        for kind in ("profiles", "jobs", "applications"):
+            for page in pages(normalized.pop(kind)):
+                timings.page(entry, store.append, kind, page)
+        entry["records"] = store.count()
+
+    with timings.stage("upload") as entry:
+        analysis = mockai_upload.send_staged(store, url=analyze_url)
+        entry["records"] = store.count("applications")
+    store.close()
+    if analysis is None or analysis["failed_chunks"]:
+        log.warning(f"{source}: {analysis['failed_chunks'] if analysis else 'all'} upload chunks failed")
+    return store.count("applications")
+
+
+def run_pipeline(source, analyze_url, staging_dir, timings):
+    """Workable's streaming path as main() runs it: candidate pages enriched, transformed and staged as they arrive."""
+    import mockai_upload
+    from staging import StagingStore
+    workable = importlib.import_module("Workable_to_mockai")
+
+    store = StagingStore(source, staging_dir)
+    with timings.stage("pipeline") as entry:
+        for kind, records in workable.iter_batches(None, store):
+            entry["records"] += len(records)
+        mockai_upload.send_staged(store, url=analyze_url)
+    store.close()
+    return store.count("applications")
+
+
+def run_partitioned(analyze_url, staging_dir, timings, workers):
+    """workable_partitioned.sync; shard workers are separate processes, so only their requests' counts are known."""
+    partitioned = importlib.import_module("workable_partitioned")
+    partitioned.workable.MOCK_AI_URL = analyze_url
+    with timings.stage("partitioned") as entry:
+        analysis, _ = partitioned.sync(workers, staging_dir=staging_dir)
+        entry["records"] = analysis["analyzed"] if analysis else 0
+    return entry["records"]
+
+
+def run_case(source, mode, base_url, analyze_url, verbose=False, rate_limit=0, workers=None):
+    """Benchmark one source in this (fresh) process; returns {"stages": ..., "peak_rss_mb": ...}."""
+    # Retry warnings for injected 429s would drown the report
+    setup_logging(level="INFO" if verbose else "ERROR")
+    # Read at import: fixtures carry no resumes, and cached responses would turn fetches into disk reads
+    os.environ.update(WORKABLE_BASE_URL=f"{base_url}/spi/v3", HTTP_CACHE="0", RESUME_PIPELINE="0")
+    import http_client
+    # The stub is not a listed host, so it is only throttled when asked to; partitioned runs always need a budget
+    if rate_limit or mode == "partitioned":
+        http_client.set_rate_limit(urlsplit(base_url).hostname, rate_limit or 1e9, max(1, int(rate_limit or 1e9)))
+
+    timings = Timings()
+    timings.record_requests(http_client)
+    staging_dir = tempfile.mkdtemp(prefix="benchmark-")
+    try:
+        if mode == "pipeline":
+            applications = run_pipeline(source, analyze_url, staging_dir, timings)
+        elif mode == "partitioned":
+            applications = run_partitioned(analyze_url, staging_dir, timings, workers or os.cpu_count())
+        else:
+            applications = run_stages(source, base_url, analyze_url, staging_dir, timings)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return {"stages": timings.report(applications), "peak_rss_mb": peak_rss_mb()}
+
+
+def benchmark(sources, scales, modes, latency=0.0, jitter=0.0, throttle=0.0, retry_after=0, analyze_url=None,
+              seed=0, verbose=False, rate_limit=0, workers=None):
+    results = []
+    # spawn, not fork: a forked child would start out holding the parent's fixtures
+    context = get_context("spawn")
+    for n in scales:
+        fixtures = {source: generate(source, n, seed) for source in sources}
+        server = StubServer(fixtures, latency, jitter, throttle, retry_after).start()
+        try:
+            for source in sources:
+                for mode in modes:
+                    if mode in ("pipeline", "partitioned") and source != "workable":
+                        continue
+                    log.info(f"⏱️  {source} {scale_label(n)} ({mode})...")
+                    server.take_counts()
+                    start = time.perf_counter()
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                        case = pool.submit(run_case, source, mode, server.base_url, analyze_url or f"{server.base_url}/analyze",
+                                           verbose, rate_limit, workers).result()
+                    counts = server.take_counts()
+                    for name, stage in case["stages"].items():
+                        if name in ("pipeline", "partitioned"):
+                            stage.update({key: sum(c[key] for c in counts.values()) for key in ("requests", "throttled")})
+                        else:
+                            stage.update(counts.get("analyze" if name == "upload" else name, {}))
+                    results.append({"source": source, "scale": n, "mode": mode,
+                                    "seconds": round(time.perf_counter() - start, 3), **case})
+        finally:
+            server.shutdown()
+            server.server_close()
+    return results
+
+
+# =================== REPORTING ===================
+
+def case_key(result):
+    return f"{result['source']}:{result['scale']}:{result['mode']}"
+
+
+def compare(results, baseline):
+    """Attach the change in records/sec against a previous run's results to every stage."""
+    previous = {case_key(r): r for r in baseline}
+    for result in results:
+        before = previous.get(case_key(result))
+        if not before:
+            continue
+        for name, stage in result["stages"].items():
+            old = before["stages"].get(name, {}).get("records_per_sec")
+            if old and stage["records_per_sec"]:
+                stage["change_pct"] = round(100 * (stage["records_per_sec"] / old - 1), 1)
+
+
+def format_table(results):
+    columns = (("stage", 10), ("seconds", 9), ("records/s", 11), ("p50 ms", 9), ("p99 ms", 9),
+               ("requests", 9), ("429s", 6), ("RSS MB", 8), ("vs base", 8))
+    lines = []
+    for result in results:
+        lines.append(f"\n{result['source']} {scale_label(result['scale'])} ({result['mode']}), "
+                     f"peak RSS {result['peak_rss_mb']} MB")
+        lines.append("  " + "".join(name.rjust(width) if i else name.ljust(width) for i, (name, width) in enumerate(columns)))
+        order = [s for s in ("pipeline", "partitioned") + STAGES if s in result["stages"]]
+        for name in order:
+            stage = result["stages"][name]
+            values = (name, stage["seconds"], stage["records_per_sec"], stage["p50_ms"], stage["p99_ms"],
+                      stage.get("requests"), stage.get("throttled"), stage["peak_rss_mb"],
+                      f"{stage['change_pct']:+.1f}%" if "change_pct" in stage else None)
+            lines.append("  " + "".join(("-" if v is None else str(v)).rjust(width) if i else str(v).ljust(width)
+                                        for i, (v, (_, width)) in enumerate(zip(values, columns))))
+    return "\n".join(lines)
+
+
+# =================== SERIALIZERS ===================
+
+def staged_table(source, n, seed=0):
+    """The profiles table as staged: Workable candidates merged with their details, else raw profiles."""
+    data = generate(source, n, seed)
+    if source == "workable":
+        return [{**c, **data["details"][c["id"]]} for c in data["candidates"]]
+    return data["profiles"]
+
+
+def _stdlib_json(path, records):
+    with open(path, "w") as f:
+        json.dump(records, f, indent=2)
+
+
+def _stdlib_ndjson(path, records):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+
+
+def _load_stdlib_ndjson(path):
+    with open(path) as f:
+        return sum(1 for line in f if json.loads(line))
+
+
+def bench_formats(source, n, seed=0):
+    records = staged_table(source, n, seed)
+    cases = [("json indent=2 (stdlib)", ".json", _stdlib_json, lambda path: len(json.load(open(path)))),
+             ("ndjson (stdlib)", ".ndjson", _stdlib_ndjson, _load_stdlib_ndjson)]
+    for fmt in list(serializers.ROW_FORMATS) + list(serializers.TABLE_FORMATS):
+        name = f"{fmt} ({serializers.JSON_BACKEND})" if fmt in ("ndjson", "json") else fmt
+        extension = serializers.ROW_FORMATS[fmt].extension if fmt in serializers.ROW_FORMATS else serializers.TABLE_FORMATS[fmt]
+        cases.append((name, extension, lambda path, records, fmt=fmt: serializers.dump_records(records, path, fmt),
+                      lambda path, fmt=fmt: sum(1 for _ in serializers.load_records(path, fmt)), fmt))
+
+    results, directory = [], tempfile.mkdtemp(prefix="benchmark-formats-")
+    try:
+        for name, extension, dump, load, *fmt in cases:
+            missing = fmt and serializers.missing_dependency(fmt[0])
+            if missing:
+                results.append({"format": name, "skipped": f"pip install {missing}"})
+                continue
+            path = os.path.join(directory, f"{len(results)}{extension}")
+            start = time.perf_counter()
+            dump(path, records)
+            dumped = time.perf_counter()
+            loaded = load(path)
+            done = time.perf_counter()
+            assert loaded == len(records), name
+            results.append({"format": name, "records": len(records), "dump_seconds": round(dumped - start, 3),
+                            "load_seconds": round(done - dumped, 3), "size_mb": round(os.path.getsize(path) / 2 ** 20, 2)})
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {"source": source, "records": len(records), "formats": results}
+
+
+def format_formats(results):
+    base = results["formats"][0]
+    lines = [f"{results['source']} profiles, {results['records']} records",
+             f"  {'format':<26}{'dump s':>9}{'load s':>9}{'MB':>9}{'dump x':>8}{'load x':>8}{'size x':>8}"]
+    for r in results["formats"]:
+        if "skipped" in r:
+            lines.append(f"  {r['format']:<26}  skipped: {r['skipped']}")
+            continue
+        ratios = [base[k] / r[k] if r[k] else 0 for k in ("dump_seconds", "load_seconds", "size_mb")]
+        lines.append(f"  {r['format']:<26}{r['dump_seconds']:>9}{r['load_seconds']:>9}{r['size_mb']:>9}"
+                     + "".join(f"{x:>8.1f}" for x in ratios))
+    return "\n".join(lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the connector pipeline against a local stub ATS.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmark (default)")
+    run.add_argument("--sources", default=",".join(SOURCES))
+    run.add_argument("--scales", default="1k,10k", help="comma-separated record counts, e.g. 1k,10k,100k")
+    run.add_argument("--modes", default="stages,pipeline", help="stages, pipeline and/or partitioned (the last two Workable only)")
+    run.add_argument("--workers", type=int, help="processes for the partitioned mode (default: one per core)")
+    run.add_argument("--rate-limit", type=float, default=0, help="requests/sec budget towards the stub (default unlimited)")
+    run.add_argument("--latency", type=float, default=0.0, help="seconds the stub waits before each GET")
+    run.add_argument("--jitter", type=float, default=0.0, help="extra random latency, up to this many seconds")
+    run.add_argument("--throttle", type=float, default=0.0, help="fraction of GETs answered with 429")
+    run.add_argument("--retry-after", type=int, default=0, help="Retry-After sent with injected 429s")
+    run.add_argument("--analyze-url", help="time a running ai-service.js instead of the stub's /analyze")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--save", help="write the results as JSON to this file")
+    run.add_argument("--baseline", help="compare records/sec with results saved by an earlier --save")
+    run.add_argument("--output", choices=OUTPUT_MODES, default="text")
+    run.add_argument("--verbose", action="store_true", help="keep connector logs from the benchmarked runs")
+
+    fixtures = commands.add_parser("fixtures", help="write synthetic payloads to disk")
+    fixtures.add_argument("--source", choices=SOURCES, required=True)
+    fixtures.add_argument("--scale", default="1k")
+    fixtures.add_argument("--seed", type=int, default=0)
+    fixtures.add_argument("--out", default=".")
+
+    formats = commands.add_parser("formats", help="time dump/load and size of one staged table per serializer")
+    formats.add_argument("--source", choices=SOURCES, default="workable")
+    formats.add_argument("--scale", default="100k")
+    formats.add_argument("--seed", type=int, default=0)
+    formats.add_argument("--output", choices=OUTPUT_MODES, default="text")
+    return parser
+
+
+def main(argv=None):
+    args = parse_command(build_parser(), argv, default="run")
+
+    if args.command == "fixtures":
+        n = parse_scale(args.scale)
+        os.makedirs(args.out, exist_ok=True)
+        path = os.path.join(args.out, f"{args.source}-{scale_label(n)}.json")
+        with open(path, "w") as f:
+            json.dump(generate(args.source, n, args.seed), f)
+        log.info(f"Wrote {path}")
+        return path
+
+    if args.command == "formats":
+        results = bench_formats(args.source, parse_scale(args.scale), args.seed)
+        writer = RecordWriter(args.output)
+        writer.result("formats", results, format_formats(results))
+        writer.close()
+        return results
+
+    sources = args.sources.split(",")
+    unknown = [source for source in sources if source not in SOURCES]
+    if unknown:
+        raise SystemExit(f"Unknown sources {unknown}; expected some of {list(SOURCES)}")
+    results = benchmark(sources, [parse_scale(s) for s in args.scales.split(",")], args.modes.split(","),
+                        args.latency, args.jitter, args.throttle, args.retry_after, args.analyze_url,
+                        args.seed, args.verbose, args.rate_limit, args.workers)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    writer = RecordWriter(args.output)
+    writer.result("benchmark", results, format_table(results))
+    writer.close()
+    return results
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
@@ -1,86 +1,125 @@
-import sys, os, json, requests
-from collections.abc import Iterable
+import sys, os, logging, argparse
 
 # === Ensure hrflow-connectors is in Python path ===
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "hrflow-connectors/src")))
 
-from hrflow_connectors.v1.connectors.ceipal.connector import Ceipal
-from hrflow_connectors.v1.connectors.hrflow.warehouse import HrFlowProfileWarehouse
-
-_collected_profiles = []
-
-class LocalWriter:
-    """Intercepts HrFlow writes and saves data locally instead."""
-    def parameters(self, **kwargs):
-        return self
-
-    def __call__(self, profiles, *args, **kwargs):
-        global _collected_profiles
-        print(f"\n LocalWriter.__call__ invoked with {len(profiles) if isinstance(profiles, list) else 1} profiles")
-
-        simplified = []
-        for p in profiles if isinstance(profiles, Iterable) else [profiles]:
-            if hasattr(p, "to_dict"):
-                simplified.append(p.to_dict())
-            elif isinstance(p, dict):
-                simplified.append(p)
-            elif hasattr(p, "__dict__"):
-                simplified.append({
-                    k: str(v)
-                    for k, v in p.__dict__.items()
-                    if not k.startswith("_")
-                })
-            else:
-                simplified.append(str(p))
-
-        _collected_profiles.extend(simplified)
-        print(f"Added {len(simplified)} profiles (total collected: {len(_collected_profiles)})")
-        return simplified
-
-HrFlowProfileWarehouse.write = LocalWriter()
+import http_client, mockai_upload, feature_index, metrics, serializers
+from sync_state import SyncCheckpoint
+from staging import StagingStore
+from normalize import LocalWriter
+from cli_output import RecordWriter, parse_command, setup_logging, sync_options
 
-# === Run the Ceipal connector ===
-print("⚙️ Fetching profiles from Ceipal...")
-
-result = Ceipal.pull_profile_list(
-    workflow_id="ceipal_to_mockai_local",
-    action_parameters={"read_mode": "sync"},
-    origin_parameters={
-        "ceipal_endpoint": "PRODUCTION",
-        "api_token": "dfea852be3bdfff393986cd7994e28da98f26f984b32f1962112238017d8635d",
-        "limit": 10,
-    },
-    target_parameters={
-        "api_secret": "dummy",
-        "api_user": "dummy@example.com",
-        "source_key": "dummy_key",
-        "only_edit_fields": [],
-    },
-    connector_name="Ceipal",
-)
-
-print(f"Finished Ceipal pull — {len(_collected_profiles)} profiles collected.")
+log = logging.getLogger("ceipal")
+
+_writer = LocalWriter("ceipal")
 
 MOCK_AI_URL = "http://localhost:3002/analyze"
 
-if not _collected_profiles:
-    print("⚠️  No profiles collected — check Ceipal credentials or endpoint.")
-else:
-    try:
-        with open("ceipal_profiles.json", "w") as f:
-            json.dump(_collected_profiles, f, indent=2)
-        print(f" Saved {len(_collected_profiles)} profiles to ceipal_profiles.json")
-    except Exception as e:
-        print("Failed to save profiles:", e)
+
+# === Run the Ceipal connector ===
+def pull(stage):
+    """Stream the Ceipal profiles into `stage`; a resumed run that already staged them skips the pull."""
+    if stage.is_complete("profiles"):
+        log.info(f"{stage.count('profiles')} Ceipal profiles already staged, skipping pull")
+        return stage
+
+    # The HrFlow connector tree is slow to import, so only a pull pays for it
+    from hrflow_connectors.v1.connectors.ceipal.connector import Ceipal
+    from hrflow_connectors.v1.connectors.hrflow.warehouse import HrFlowProfileWarehouse
+    HrFlowProfileWarehouse.write = _writer
+
+    log.info("⚙️ Fetching profiles from Ceipal...")
+    _writer.clear()
+    _writer.stage = stage
 
     try:
-        print(f" Sending {len(_collected_profiles)} profiles to Mock AI …")
-        resp = requests.post(MOCK_AI_URL, json={"profiles": _collected_profiles})
-        print("Mock AI response:", resp.status_code)
-        print(resp.text[:400])
-
-        with open("analyzed_profiles.json", "w") as f:
-            f.write(resp.text)
-        print(" Saved analyzed results to analyzed_profiles.json")
-    except Exception as e:
-        print("Could not reach Mock AI:", e)
+        with http_client.route_requests():
+            Ceipal.pull_profile_list(
+                workflow_id="ceipal_to_mockai_local",
+                action_parameters={"read_mode": "sync"},
+                origin_parameters={
+                    "ceipal_endpoint": "PRODUCTION",
+                    "api_token": "dfea852be3bdfff393986cd7994e28da98f26f984b32f1962112238017d8635d",
+                    "limit": 10,
+                },
+                target_parameters={
+                    "api_secret": "dummy",
+                    "api_user": "dummy@example.com",
+                    "source_key": "dummy_key",
+                    "only_edit_fields": [],
+                },
+                connector_name="Ceipal",
+            )
+    finally:
+        _writer.stage = None
+    stage.mark_complete("profiles")
+
+    log.info(f"Finished Ceipal pull — {stage.count('profiles')} profiles staged.")
+    return stage
+
+
+def iter_batches(checkpoint=None, stage=None):
+    """Yield ("profiles", records) batches from the staged pull, staging only changed profiles when a checkpoint is given."""
+    stage = stage or StagingStore("ceipal")
+    stage.checkpoint = checkpoint
+    pull(stage)
+    yield from stage.iter_batches(["profiles"])
+
+
+def main(incremental=False, output="text", resume=False, dry_run=False):
+    # Ceipal is pulled in full through the HrFlow connector; incremental runs
+    # forward only the profiles whose content changed since the last run
+    checkpoint = SyncCheckpoint("ceipal") if incremental else None
+    stage = StagingStore("ceipal", resume=resume)
+    writer = RecordWriter(output)
+    for kind, records in iter_batches(checkpoint, stage):
+        writer.write(kind, records)
+
+    if not stage.count("profiles"):
+        if checkpoint:
+            log.info("No changes since last sync.")
+        else:
+            log.warning("⚠️  No profiles collected — check Ceipal credentials or endpoint.")
+        writer.close()
+        return
+    log.info(f"Staged {stage.count('profiles')} profiles in {stage.path('profiles')}")
+    if dry_run:
+        log.info("Dry run: nothing sent")
+        stage.close()
+        writer.close()
+        return
+
+    log.info(f"Sending {stage.count('profiles')} profiles to Mock AI …")
+    feature_index.update_from_stage("ceipal", stage, full=not checkpoint)
+    analysis = mockai_upload.send_staged(stage, url=MOCK_AI_URL)
+    stage.close()
+    if analysis is None:
+        log.error("Could not reach Mock AI")
+        writer.close()
+        return
+
+    log.info(f"Mock AI analyzed {analysis['analyzed']} candidates ({analysis['failed_chunks']} failed chunks)")
+    serializers.write_json("analyzed_profiles.json", analysis)
+    log.info("Saved analyzed results to analyzed_profiles.json")
+    if checkpoint and not analysis["failed_chunks"]:
+        checkpoint.save()
+
+    writer.write("candidates", analysis["candidates"])
+    summary = {k: v for k, v in analysis.items() if k not in ("candidates", "status_updates")}
+    writer.result("analysis", summary, f"Analyzed {analysis['analyzed']} candidates")
+    writer.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Sync Ceipal profiles with Mock AI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("pull", parents=[sync_options()], help="pull, stage and send to Mock AI (default)")
+    commands.add_parser("dry-run", parents=[sync_options()], help="pull and stage without sending or saving the checkpoint")
+    return parser
+
+
+if __name__ == "__main__":
+    setup_logging()
+    args = parse_command(build_parser())
+    with metrics.run("ceipal"):
+        main(incremental=args.incremental, output=args.output, resume=args.resume, dry_run=args.command == "dry-run")
@@ -0,0 +1,93 @@
+import os, sys, json, logging, argparse
+
+LOG_LEVEL = os.getenv("CONNECTOR_LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("CONNECTOR_LOG_FORMAT", "text")
+
+OUTPUT_MODES = ("text", "json", "ndjson")
+
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name, "msg": record.getMessage()}
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """Send every connector log line to stderr, leaving stdout for records."""
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonLogFormatter() if fmt == "json" else logging.Formatter("%(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+def option(argv, name, default=None):
+    """Read `--name value` or `--name=value` from argv."""
+    for i, arg in enumerate(argv):
+        if arg == name and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith(name + "="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+def output_mode(argv):
+    mode = option(argv, "--output", "text")
+    if mode not in OUTPUT_MODES:
+        raise SystemExit(f"--output must be one of {', '.join(OUTPUT_MODES)}")
+    return mode
+
+
+def sync_options():
+    """Parent parser holding the options every pull-style subcommand accepts."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--incremental", action="store_true", help="only forward records changed since the last successful sync")
+    parser.add_argument("--resume", action="store_true", help="keep what an interrupted run already staged")
+    parser.add_argument("--output", choices=OUTPUT_MODES, default="text", help="what to write to stdout")
+    return parser
+
+
+def parse_command(parser, argv=None, default="pull"):
+    """Parse argv, running `default` when no subcommand is given so `script.py --incremental` keeps working."""
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or (argv[0].startswith("-") and argv[0] not in ("-h", "--help")):
+        argv.insert(0, default)
+    return parser.parse_args(argv)
+
+
+class RecordWriter:
+    """Writes results to stdout in the requested mode.
+
+    ndjson streams one compact {"type": ..., "record": ...} line per record as it is written;
+    json emits a single compact document on close; text writes nothing but the summary.
+    """
+    def __init__(self, mode="text", stream=None):
+        self.mode = mode
+        self.stream = stream or sys.stdout
+        self.document = {}
+
+    def write(self, kind, records):
+        if self.mode == "ndjson":
+            for record in records:
+                self.stream.write(json.dumps({"type": kind, "record": record}, separators=(",", ":"), default=str) + "\n")
+            self.stream.flush()
+        elif self.mode == "json":
+            self.document.setdefault(kind, []).extend(records)
+
+    def result(self, kind, value, summary=None):
+        """Write a single result object; in text mode only `summary` is printed."""
+        if self.mode == "text":
+            if summary:
+                self.stream.write(summary + "\n")
+        elif self.mode == "ndjson":
+            self.write(kind, [value])
+        else:
+            self.document[kind] = value
+
+    def close(self):
+        if self.mode == "json":
+            json.dump(self.document, self.stream, separators=(",", ":"), default=str)
+            self.stream.write("\n")
+        self.stream.flush()
@@ -0,0 +1,141 @@
+"""Long-lived connector worker speaking newline-delimited JSON-RPC on stdin/stdout.
+
+Requests:  {"id": 1, "method": "pull", "params": {"source": "workable", "mode": "incremental"}}
+Streamed:  {"id": 1, "event": "batch", "kind": "profiles", "records": [...]}
+Final:     {"id": 1, "result": {...}}  or  {"id": 1, "error": "...", "type": "NotIndexed"}
+
+Connector modules, their imports and the pooled HTTP session stay loaded between
+requests, so a pull costs only its API calls. Connector logs go to stderr.
+"""
+import os, sys, json, shutil, threading, importlib, traceback
+from concurrent.futures import ThreadPoolExecutor
+from sync_state import SyncCheckpoint
+from staging import STAGING_DIR, StagingStore
+import mockai_upload, feature_index, metrics, progress
+from cli_output import setup_logging
+
+SOURCES = {
+    "workable": "Workable_to_mockai",
+    "bamboohr": "bamboohr_to_mockai_local",
+    "ceipal": "ceipal_to_mockai_local",
+    "recruitee": "recruitee_to_mockai",
+}
+
+# These all patch the same HrFlow warehouse class, so only one may pull at a time
+HRFLOW_SOURCES = {"bamboohr", "ceipal", "recruitee"}
+_hrflow_lock = threading.Lock()
+
+_out = sys.stdout
+_out_lock = threading.Lock()
+
+
+def send(message):
+    line = json.dumps(message, separators=(",", ":"), default=str)
+    with _out_lock:
+        _out.write(line + "\n")
+        _out.flush()
+
+
+def load_source(source):
+    if source not in SOURCES:
+        raise ValueError(f"Unknown source {source!r}; expected one of {sorted(SOURCES)}")
+    return importlib.import_module(SOURCES[source])
+
+
+def pull(request_id, source, mode="full", analyze=False):
+    module = load_source(source)
+    checkpoint = SyncCheckpoint(source) if mode == "incremental" else None
+    # Each request stages under its own directory so concurrent pulls never share files
+    stage = StagingStore(source, staging_dir=os.path.join(STAGING_DIR, "worker", str(request_id)))
+    counts = {"profiles": 0, "jobs": 0, "applications": 0}
+
+    try:
+        lock = _hrflow_lock if source in HRFLOW_SOURCES else threading.Lock()
+        with lock, metrics.span("pull", source=source):
+            for kind, records in module.iter_batches(checkpoint, stage):
+                counts[kind] += len(records)
+                send({"id": request_id, "event": "batch", "source": source, "kind": kind, "records": records})
+        feature_index.update_from_stage(source, stage, full=not checkpoint)
+
+        result = {"source": source, "mode": mode, "counts": counts}
+        if analyze and stage.count():
+            analysis = mockai_upload.send_staged(stage, url=module.MOCK_AI_URL)
+            result["analysis"] = analysis
+            if analysis is None or analysis["failed_chunks"]:
+                return result
+    finally:
+        stage.close()
+        shutil.rmtree(stage.dir, ignore_errors=True)
+
+    if checkpoint:
+        checkpoint.save()
+    return result
+
+
+def update_status(request_id, updates, current_statuses=None):
+    bamboohr = load_source("bamboohr")
+    pairs = [(u["application_id"], u["status_id"]) for u in updates]
+    current = dict(current_statuses or {})
+    current.update({u["application_id"]: u["current_status_id"] for u in updates if u.get("current_status_id") is not None})
+    ledger = progress.Ledger("bamboohr")
+    try:
+        return bamboohr.update_application_statuses(bamboohr.company_subdomain, bamboohr.access_token, pairs, current,
+                                                    ledger=ledger)
+    finally:
+        ledger.close()
+
+
+def top_candidates(request_id, source, job_id, k=10):
+    if source not in SOURCES:
+        raise feature_index.NotIndexed(f"Unknown source {source!r}; expected one of {sorted(SOURCES)}")
+    return {"source": source, "job_id": job_id, "candidates": feature_index.top_candidates(source, job_id, k)}
+
+
+def metrics_text(request_id):
+    """Cumulative metrics for every request this worker has served, in Prometheus text format."""
+    if not metrics.METRICS:
+        raise ValueError("Metrics are off; start the service with CONNECTOR_METRICS=1")
+    return {"text": metrics.prometheus_text()}
+
+
+METHODS = {
+    "ping": lambda request_id: {"ok": True, "loaded": sorted(s for s, m in SOURCES.items() if m in sys.modules)},
+    "pull": pull,
+    "update_status": update_status,
+    "top_candidates": top_candidates,
+    "metrics": metrics_text,
+}
+
+
+def handle(request):
+    request_id = request.get("id")
+    try:
+        method = METHODS.get(request.get("method"))
+        if method is None:
+            raise ValueError(f"Unknown method {request.get('method')!r}")
+        send({"id": request_id, "result": method(request_id, **request.get("params", {}))})
+    except Exception as e:
+        traceback.print_exc()
+        send({"id": request_id, "error": f"{e.__class__.__name__}: {e}", "type": e.__class__.__name__})
+
+
+def main():
+    # Logs already go to stderr; stray prints must not corrupt the protocol stream either
+    setup_logging()
+    sys.stdout = sys.stderr
+    metrics.start_sampler()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                send({"id": None, "error": f"Invalid JSON: {e}"})
+                continue
+            pool.submit(handle, request)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""Cross-source candidate deduplication: one canonical person per human, linked to each ATS record.
+
+    python3 connectors/dedupe.py connectors/workable_data.json --key profiles [--out people.json]
+
+Profiles are indexed under blocking keys (normalized email, E.164 phone, and two
+name keys: last name + first initial, first name + last initial), and only profiles
+sharing a key are compared, so matching stays near-linear instead of all-pairs:
+
+- the same email is the same person;
+- the same phone is the same person when the names are also similar
+  (DEDUPE_NAME_THRESHOLD), since ATS exports often share a placeholder number;
+- similar names alone (DEDUPE_STRICT_NAME_THRESHOLD) match only when neither the
+  emails nor the phones contradict it.
+
+Matches are joined with union-find. Every cluster of two or more profiles becomes one
+canonical profile with a "person:" id, filled from its most recently updated record
+first, with `links` to every source record. A key shared by more than DEDUPE_MAX_BLOCK
+profiles (a placeholder phone, a common name) only links identical names, and only
+when nothing contradicts them.
+The phonenumbers package parses phones when it is installed; otherwise numbers
+without a country code are read as DEDUPE_COUNTRY_CODE ones.
+"""
+import os, re, json, hashlib, logging, argparse, unicodedata
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+import metrics, serializers
+from join_index import PERSON_PREFIX, application_profile_key, canonical_id, profile_key
+from sync_state import record_id
+
+try:
+    import phonenumbers
+except ImportError:
+    phonenumbers = None
+
+DEDUPE_NAME_THRESHOLD = float(os.getenv("DEDUPE_NAME_THRESHOLD", "0.85"))
+DEDUPE_STRICT_NAME_THRESHOLD = float(os.getenv("DEDUPE_STRICT_NAME_THRESHOLD", "0.95"))
+DEDUPE_MAX_BLOCK = int(os.getenv("DEDUPE_MAX_BLOCK", "100"))
+DEDUPE_COUNTRY_CODE = os.getenv("DEDUPE_COUNTRY_CODE", "1")
+
+log = logging.getLogger("dedupe")
+
+
+# =================== NORMALIZATION ===================
+
+def normalize_email(email):
+    if not email or "@" not in str(email):
+        return None
+    local, _, domain = str(email).strip().casefold().rpartition("@")
+    local = local.split("+", 1)[0]
+    if domain in ("gmail.com", "googlemail.com"):
+        local, domain = local.replace(".", ""), "gmail.com"
+    return f"{local}@{domain}" if local and domain else None
+
+
+def normalize_phone(phone, country_code=DEDUPE_COUNTRY_CODE):
+    """E.164 form of a phone number ("+18579909675"), or None when it cannot be read as one."""
+    if not phone:
+        return None
+    raw = re.split(r"(?i)\s*(?:ext\.?|x|#)\s*\d+$", str(phone).strip())[0]
+    if phonenumbers is not None:
+        try:
+            region = phonenumbers.region_code_for_country_code(int(country_code))
+            number = phonenumbers.parse(raw, region)
+        except (phonenumbers.NumberParseException, ValueError):
+            return None
+        if not phonenumbers.is_possible_number(number):
+            return None
+        return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+    digits = re.sub(r"\D", "", raw)
+    if raw.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif digits.startswith("0"):
+        # National trunk prefix
+        digits = country_code + digits[1:]
+    elif not (digits.startswith(country_code) and len(digits) > 10):
+        digits = country_code + digits
+    return f"+{digits}" if 8 <= len(digits) <= 15 else None
+
+
+def normalize_name(profile):
+    """Case- and accent-folded name tokens, e.g. ("jose", "garcia")."""
+    name = profile.get("name") or " ".join(filter(None, (profile.get("first_name"), profile.get("last_name"))))
+    name = unicodedata.normalize("NFKD", str(name or "")).encode("ascii", "ignore").decode().casefold()
+    return tuple(re.findall(r"[a-z]+", name))
+
+
+def name_similarity(a, b):
+    """0..1; token order does not matter, so "Smith John" matches "John Smith"."""
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, " ".join(sorted(a)), " ".join(sorted(b))).ratio()
+
+
+def name_keys(tokens):
+    if len(tokens) < 2:
+        return ()
+    first, last = tokens[0], tokens[-1]
+    return (f"{last}|{first[0]}", f"{first}|{last[0]}")
+
+
+# =================== MATCHING ===================
+
+class UnionFind:
+    def __init__(self):
+        self.parent = []
+        self.size = []
+
+    def add(self):
+        self.parent.append(len(self.parent))
+        self.size.append(1)
+        return len(self.parent) - 1
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, a, b):
+        """Join the sets of a and b; returns False when they already were one."""
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return True
+
+
+class DedupeIndex:
+    """Blocking index over profiles; `clusters()` matches within blocks and returns the groups of duplicates.
+
+    Only what matching needs is kept per profile (id, name tokens, email, phone), so
+    profiles can be streamed in from disk.
+    """
+    def __init__(self, source=None):
+        self.source = source
+        self.ids = []
+        self.names = []
+        # Per cluster root: every email and phone its profiles carry
+        self.evidence = {}
+        self.blocks = {"email": defaultdict(list), "phone": defaultdict(list), "name": defaultdict(list)}
+        self.sets = UnionFind()
+        self.stats = Counter()
+
+    def add(self, profile):
+        i = self.sets.add()
+        self.ids.append(canonical_id(profile.get("source") or self.source, profile_key(profile)))
+        name, email, phone = normalize_name(profile), normalize_email(profile.get("email")), normalize_phone(profile.get("phone"))
+        self.names.append(name)
+        self.evidence[i] = ({email} - {None}, {phone} - {None})
+        if email:
+            self.blocks["email"][email].append(i)
+        if phone:
+            self.blocks["phone"][phone].append(i)
+        for key in name_keys(name):
+            self.blocks["name"][key].append(i)
+        return i
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _conflicts(self, i, j):
+        """Whether the clusters of i and j each hold emails (or phones) and none in common."""
+        (emails_i, phones_i), (emails_j, phones_j) = self.evidence[self.sets.find(i)], self.evidence[self.sets.find(j)]
+        return bool(emails_i and emails_j and emails_i.isdisjoint(emails_j)
+                    or phones_i and phones_j and phones_i.isdisjoint(phones_j))
+
+    def _union(self, i, j):
+        a, b = self.sets.find(i), self.sets.find(j)
+        if not self.sets.union(a, b):
+            return False
+        root, other = (a, b) if self.sets.find(a) == a else (b, a)
+        emails, phones = self.evidence.pop(other)
+        self.evidence[root][0].update(emails)
+        self.evidence[root][1].update(phones)
+        return True
+
+    def _link(self, rule, members, threshold, strict=False):
+        if len(members) > DEDUPE_MAX_BLOCK:
+            # Too common to mean anything alone: only identical, uncontradicted names are linked
+            self.stats[f"{rule}_oversized_blocks"] += 1
+            strict = True
+            by_name = defaultdict(list)
+            for i in members:
+                by_name[self.names[i]].append(i)
+            pairs = ((group[0], j) for name, group in by_name.items() if name for j in group[1:])
+        else:
+            pairs = ((members[a], members[b]) for a in range(len(members)) for b in range(a + 1, len(members)))
+        for i, j in pairs:
+            if self.sets.find(i) == self.sets.find(j):
+                continue
+            self.stats["comparisons"] += 1
+            if strict and self._conflicts(i, j):
+                continue
+            if name_similarity(self.names[i], self.names[j]) >= threshold and self._union(i, j):
+                self.stats[f"matched_by_{rule}"] += 1
+
+    def clusters(self):
+        """Lists of positions (in `add` order) of profiles that are the same person; singletons left out."""
+        with metrics.span("dedupe_match"):
+            for members in self.blocks["email"].values():
+                for i in members[1:]:
+                    if self._union(members[0], i):
+                        self.stats["matched_by_email"] += 1
+            for members in self.blocks["phone"].values():
+                if len(members) > 1:
+                    self._link("phone", members, DEDUPE_NAME_THRESHOLD)
+            for members in self.blocks["name"].values():
+                if len(members) > 1:
+                    self._link("name", members, DEDUPE_STRICT_NAME_THRESHOLD, strict=True)
+            groups = defaultdict(list)
+            for i in range(len(self)):
+                groups[self.sets.find(i)].append(i)
+        return [members for members in groups.values() if len(members) > 1]
+
+
+# =================== MERGING ===================
+
+def person_id(member_ids):
+    """Stable while the cluster keeps its smallest member."""
+    return PERSON_PREFIX + hashlib.sha1(min(member_ids).encode()).hexdigest()[:16]
+
+
+def recency(profile):
+    return profile.get("updated_at") or profile.get("created_at") or ""
+
+
+def merge_cluster(profiles, member_ids):
+    """One canonical profile from duplicates: the most recent record's values, gaps filled from the others."""
+    ordered = sorted(zip(profiles, member_ids), key=lambda pair: recency(pair[0]), reverse=True)
+    merged = {}
+    for profile, _ in ordered:
+        for key, value in profile.items():
+            if value in (None, "", []) or (key in merged and merged[key] not in (None, "", [])):
+                continue
+            merged[key] = value
+    merged["id"] = person_id(member_ids)
+    merged["links"] = [{"source": profile.get("source"), "id": mid} for profile, mid in ordered]
+    merged["sources"] = sorted({profile.get("source") for profile, _ in ordered if profile.get("source")})
+    for field, normalizer in (("email", normalize_email), ("phone", normalize_phone)):
+        values = {}
+        for profile, _ in ordered:
+            if profile.get(field):
+                values.setdefault(normalizer(profile[field]) or profile[field], profile[field])
+        if len(values) > 1:
+            merged[f"{field}s"] = list(values.values())
+    for key in ("candidate_id", "employee_id", "ProfileID"):
+        merged.pop(key, None)
+    return merged
+
+
+def dedupe_profiles(profiles, source=None):
+    """In-memory dedupe; returns (canonical profiles, {member id: person id}, stats)."""
+    profiles = list(profiles)
+    index = DedupeIndex(source)
+    for profile in profiles:
+        index.add(profile)
+    clustered, mapping = {}, {}
+    for members in index.clusters():
+        ids = [index.ids[i] for i in members]
+        merged = merge_cluster([profiles[i] for i in members], ids)
+        mapping.update((mid, merged["id"]) for mid in ids)
+        clustered[members[0]] = merged
+        clustered.update((i, None) for i in members[1:])
+    out = [clustered.get(i, profile) for i, profile in enumerate(profiles) if clustered.get(i, profile) is not None]
+    return out, mapping, summarize(index, len(out))
+
+
+def summarize(index, people):
+    stats = {"profiles": len(index), "people": people, "duplicates": len(index) - people, **index.stats}
+    stats["comparisons"] = index.stats["comparisons"]
+    return stats
+
+
+def dedupe_stage(stage, staging_dir, name="deduped", key=record_id):
+    """Write `stage` deduplicated to a new StagingStore: canonical profiles, and applications pointing at them.
+
+    Profiles are matched in one pass over the stage and merged in a second, holding only
+    the duplicates in memory. An application's candidate id is replaced by its person
+    id (the original stays in `source_candidate_id`), and when one person applied to the
+    same job more than once only the first application is kept, listing the others'
+    BambooHR application ids in `duplicate_application_ids` so /analyze writes their
+    status back too. Records are told apart by `key`. Returns (new stage, stats).
+    """
+    from staging import StagingStore
+    with metrics.span("dedupe", source=stage.source):
+        index = DedupeIndex(stage.source)
+        for profile in stage.iter("profiles"):
+            index.add(profile)
+        clusters = index.clusters()
+        member_of, mapping = {}, {}
+        for members in clusters:
+            pid = person_id([index.ids[i] for i in members])
+            for i in members:
+                member_of[i] = pid
+                mapping[index.ids[i]] = pid
+
+        out = StagingStore(name, staging_dir, key=key)
+        buffered = defaultdict(list)
+        for i, profile in enumerate(stage.iter("profiles")):
+            if i in member_of:
+                buffered[member_of[i]].append((profile, index.ids[i]))
+            else:
+                out.append("profiles", [profile])
+        out.append("profiles", (merge_cluster(*zip(*buffered[pid])) for pid in buffered))
+
+        # Repeat applications of a merged person to one job
+        seen, repeats, dropped = {}, defaultdict(list), set()
+        for app in stage.iter("applications"):
+            pid = mapping.get(canonical_id(app.get("source") or stage.source, application_profile_key(app)))
+            if pid is None:
+                continue
+            rid = key(app)
+            first = seen.setdefault((pid, app.get("job_id")), rid)
+            if first != rid:
+                dropped.add(rid)
+                # Only BambooHR statuses are written back, so only its ids are worth listing
+                if (app.get("source") or stage.source) == "bamboohr":
+                    repeats[first].append(app.get("application_id") or record_id(app))
+
+        def applications():
+            for app in stage.iter("applications"):
+                rid = key(app)
+                if rid in dropped:
+                    continue
+                pid = mapping.get(canonical_id(app.get("source") or stage.source, application_profile_key(app)))
+                if pid is not None:
+                    app = {**app, "source_candidate_id": app.get("candidate_id"), "candidate_id": pid}
+                if rid in repeats:
+                    app["duplicate_application_ids"] = repeats[rid]
+                yield app
+
+        out.append("jobs", stage.iter("jobs"))
+        out.append("applications", applications())
+    stats = summarize(index, out.count("profiles"))
+    stats["applications_dropped"] = len(dropped)
+    return out, stats
+
+
+# =================== CLI ===================
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Merge duplicate candidates across ATS exports into canonical people.")
+    parser.add_argument("paths", nargs="+", help="profile files in any serializers format")
+    parser.add_argument("--key", help="list of profiles inside a JSON document, e.g. profiles")
+    parser.add_argument("--source", help="source of profiles that do not name one")
+    parser.add_argument("--out", help="write the canonical profiles here")
+    return parser
+
+
+if __name__ == "__main__":
+    from cli_output import setup_logging
+    setup_logging()
+    args = build_parser().parse_args()
+    records = (record for path in args.paths for record in serializers.load_records(path, key=args.key))
+    people, mapping, stats = dedupe_profiles(records, args.source)
+    if args.out:
+        serializers.dump_records(people, args.out)
+    log.info(f"🧬 {stats['profiles']} profiles -> {stats['people']} people "
+             f"({stats['duplicates']} duplicates, {stats['comparisons']} comparisons)")
+    print(json.dumps(stats, indent=2))
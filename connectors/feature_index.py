@@ -0,0 +1,283 @@
+"""Persistent feature index for profiles and jobs, updated incrementally on each sync.
+
+    python3 connectors/feature_index.py top <source> <job_id> [-k 10]
+    python3 connectors/feature_index.py train <source>
+
+Each source keeps one index per kind under .feature_index/<source>/<kind>/: a memory-mapped
+float32 matrix of L2-normalized hashed term vectors, the cluster each row belongs to, and a
+JSON id map holding the text hash each vector was built from. A sync re-embeds only records
+whose text changed. Rows are grouped into k-means lists once an index is large enough, so a
+top-k query scores the few closest lists instead of every profile.
+"""
+import os, json, zlib, hashlib, logging, argparse
+from collections import Counter
+import metrics
+
+# Imported on first use (see _load_numpy) so CLIs that only import this module start fast
+np = scoring = None
+
+INDEX_DIR = os.getenv("FEATURE_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".feature_index"))
+INDEX_DIM = int(os.getenv("FEATURE_INDEX_DIM", "512"))
+INDEX_MAX_LISTS = int(os.getenv("FEATURE_INDEX_LISTS", "256"))
+INDEX_PROBES = int(os.getenv("FEATURE_INDEX_PROBES", "8"))
+# Below this many rows a query simply scores everything
+INDEX_TRAIN_MIN = int(os.getenv("FEATURE_INDEX_TRAIN_MIN", "1024"))
+
+log = logging.getLogger("feature_index")
+
+
+class NotIndexed(KeyError):
+    """The source or job has no feature index entry (yet)."""
+
+
+def _load_numpy():
+    """Import NumPy and scoring once; False when NumPy is missing (the index is an optimisation)."""
+    global np, scoring
+    if np is None:
+        try:
+            import numpy as np
+            import scoring
+        except ImportError:
+            return False
+    return True
+
+
+def embed(text, dim=INDEX_DIM):
+    """Signed hashed bag of words with sublinear tf, L2-normalized.
+
+    No idf: it shifts as the corpus grows and would invalidate every stored vector.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for token, count in Counter(scoring.tokenize(text)).items():
+        h = zlib.crc32(token.encode())
+        # The top bit picks the sign so colliding tokens cancel out on average
+        vector[h % dim] += (1 + np.log(count)) * (1 if h >> 31 else -1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class FeatureIndex:
+    def __init__(self, source, kind, directory=INDEX_DIR, dim=INDEX_DIM):
+        self.kind = kind
+        self.dir = os.path.join(directory, source, kind)
+        self.text = scoring.profile_text if kind == "profiles" else scoring.job_text
+        os.makedirs(self.dir, exist_ok=True)
+
+        meta_path = os.path.join(self.dir, "meta.json")
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        self.dim = meta.get("dim", dim)
+        self.rows = meta.get("rows", 0)
+        self.ids = meta.get("ids", {})
+        self.hashes = meta.get("hashes", {})
+        self.free = meta.get("free", [])
+        self.trained_rows = meta.get("trained_rows", 0)
+        self.id_of = {row: rid for rid, row in self.ids.items()}
+
+        self._open(max(meta.get("capacity", 0), 1024))
+        centroids_path = os.path.join(self.dir, "centroids.npy")
+        self.centroids = np.load(centroids_path) if os.path.exists(centroids_path) else None
+
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _open(self, capacity):
+        """(Re)map the vector and label files at `capacity` rows, growing them on disk if needed."""
+        labels_path = self._path("labels.i32")
+        labelled = os.path.getsize(labels_path) // 4 if os.path.exists(labels_path) else 0
+        for name, width, dtype in (("vectors.f32", self.dim, np.float32), ("labels.i32", 1, np.int32)):
+            path, size = self._path(name), capacity * width * np.dtype(dtype).itemsize
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+        self.vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self.labels = np.memmap(labels_path, dtype=np.int32, mode="r+", shape=(capacity,))
+        # Rows added by growing the file belong to no list yet
+        if capacity > labelled:
+            self.labels[labelled:] = -1
+        self.capacity = capacity
+
+    def _row_for(self, rid):
+        if rid in self.ids:
+            return self.ids[rid]
+        if self.free:
+            row = self.free.pop()
+        else:
+            row = self.rows
+            self.rows += 1
+            if self.rows > self.capacity:
+                self.vectors.flush()
+                self._open(self.capacity * 2)
+        self.ids[rid] = row
+        self.id_of[row] = rid
+        return row
+
+    def update(self, records, key, prune=False):
+        """Embed records whose text changed since they were last indexed; returns counts.
+
+        With `prune`, `records` are all the source has, and indexed ids missing from them are removed.
+        """
+        counts = {"added": 0, "updated": 0, "unchanged": 0}
+        changed_rows, seen = [], set()
+        for record in records:
+            rid = key(record)
+            if rid is None:
+                continue
+            rid = str(rid)
+            seen.add(rid)
+            text = self.text(record)
+            digest = text_hash(text)
+            if self.hashes.get(rid) == digest:
+                counts["unchanged"] += 1
+                continue
+            counts["updated" if rid in self.ids else "added"] += 1
+            row = self._row_for(rid)
+            self.vectors[row] = embed(text, self.dim)
+            self.hashes[rid] = digest
+            changed_rows.append(row)
+
+        if prune:
+            gone = [rid for rid in self.ids if rid not in seen]
+            self.remove(gone)
+            counts["removed"] = len(gone)
+        if changed_rows:
+            if self.centroids is not None:
+                self._assign(np.asarray(changed_rows))
+            if len(self.ids) >= INDEX_TRAIN_MIN and len(self.ids) >= 2 * max(self.trained_rows, 1):
+                self.train()
+        return counts
+
+    def remove(self, ids):
+        for rid in map(str, ids):
+            row = self.ids.pop(rid, None)
+            if row is not None:
+                self.hashes.pop(rid, None)
+                self.id_of.pop(row, None)
+                self.labels[row] = -1
+                self.vectors[row] = 0
+                self.free.append(row)
+
+    def vector(self, rid):
+        row = self.ids.get(str(rid))
+        return None if row is None else np.array(self.vectors[row])
+
+    def _active_rows(self):
+        return np.fromiter(self.ids.values(), dtype=np.int64, count=len(self.ids))
+
+    def _assign(self, rows):
+        self.labels[rows] = np.argmax(self.vectors[rows] @ self.centroids.T, axis=1)
+
+    def train(self, lists=None, iterations=10, seed=0):
+        """Cluster the current vectors with spherical k-means and assign every row to a list."""
+        rows = np.sort(self._active_rows())
+        if not len(rows):
+            return
+        lists = lists or max(1, min(INDEX_MAX_LISTS, int(np.sqrt(len(rows)))))
+        data = np.asarray(self.vectors[rows])
+        rng = np.random.default_rng(seed)
+        centroids = data[rng.choice(len(rows), size=min(lists, len(rows)), replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, data)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty lists keep their previous centroid
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+        self.centroids = centroids.astype(np.float32)
+        self._assign(rows)
+        self.trained_rows = len(rows)
+        log.info(f"Trained {self.kind} index: {len(rows)} rows in {len(centroids)} lists")
+
+    def search(self, vector, k=10, probes=INDEX_PROBES):
+        """Top-k (id, cosine) for `vector`, scoring only the `probes` closest lists once trained."""
+        if self.centroids is None:
+            rows = self._active_rows()
+        else:
+            closest = np.argsort(self.centroids @ vector)[::-1][:probes]
+            rows = np.flatnonzero(np.isin(self.labels[:self.rows], closest))
+        if not len(rows):
+            return []
+        scores = np.asarray(self.vectors[rows]) @ vector
+        top = np.argsort(scores)[::-1][:k] if len(rows) <= k else np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(self.id_of[int(rows[i])], round(float(scores[i]), 4)) for i in top]
+
+    def save(self):
+        self.vectors.flush()
+        self.labels.flush()
+        if self.centroids is not None:
+            np.save(self._path("centroids.npy"), self.centroids)
+        meta = {"dim": self.dim, "rows": self.rows, "capacity": self.capacity, "trained_rows": self.trained_rows,
+                "ids": self.ids, "hashes": self.hashes, "free": self.free}
+        tmp = self._path("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._path("meta.json"))
+
+
+def update_from_stage(source, stage, full=False):
+    """Fold a sync's staged profiles and jobs into the source's index; a no-op without NumPy.
+
+    `full` means the stage holds everything the source has (a complete, not incremental,
+    pull), so records deleted upstream are dropped from the index too.
+    """
+    if not _load_numpy():
+        log.debug("NumPy not installed; feature index not updated")
+        return None
+    from mockai_upload import job_key, profile_key
+    report = {}
+    for kind, key in (("profiles", profile_key), ("jobs", job_key)):
+        if not stage.count(kind):
+            continue
+        with metrics.span("feature_index", source=source, kind=kind):
+            index = FeatureIndex(source, kind)
+            report[kind] = index.update(stage.iter(kind), key, prune=full)
+            index.save()
+    if report:
+        log.info(f"Feature index for {source}: {report}")
+    return report
+
+
+def top_candidates(source, job_id, k=10, probes=INDEX_PROBES):
+    """Best-matching indexed profiles for one indexed job."""
+    if not _load_numpy():
+        raise RuntimeError("The feature index needs NumPy")
+    vector = FeatureIndex(source, "jobs").vector(job_id)
+    if vector is None:
+        raise NotIndexed(f"Job {job_id!r} is not in the {source} index")
+    return [{"candidate_id": rid, "score": score} for rid, score in FeatureIndex(source, "profiles").search(vector, k, probes)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or maintain the persistent feature index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    top = commands.add_parser("top", help="best candidates for a job")
+    top.add_argument("source")
+    top.add_argument("job_id")
+    top.add_argument("-k", type=int, default=10)
+    top.add_argument("--probes", type=int, default=INDEX_PROBES)
+    train = commands.add_parser("train", help="re-cluster a source's indexes")
+    train.add_argument("source")
+    args = parser.parse_args()
+
+    if not _load_numpy():
+        raise SystemExit("The feature index needs NumPy")
+    if args.command == "top":
+        print(json.dumps(top_candidates(args.source, args.job_id, args.k, args.probes)))
+    else:
+        for kind in ("profiles", "jobs"):
+            index = FeatureIndex(args.source, kind)
+            index.train()
+            index.save()
+
+
+if __name__ == "__main__":
+    from cli_output import setup_logging
+    setup_logging()
+    main()
@@ -0,0 +1,197 @@
+import os, re, json, time, hashlib, threading, logging
+from collections import OrderedDict
+
+import requests
+from requests.structures import CaseInsensitiveDict
+import metrics
+
+HTTP_CACHE = os.getenv("HTTP_CACHE", "1") != "0"
+CACHE_DIR = os.getenv("HTTP_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".http_cache"))
+CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Index is flushed every this many stores, and at exit
+CACHE_FLUSH_EVERY = int(os.getenv("HTTP_CACHE_FLUSH_EVERY", "100"))
+
+# (URL pattern, seconds a response is served without asking the API). Past its TTL an
+# entry is revalidated with If-None-Match / If-Modified-Since when the API sent validators.
+# URLs matching no pattern are never cached.
+CACHE_TTLS = [
+    # Details are also keyed by the candidate's updated_at, but carry a signed resume_url that
+    # expires, so they are refetched well within the link's lifetime
+    (r"workable\.com/spi/v3/candidates/[^/?]+$", float(os.getenv("CACHE_TTL_WORKABLE_CANDIDATE", "900"))),
+    (r"workable\.com/spi/v3/jobs", float(os.getenv("CACHE_TTL_WORKABLE_JOBS", "3600"))),
+    (r"bamboohr\.com/api/", float(os.getenv("CACHE_TTL_BAMBOOHR", "0"))),
+    (r"ceipal\.com/", float(os.getenv("CACHE_TTL_CEIPAL", "0"))),
+    (r"recruitee\.com/", float(os.getenv("CACHE_TTL_RECRUITEE", "0"))),
+]
+
+# Response headers worth keeping alongside the body
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+log = logging.getLogger("http_cache")
+
+
+def ttl_for(url):
+    for pattern, ttl in CACHE_TTLS:
+        if re.search(pattern, url):
+            return ttl
+    return None
+
+
+def cache_key(url, params=None, headers=None, tag=None):
+    """Hash of URL, sorted params, credentials and an optional caller tag (e.g. a record's updated_at)."""
+    auth = (headers or {}).get("Authorization", "")
+    # Credentials are only hashed in, so tenants never share entries and tokens never hit disk
+    parts = [url, json.dumps(sorted((params or {}).items()), default=str), hashlib.sha256(auth.encode()).hexdigest(), str(tag or "")]
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+class ResponseCache:
+    """On-disk GET cache: bodies stored once by content hash, an LRU index bounded in bytes."""
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self.lock = threading.Lock()
+        self.dirty = 0
+
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path) as f:
+                    self.entries = OrderedDict(json.load(f))
+            except (OSError, json.JSONDecodeError) as e:
+                log.warning(f"Ignoring unreadable HTTP cache index: {e}")
+        self.total_bytes = sum(entry["size"] for entry in self.entries.values())
+
+    def object_path(self, body_hash):
+        return os.path.join(self.directory, "objects", body_hash[:2], body_hash)
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None, None
+            try:
+                with open(self.object_path(entry["body"]), "rb") as f:
+                    body = f.read()
+            except OSError:
+                self.total_bytes -= self.entries.pop(key)["size"]
+                return None, None
+            self.entries.move_to_end(key)
+            return entry, body
+
+    def store(self, key, url, response):
+        body = response.content
+        body_hash = hashlib.sha256(body).hexdigest()
+        path = self.object_path(body_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, path)
+
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries[key]["size"]
+            self.total_bytes += len(body)
+            self.entries[key] = {
+                "url": url,
+                "status": response.status_code,
+                "headers": {h: response.headers[h] for h in KEPT_HEADERS if h in response.headers},
+                "body": body_hash,
+                "size": len(body),
+                "stored_at": time.time(),
+            }
+            self.entries.move_to_end(key)
+            self.stats["stores"] += 1
+            self._evict()
+            self._mark_dirty()
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+        metrics.increment("http_cache_total", result=name)
+
+    def touch(self, key):
+        """Record a successful revalidation: the entry is fresh again."""
+        with self.lock:
+            if key in self.entries:
+                self.entries[key]["stored_at"] = time.time()
+                self._mark_dirty()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry["size"]
+            self.stats["evictions"] += 1
+            if not any(e["body"] == entry["body"] for e in self.entries.values()):
+                try:
+                    os.remove(self.object_path(entry["body"]))
+                except OSError:
+                    pass
+
+    def _mark_dirty(self):
+        self.dirty += 1
+        if self.dirty >= CACHE_FLUSH_EVERY:
+            self._save()
+
+    def save(self):
+        with self.lock:
+            if self.dirty:
+                self._save()
+
+    def _save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.index_path)
+        self.dirty = 0
+
+    def get(self, url, send, params=None, headers=None, tag=None, **kwargs):
+        """GET through the cache; `send(method, url, **kwargs)` performs the real request."""
+        ttl = ttl_for(url)
+        if ttl is None:
+            return send("GET", url, params=params, headers=headers, **kwargs)
+
+        key = cache_key(url, params, headers, tag)
+        entry, body = self.lookup(key)
+        if entry is not None and time.time() - entry["stored_at"] < ttl:
+            self.count("hits")
+            return cached_response(url, entry, body)
+
+        headers = dict(headers or {})
+        if entry is not None:
+            if "ETag" in entry["headers"]:
+                headers["If-None-Match"] = entry["headers"]["ETag"]
+            if "Last-Modified" in entry["headers"]:
+                headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+
+        response = send("GET", url, params=params, headers=headers, **kwargs)
+        if entry is not None and response.status_code == 304:
+            self.count("revalidated")
+            self.touch(key)
+            return cached_response(url, entry, body)
+
+        self.count("misses")
+        # With no TTL and no validators a stored copy could never be used
+        validators = "ETag" in response.headers or "Last-Modified" in response.headers
+        if response.status_code == 200 and (ttl > 0 or validators):
+            self.store(key, url, response)
+        return response
+
+    def summary(self):
+        lookups = self.stats["hits"] + self.stats["revalidated"] + self.stats["misses"]
+        return {**self.stats, "lookups": lookups, "entries": len(self.entries), "bytes": self.total_bytes}
+
+
+def cached_response(url, entry, body):
+    response = requests.Response()
+    response.status_code = entry["status"]
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    response._content = body
+    response.url = url
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers) or "utf-8"
+    return response
@@ -0,0 +1,244 @@
+import os, random, threading, time, atexit, logging, multiprocessing
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+import http_cache, metrics
+
+DEFAULT_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "1"))
+BACKOFF_CAP = float(os.getenv("HTTP_BACKOFF_CAP", "60"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+log = logging.getLogger("http_client")
+
+# (requests per second, burst) by host suffix; hosts not listed are not throttled.
+# Workable's SPI allows 10 requests per 10 seconds per token; a burst of 10 on top of the
+# refill would allow ~20 in the first window, so Workable's bucket holds a single token.
+HOST_RATE_LIMITS = {
+    "workable.com": (float(os.getenv("WORKABLE_RATE_LIMIT", "1")), int(os.getenv("WORKABLE_RATE_BURST", "1"))),
+    "bamboohr.com": (float(os.getenv("BAMBOOHR_RATE_LIMIT", "5")), int(os.getenv("BAMBOOHR_RATE_BURST", "10"))),
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursting up to `capacity`."""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket kept in shared memory, so worker processes handed the same bucket share one budget."""
+    def __init__(self, rate, capacity, context=multiprocessing):
+        self.rate = rate
+        self.capacity = capacity
+        # [tokens, updated]; CLOCK_MONOTONIC is system-wide, so every process reads the same clock
+        self.state = context.Array("d", [capacity, time.monotonic()])
+
+    def acquire(self):
+        while True:
+            with self.state.get_lock():
+                now = time.monotonic()
+                tokens = min(self.capacity, self.state[0] + (now - self.state[1]) * self.rate)
+                self.state[1] = now
+                if tokens >= 1:
+                    self.state[0] = tokens - 1
+                    return
+                self.state[0] = tokens
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+
+_lock = threading.Lock()
+_session = None
+_limiters = {}
+_cache = None
+
+
+def _reset_after_fork():
+    """A forked child must not share the parent's pooled sockets, or locks another thread held at fork time."""
+    global _lock, _session, _cache
+    _lock = threading.Lock()
+    _session = None
+    _cache = None
+    _limiters.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_session():
+    """Process-wide Session with a sized keep-alive pool, shared by every connector."""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def get_cache():
+    """Process-wide on-disk response cache, or None when HTTP_CACHE=0."""
+    global _cache
+    if not http_cache.HTTP_CACHE:
+        return None
+    with _lock:
+        if _cache is None:
+            _cache = http_cache.ResponseCache()
+            atexit.register(_close_cache)
+        return _cache
+
+
+def _close_cache():
+    _cache.save()
+    log.info(f"HTTP cache: {_cache.summary()}")
+
+
+def set_rate_limit(host_suffix, rate, burst):
+    with _lock:
+        HOST_RATE_LIMITS[host_suffix] = (rate, burst)
+        _limiters.pop(host_suffix, None)
+
+
+def share_limiter(host_suffix, limiter):
+    """Install a limiter built elsewhere, e.g. a SharedTokenBucket passed to a worker process."""
+    with _lock:
+        HOST_RATE_LIMITS.setdefault(host_suffix, (limiter.rate, limiter.capacity))
+        _limiters[host_suffix] = limiter
+
+
+def rate_limit_key(url):
+    """The HOST_RATE_LIMITS entry that governs `url`, or its bare host if none does."""
+    host = urlsplit(url).hostname or ""
+    return next((suffix for suffix in HOST_RATE_LIMITS if host == suffix or host.endswith("." + suffix)), host)
+
+
+def limiter_for(url):
+    host = urlsplit(url).hostname or ""
+    for suffix, (rate, burst) in HOST_RATE_LIMITS.items():
+        if host == suffix or host.endswith("." + suffix):
+            with _lock:
+                if suffix not in _limiters:
+                    _limiters[suffix] = TokenBucket(rate, burst)
+                return _limiters[suffix]
+    return None
+
+
+def retry_delay(response, attempt):
+    """Honour Retry-After (seconds or HTTP date), else exponential backoff with full jitter."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(BACKOFF_CAP, max(0.0, float(retry_after)))
+        except ValueError:
+            try:
+                return min(BACKOFF_CAP, max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time()))
+            except (TypeError, ValueError):
+                pass
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def request(method, url, retries=MAX_RETRIES, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """Send a request through the shared session, retrying throttling, 5xx and connection errors.
+
+    The last response is returned as-is once retries run out so callers keep checking
+    `.ok` themselves; a connection error on the final attempt is raised.
+    """
+    session = get_session()
+    limiter = limiter_for(url)
+    host = urlsplit(url).hostname or ""
+
+    for attempt in range(retries):
+        if limiter:
+            with metrics.span("rate_limit_wait", host=host):
+                limiter.acquire()
+        try:
+            with metrics.span("http", host=host, method=method):
+                response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.increment("http_errors_total", host=host, error=e.__class__.__name__)
+            if attempt == retries - 1:
+                raise
+            delay = retry_delay(None, attempt)
+            log.warning(f"⏳ {method} {url} failed ({e.__class__.__name__}). Retry {attempt+1}/{retries} in {delay:.1f}s...")
+            metrics.increment("http_retries_total", host=host)
+            with metrics.span("retry_backoff", host=host):
+                time.sleep(delay)
+            continue
+
+        if metrics.METRICS:
+            count_response(host, method, kwargs, response)
+        if response.status_code not in RETRY_STATUSES or attempt == retries - 1:
+            return response
+
+        delay = retry_delay(response, attempt)
+        log.warning(f"⏳ {method} {url} returned {response.status_code}. Retry {attempt+1}/{retries} in {delay:.1f}s...")
+        metrics.increment("http_retries_total", host=host)
+        with metrics.span("retry_backoff", host=host):
+            time.sleep(delay)
+
+    return response
+
+
+def count_response(host, method, kwargs, response):
+    metrics.increment("http_requests_total", host=host, method=method, status=response.status_code)
+    if response.status_code == 429:
+        metrics.increment("http_throttled_total", host=host)
+    data = kwargs.get("data")
+    # Streamed bodies (NDJSON uploads) are counted by whoever produces them
+    if isinstance(data, (bytes, str)):
+        metrics.increment("http_sent_bytes_total", len(data), host=host)
+    # Reading .content would consume a streamed download; trust its header instead
+    received = response.headers.get("Content-Length") if kwargs.get("stream") else len(response.content)
+    if received:
+        metrics.increment("http_received_bytes_total", int(received), host=host)
+
+
+def get(url, cache=True, cache_tag=None, **kwargs):
+    """GET through the response cache for URLs with a TTL in http_cache.CACHE_TTLS.
+
+    `cache_tag` is folded into the cache key, e.g. a record's updated_at so its detail
+    is refetched exactly when it changes.
+    """
+    response_cache = get_cache() if cache else None
+    if response_cache is None:
+        return request("GET", url, **kwargs)
+    return response_cache.get(url, request, tag=cache_tag, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+@contextmanager
+def route_requests():
+    """Send module-level `requests.get` calls, which the HrFlow connectors use, through `get` while active."""
+    original = requests.get
+    requests.get = lambda url, params=None, **kwargs: get(url, params=params, **kwargs)
+    try:
+        yield
+    finally:
+        requests.get = original
@@ -0,0 +1,71 @@
+"""Canonical ids and the application -> job / profile join, resolved once per record as it is staged.
+
+Every ATS names its ids differently (id, employee_id, candidate_id, ProfileID, ...). The
+alias functions below are the only place they are probed; the result is qualified with
+the record's source ("workable:3fa8c1") so ids from different ATSes cannot collide and
+the same record always gets the same id. StagingStore feeds a JoinIndex as it writes and
+reloads records, which lets uploads walk applications job by job straight from disk.
+"""
+
+
+def profile_key(profile):
+    return profile.get("id") or profile.get("employee_id") or profile.get("candidate_id") or profile.get("ProfileID")
+
+
+def job_key(job):
+    return job.get("id") or job.get("job_id") or job.get("JobID") or job.get("code") or job.get("reference")
+
+
+def application_profile_key(app):
+    return app.get("candidate_id") or app.get("employee_id") or app.get("ProfileID")
+
+
+def application_job_key(app):
+    return app.get("job_id") or app.get("JobID") or (app.get("job") or {}).get("id")
+
+
+# Application fields that only link to a profile or job; a grouped payload replaces them
+LINK_FIELDS = ("candidate_id", "employee_id", "ProfileID", "job_id", "JobID")
+# Ids of people dedupe merged across sources; they belong to no single source
+PERSON_PREFIX = "person:"
+
+
+def canonical_id(source, native):
+    """"<source>:<native id>"; ids sync_all already qualified, and person ids, are returned unchanged."""
+    if native in (None, ""):
+        return None
+    native = str(native)
+    return native if native.startswith((f"{source}:", PERSON_PREFIX)) else f"{source}:{native}"
+
+
+class JoinIndex:
+    """Byte offsets of one stage's records under their canonical ids, plus applications grouped by job.
+
+    `applications` holds application offsets in staging order, so a position in it lines
+    up with scores computed over stage.iter("applications"); `groups` maps a canonical job
+    id (None for applications without one) to those positions.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.profiles = {}
+        self.jobs = {}
+        self.applications = []
+        self.groups = {}
+
+    def add(self, kind, record, offset):
+        source = record.get("source") or self.source
+        if kind == "profiles":
+            pid = canonical_id(source, profile_key(record))
+            if pid is not None:
+                self.profiles.setdefault(pid, offset)
+        elif kind == "jobs":
+            jid = canonical_id(source, job_key(record))
+            if jid is not None:
+                self.jobs.setdefault(jid, offset)
+        else:
+            jid = canonical_id(source, application_job_key(record))
+            self.groups.setdefault(jid, []).append(len(self.applications))
+            self.applications.append(offset)
+
+    def profile_id(self, app):
+        return canonical_id(app.get("source") or self.source, application_profile_key(app))
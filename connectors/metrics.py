@@ -0,0 +1,302 @@
+"""Opt-in run metrics: timing spans, counters and peak memory, exported as JSON and Prometheus text.
+
+    CONNECTOR_METRICS=1 python3 connectors/Workable_to_mockai.py
+    CONNECTOR_METRICS=1 CONNECTOR_METRICS_PROM=/var/lib/node_exporter/mockai.prom python3 connectors/sync_all.py
+
+Spans time pipeline stages (fetch, enrich, convert, stage, score, serialize, upload) and
+every HTTP attempt, including time spent waiting on rate limits and retry backoff.
+Counters track requests by status, retries, 429s, bytes sent/received and records per
+source. While a run is open a sampler thread records the peak RSS overall and under
+each active span. Each run writes <METRICS_DIR>/<run>-<timestamp>.json and, when
+CONNECTOR_METRICS_PROM is set, the same numbers in Prometheus text format.
+
+With metrics off every call here returns immediately.
+"""
+import os, sys, json, time, bisect, logging, threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+METRICS = os.getenv("CONNECTOR_METRICS", "0") == "1"
+METRICS_DIR = os.getenv("CONNECTOR_METRICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".metrics"))
+# e.g. a node_exporter textfile collector path
+METRICS_PROM = os.getenv("CONNECTOR_METRICS_PROM")
+METRICS_SAMPLE_INTERVAL = float(os.getenv("CONNECTOR_METRICS_SAMPLE_INTERVAL", "0.5"))
+
+# Histogram upper bounds in seconds, Prometheus-style
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+log = logging.getLogger("metrics")
+
+_noop = nullcontext()
+
+
+def rss_bytes():
+    """Current resident set size, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_bytes():
+    # VmHWM belongs to this address space; ru_maxrss survives exec and can report a parent's peak
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _empty_span():
+    return {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * (len(BUCKETS) + 1)}
+
+
+def _key(name, labels):
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None)))
+
+
+class Registry:
+    """Thread-safe store of span histograms, counters and per-span peak RSS."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = {}
+        self.counters = Counter()
+        self.active = Counter()
+        self.span_peaks = {}
+
+    def observe(self, key, seconds):
+        with self.lock:
+            span = self.spans.get(key) or self.spans.setdefault(key, _empty_span())
+            span["count"] += 1
+            span["sum"] += seconds
+            span["max"] = max(span["max"], seconds)
+            span["buckets"][bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def increment(self, key, value):
+        with self.lock:
+            self.counters[key] += value
+
+    def enter(self, key):
+        with self.lock:
+            self.active[key] += 1
+
+    def exit(self, key):
+        with self.lock:
+            self.active[key] -= 1
+            if not self.active[key]:
+                del self.active[key]
+
+    def sample(self):
+        rss = rss_bytes()
+        if rss is None:
+            return
+        with self.lock:
+            for key in self.active:
+                if rss > self.span_peaks.get(key, 0):
+                    self.span_peaks[key] = rss
+
+    def snapshot(self):
+        """Plain-data copy, picklable and JSON-able, that `merge` can fold into another registry."""
+        def raw(key):
+            return [key[0], [list(pair) for pair in key[1]]]
+
+        with self.lock:
+            return {
+                "spans": [[raw(key), dict(span, buckets=list(span["buckets"]))] for key, span in self.spans.items()],
+                "counters": [[raw(key), value] for key, value in self.counters.items()],
+                "span_peaks": [[raw(key), value] for key, value in self.span_peaks.items()],
+            }
+
+    def merge(self, snapshot):
+        """Fold in another process's snapshot, e.g. from a sync_all worker."""
+        def key(raw):
+            return raw[0], tuple(tuple(pair) for pair in raw[1])
+
+        with self.lock:
+            for raw, span in snapshot["spans"]:
+                mine = self.spans.setdefault(key(raw), _empty_span())
+                mine["count"] += span["count"]
+                mine["sum"] += span["sum"]
+                mine["max"] = max(mine["max"], span["max"])
+                mine["buckets"] = [a + b for a, b in zip(mine["buckets"], span["buckets"])]
+            for raw, value in snapshot["counters"]:
+                self.counters[key(raw)] += value
+            for raw, value in snapshot["span_peaks"]:
+                self.span_peaks[key(raw)] = max(self.span_peaks.get(key(raw), 0), value)
+
+
+_registry = Registry()
+
+
+@contextmanager
+def _span(key):
+    _registry.enter(key)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _registry.observe(key, time.perf_counter() - start)
+        _registry.exit(key)
+
+
+def span(name, **labels):
+    """Time a block as `name`; labels such as source, kind or host split the histogram."""
+    if not METRICS:
+        return _noop
+    return _span(_key(name, labels))
+
+
+def increment(name, value=1, **labels):
+    if METRICS and value:
+        _registry.increment(_key(name, labels), value)
+
+
+def snapshot():
+    return _registry.snapshot() if METRICS else None
+
+
+def merge(snapshot):
+    if METRICS and snapshot:
+        _registry.merge(snapshot)
+
+
+def reset():
+    """Start from an empty registry, e.g. in a forked worker that must not report its parent's numbers."""
+    global _registry
+    _registry = Registry()
+
+
+def _sampler(stop):
+    while not stop.wait(METRICS_SAMPLE_INTERVAL):
+        _registry.sample()
+
+
+def start_sampler():
+    """Sample RSS in the background until the returned event is set."""
+    stop = threading.Event()
+    if METRICS:
+        threading.Thread(target=_sampler, args=(stop,), daemon=True).start()
+    return stop
+
+
+@contextmanager
+def sampling():
+    stop = start_sampler()
+    try:
+        yield
+    finally:
+        stop.set()
+        if METRICS:
+            _registry.sample()
+
+
+@contextmanager
+def run(name):
+    """Collect metrics for one connector run and write its summary (and Prometheus file) on exit."""
+    if not METRICS:
+        yield
+        return
+    started, start = datetime.now(timezone.utc), time.perf_counter()
+    try:
+        with sampling(), span("run", run=name):
+            yield
+    finally:
+        summary = summarize(name, started, time.perf_counter() - start)
+        write_summary(summary)
+        if METRICS_PROM:
+            write_prometheus(METRICS_PROM, name, summary)
+
+
+def summarize(name, started, seconds):
+    def labels(key):
+        return dict(key[1])
+
+    with _registry.lock:
+        spans = [{"span": key[0], **labels(key), "count": s["count"], "seconds": round(s["sum"], 4),
+                  "max_seconds": round(s["max"], 4),
+                  "peak_rss_mb": round(_registry.span_peaks[key] / 2 ** 20, 1) if key in _registry.span_peaks else None}
+                 for key, s in sorted(_registry.spans.items())]
+        counters = [{"name": key[0], **labels(key), "value": value} for key, value in sorted(_registry.counters.items())]
+    return {
+        "run": name,
+        "started_at": started.isoformat(timespec="seconds"),
+        "seconds": round(seconds, 3),
+        "peak_rss_mb": round(peak_rss_bytes() / 2 ** 20, 1),
+        "spans": spans,
+        "counters": counters,
+    }
+
+
+def write_summary(summary, directory=METRICS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    stamp = summary["started_at"].replace(":", "").replace("-", "").split("+")[0]
+    path = os.path.join(directory, f"{summary['run']}-{stamp}.json")
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+    log.info(f"📊 Metrics for {summary['run']}: {summary['seconds']}s, peak RSS {summary['peak_rss_mb']} MB -> {path}")
+    return path
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def prometheus_text(run_name=None, summary=None):
+    """Everything recorded so far in the Prometheus text exposition format."""
+    lines = []
+    run_label = (("run", run_name),) if run_name else ()
+    with _registry.lock:
+        spans = sorted(_registry.spans.items())
+        counters = sorted(_registry.counters.items())
+        peaks = sorted(_registry.span_peaks.items())
+
+    lines += ["# HELP connector_span_seconds Time spent per pipeline stage and HTTP call.",
+              "# TYPE connector_span_seconds histogram"]
+    for (name, pairs), s in spans:
+        base = run_label + (("span", name),) + pairs
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), s["buckets"]):
+            cumulative += count
+            lines.append(f"connector_span_seconds_bucket{_labels(base + (('le', bound),))} {cumulative}")
+        lines.append(f"connector_span_seconds_sum{_labels(base)} {s['sum']:.6f}")
+        lines.append(f"connector_span_seconds_count{_labels(base)} {s['count']}")
+
+    seen = set()
+    for (name, pairs), value in counters:
+        metric = f"connector_{name}"
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{_labels(run_label + pairs)} {value}")
+
+    if peaks:
+        lines += ["# HELP connector_span_peak_rss_bytes Highest sampled RSS while a span was active.",
+                  "# TYPE connector_span_peak_rss_bytes gauge"]
+        for (name, pairs), value in peaks:
+            lines.append(f"connector_span_peak_rss_bytes{_labels(run_label + (('span', name),) + pairs)} {value}")
+    lines += ["# TYPE connector_peak_rss_bytes gauge", f"connector_peak_rss_bytes{_labels(run_label)} {peak_rss_bytes()}"]
+    if summary:
+        lines += ["# TYPE connector_run_seconds gauge", f"connector_run_seconds{_labels(run_label)} {summary['seconds']}",
+                  "# TYPE connector_run_finished_timestamp_seconds gauge",
+                  f"connector_run_finished_timestamp_seconds{_labels(run_label)} {time.time():.0f}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path, run_name=None, summary=None):
+    # Written atomically so a scraping textfile collector never reads half a file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(prometheus_text(run_name, summary))
+    os.replace(tmp, path)
@@ -0,0 +1,365 @@
+import os, time, zlib, logging
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import http_client, metrics, serializers
+# Re-exported: callers have always taken the id aliases from here
+from join_index import LINK_FIELDS, application_job_key, application_profile_key, canonical_id, job_key, profile_key
+
+MOCK_AI_URL = os.getenv("MOCK_AI_URL", "http://localhost:3002/analyze")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", "500"))
+UPLOAD_MAX_IN_FLIGHT = int(os.getenv("UPLOAD_MAX_IN_FLIGHT", "3"))
+UPLOAD_RETRIES = int(os.getenv("UPLOAD_RETRIES", "4"))
+UPLOAD_GZIP = os.getenv("UPLOAD_GZIP", "1") != "0"
+UPLOAD_NDJSON = os.getenv("UPLOAD_NDJSON", "0") == "1"
+UPLOAD_SCORING = os.getenv("UPLOAD_SCORING", "1") != "0"
+# "grouped" sends staged data pre-joined by job; "flat" the separate profiles/jobs/applications lists
+UPLOAD_LAYOUT = os.getenv("UPLOAD_LAYOUT", "grouped")
+
+log = logging.getLogger("mockai_upload")
+
+
+def score_applications(profiles, jobs, applications):
+    """ai_score per application, aligned with `applications`, or None when scoring is off or unavailable."""
+    if not UPLOAD_SCORING:
+        return None
+    try:
+        import scoring  # loads NumPy, so only when an upload actually scores
+    except ImportError:  # NumPy missing: /analyze falls back to its own scores
+        return None
+    pairs = [(application_profile_key(app), application_job_key(app)) for app in applications]
+    if not pairs:
+        return None
+    with metrics.span("score"):
+        return scoring.score_pairs(((profile_key(p), p) for p in profiles), ((job_key(j), j) for j in jobs), pairs)
+
+
+def iter_chunks(profiles, jobs, applications, chunk_size=UPLOAD_CHUNK_SIZE, scores=None):
+    """Split a payload into self-contained chunks: each application travels with its own profile and job."""
+    profiles_by_id = {profile_key(p): p for p in profiles}
+    return _chunks(applications, profiles_by_id.get, jobs, lambda: profiles, chunk_size, scores)
+
+
+def iter_staged_chunks(stage, chunk_size=UPLOAD_CHUNK_SIZE, scores=None, skip=None):
+    """The same chunks read lazily from a staging.StagingStore; only profile offsets stay in memory.
+
+    Applications whose upload_id is in `skip` (uploaded by an interrupted run) are left out.
+    """
+    offsets = stage.offsets("profiles", profile_key)
+    read_at = stage.reader("profiles")
+
+    def profile_for(pid):
+        offset = offsets.get(pid)
+        return read_at(offset) if offset is not None else None
+
+    return _chunks(stage.iter("applications"), profile_for, list(stage.iter("jobs")),
+                   lambda: stage.iter("profiles"), chunk_size, scores, skip, stage.source)
+
+
+def _chunks(applications, profile_for, jobs, all_profiles, chunk_size, scores=None, skip=None, source=None):
+    jobs_by_id = {job_key(j): j for j in jobs}
+    sent_profiles, sent_jobs = set(), set()
+
+    applications = iter(applications)
+    position = 0
+    while apps := list(islice(applications, chunk_size)):
+        if scores is not None:
+            apps = [with_score(app, scores[position + i]) for i, app in enumerate(apps)]
+        position += len(apps)
+        if skip:
+            for app in apps:
+                if upload_id(app, source) in skip:
+                    # Its profile and job went out with it in an earlier run
+                    sent_profiles.add(application_profile_key(app))
+                    sent_jobs.add(application_job_key(app))
+            apps = [app for app in apps if upload_id(app, source) not in skip]
+            if not apps:
+                continue
+        chunk = {"profiles": [], "jobs": [], "applications": apps}
+        seen_profiles, seen_jobs = set(), set()
+        for app in apps:
+            pid, jid = application_profile_key(app), application_job_key(app)
+            if pid is not None and pid not in seen_profiles:
+                profile = profile_for(pid)
+                if profile is not None:
+                    seen_profiles.add(pid)
+                    chunk["profiles"].append(profile)
+            if jid is not None and jid in jobs_by_id and jid not in seen_jobs:
+                seen_jobs.add(jid)
+                chunk["jobs"].append(jobs_by_id[jid])
+        sent_profiles |= seen_profiles
+        sent_jobs |= seen_jobs
+        yield chunk
+
+    # Anything no application referenced still gets delivered
+    rest_profiles = (p for p in all_profiles() if profile_key(p) not in sent_profiles)
+    rest_jobs = [j for j in jobs if job_key(j) not in sent_jobs]
+    first = True
+    while (profiles := list(islice(rest_profiles, chunk_size))) or (first and rest_jobs):
+        yield {"profiles": profiles, "jobs": rest_jobs if first else [], "applications": []}
+        first = False
+
+
+def iter_grouped_chunks(stage, chunk_size=UPLOAD_CHUNK_SIZE, scores=None, skip=None):
+    """Chunks pre-joined by job from the stage's join index, for /analyze to use as they are.
+
+    A chunk is {"layout": "grouped", "groups": [{"job_id", "job", "applications"}], "profiles": {id: profile}}
+    with canonical ids throughout. Applications name their profile instead of repeating its
+    fields, and a job that spans chunks is sent again with each, so every chunk stands alone.
+    Applications whose upload_id is in `skip` are left out.
+    """
+    join = stage.join
+    read_application, read_profile, read_job = stage.reader("applications"), stage.reader("profiles"), stage.reader("jobs")
+    sent_profiles, sent_jobs = set(), set()
+
+    chunk = None
+    for jid, positions in join.groups.items():
+        job = read_job(join.jobs[jid]) if jid in join.jobs else None
+        group = None
+        for position in positions:
+            app = read_application(join.applications[position])
+            pid = join.profile_id(app)
+            if skip and upload_id(app, join.source) in skip:
+                # Its profile and job went out with it in an earlier run
+                sent_profiles.add(pid)
+                sent_jobs.add(jid)
+                continue
+            if chunk is None:
+                chunk, size = {"layout": "grouped", "groups": [], "profiles": {}}, 0
+            if group is None:
+                group = {"job_id": jid, "job": job, "applications": []}
+                chunk["groups"].append(group)
+                sent_jobs.add(jid)
+            if scores is not None:
+                app = with_score(app, scores[position])
+            profile = chunk["profiles"].get(pid)
+            if profile is None and pid in join.profiles:
+                profile = chunk["profiles"][pid] = read_profile(join.profiles[pid])
+                sent_profiles.add(pid)
+            group["applications"].append(slim_application(app, pid, profile, job))
+            size += 1
+            if size >= chunk_size:
+                yield chunk
+                chunk = group = None
+    if chunk is not None:
+        yield chunk
+
+    # Anything no application referenced still gets delivered
+    rest_profiles = (pid for pid in join.profiles if pid not in sent_profiles)
+    rest_jobs = [{"job_id": jid, "job": read_job(offset), "applications": []}
+                 for jid, offset in join.jobs.items() if jid not in sent_jobs]
+    first = True
+    while (pids := list(islice(rest_profiles, chunk_size))) or (first and rest_jobs):
+        yield {"layout": "grouped", "groups": rest_jobs if first else [],
+               "profiles": {pid: read_profile(join.profiles[pid]) for pid in pids}}
+        first = False
+
+
+def slim_application(app, pid, profile, job):
+    """An application as sent in a group: link fields become `profile`, and fields that repeat its profile or job are dropped."""
+    slim = {"profile": pid}
+    for key, value in app.items():
+        if key in LINK_FIELDS:
+            continue
+        # application_id and source stay: upload_id must come out the same as for the full record
+        if profile is not None and key not in ("application_id", "source") and profile.get(key) == value:
+            continue
+        if key == "job_title" and job is not None and job.get("title") == value:
+            continue
+        slim[key] = value
+    return slim
+
+
+def chunk_applications(chunk):
+    if chunk.get("layout") == "grouped":
+        return [app for group in chunk["groups"] for app in group["applications"]]
+    return chunk["applications"]
+
+
+def applications_in(chunk):
+    return len(chunk_applications(chunk))
+
+
+def upload_id(app, source):
+    """Canonical id an application's upload is tracked under, alike for full and grouped (slimmed) records."""
+    source = app.get("source") or source
+    native = app.get("application_id") or app.get("id")
+    if native not in (None, ""):
+        return canonical_id(source, native)
+    return app.get("profile") or canonical_id(source, application_profile_key(app))
+
+
+def with_score(app, score):
+    # NaN means the profile or job was not in the payload; JSON has no NaN, so leave it unset
+    return {**app, "ai_score": round(float(score), 1)} if score == score else app
+
+
+def iter_ndjson(chunk):
+    if chunk.get("layout") == "grouped":
+        for pid, profile in chunk["profiles"].items():
+            yield serializers.json_dumps({"type": "profile", "id": pid, "record": profile}) + b"\n"
+        for group in chunk["groups"]:
+            yield serializers.json_dumps({"type": "group", "record": group}) + b"\n"
+        return
+    for kind, records in chunk.items():
+        for record in records:
+            yield serializers.json_dumps({"type": kind, "record": record}) + b"\n"
+
+
+def gzip_stream(parts):
+    compressor = zlib.compressobj(wbits=31)
+    for part in parts:
+        data = compressor.compress(part)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def metered(parts):
+    for part in parts:
+        metrics.increment("upload_bytes_total", len(part))
+        yield part
+
+
+def encode_chunk(chunk, gzip=UPLOAD_GZIP, ndjson=UPLOAD_NDJSON):
+    """Return (body, headers). NDJSON bodies are generators so requests streams them chunked."""
+    with metrics.span("serialize", format="ndjson" if ndjson else "json", compression="gzip" if gzip else "none"):
+        body, headers = _encode_chunk(chunk, gzip, ndjson)
+    if isinstance(body, bytes):
+        metrics.increment("upload_bytes_total", len(body))
+    elif metrics.METRICS:
+        body = metered(body)
+    return body, headers
+
+
+def _encode_chunk(chunk, gzip, ndjson):
+    headers = {}
+    if ndjson:
+        headers["Content-Type"] = "application/x-ndjson"
+        body = iter_ndjson(chunk)
+        if gzip:
+            body = gzip_stream(body)
+    else:
+        headers["Content-Type"] = "application/json"
+        body = serializers.json_dumps(chunk)
+        if gzip:
+            body = zlib.compress(body, wbits=31)
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+
+def post_chunk(index, chunk, url=MOCK_AI_URL, gzip=UPLOAD_GZIP, ndjson=UPLOAD_NDJSON, retries=UPLOAD_RETRIES):
+    """POST one chunk, re-encoding and retrying only this chunk on failure."""
+    for attempt in range(retries):
+        body, headers = encode_chunk(chunk, gzip, ndjson)
+        resp = None
+        try:
+            with metrics.span("analyze"):
+                resp = http_client.post(url, data=body, headers=headers, retries=1)
+            # An unparseable 2xx body (ValueError) fails the chunk like any other error
+            result = resp.json() if resp.ok else None
+        except Exception as e:
+            error = str(e)
+        else:
+            if resp.ok:
+                metrics.increment("upload_chunks_total", result="ok")
+                metrics.increment("upload_records_total", applications_in(chunk))
+                return result
+            error = f"{resp.status_code} - {resp.text[:200]}"
+
+        if attempt < retries - 1:
+            metrics.increment("upload_chunk_retries_total")
+            delay = http_client.retry_delay(resp, attempt)
+            log.warning(f"⏳ Chunk {index} failed ({error}). Retry {attempt+1}/{retries} in {delay:.1f}s...")
+            time.sleep(delay)
+
+    log.error(f"Chunk {index} failed after {retries} attempts: {error}")
+    metrics.increment("upload_chunks_total", result="failed")
+    return None
+
+
+def merge_responses(responses):
+    candidates, status_updates = [], []
+    analyzed = 0
+    for resp in responses:
+        analyzed += resp.get("analyzed", 0)
+        candidates.extend(resp.get("candidates", []))
+        status_updates.extend(resp.get("status_updates", []))
+    # Chunks split job groups, so count distinct jobs instead of summing per-chunk totals
+    return {
+        "analyzed": analyzed,
+        "grouped_jobs": len({c.get("job_id") for c in candidates}),
+        "candidates": candidates,
+        "status_updates": status_updates,
+    }
+
+
+def send_to_mock_ai(profiles=(), jobs=(), applications=(), url=MOCK_AI_URL, chunk_size=UPLOAD_CHUNK_SIZE,
+                    max_in_flight=UPLOAD_MAX_IN_FLIGHT, gzip=UPLOAD_GZIP, ndjson=UPLOAD_NDJSON):
+    """Upload in chunks with a few in flight at once and return the merged /analyze response.
+
+    Returns None when every chunk failed; otherwise `failed_chunks` reports partial failures.
+    """
+    profiles, jobs, applications = list(profiles), list(jobs), list(applications)
+    with metrics.span("upload"):
+        scores = score_applications(profiles, jobs, applications)
+        return upload_chunks(iter_chunks(profiles, jobs, applications, chunk_size, scores), url, max_in_flight, gzip, ndjson)
+
+
+def send_staged(stage, url=MOCK_AI_URL, chunk_size=UPLOAD_CHUNK_SIZE, max_in_flight=UPLOAD_MAX_IN_FLIGHT,
+                gzip=UPLOAD_GZIP, ndjson=UPLOAD_NDJSON, layout=UPLOAD_LAYOUT, ledger=None):
+    """send_to_mock_ai for a staging.StagingStore, reading records from disk as chunks are built.
+
+    With a `ledger` (progress.Ledger) every uploaded application and chunk response is
+    recorded, so a resumed run only sends what is missing and still returns the whole analysis.
+    """
+    with metrics.span("upload", source=stage.source):
+        scores = score_applications(stage.iter("profiles"), stage.iter("jobs"), stage.iter("applications"))
+        skip = ledger.skipped("upload") if ledger is not None else None
+        if skip:
+            log.info(f"Skipping {len(skip)} applications an earlier run already uploaded or dead-lettered")
+        chunks = iter_grouped_chunks if layout == "grouped" else iter_staged_chunks
+        return upload_chunks(chunks(stage, chunk_size, scores, skip), url, max_in_flight, gzip, ndjson, ledger, stage.source)
+
+
+def upload_chunks(chunks, url=MOCK_AI_URL, max_in_flight=UPLOAD_MAX_IN_FLIGHT, gzip=UPLOAD_GZIP, ndjson=UPLOAD_NDJSON,
+                  ledger=None, source=None):
+    responses, failed = [], []
+
+    def collect(futures):
+        for future in futures:
+            result, chunk = future.result(), in_flight_chunks.pop(future)
+            (responses if result is not None else failed).append(result)
+            if ledger is not None:
+                record_upload(ledger, source, chunk, result)
+
+    # Chunks are built lazily, so at most `max_in_flight` of them are held at once
+    in_flight_chunks = {}
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        in_flight = set()
+        for index, chunk in enumerate(chunks):
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            future = pool.submit(post_chunk, index, chunk, url, gzip, ndjson)
+            in_flight.add(future)
+            in_flight_chunks[future] = chunk
+        collect(in_flight)
+
+    if not responses and failed:
+        return None
+
+    # A resumed run reports what earlier runs uploaded as well
+    merged = merge_responses(ledger.results("upload") if ledger is not None else responses)
+    merged["chunks"] = len(responses) + len(failed)
+    merged["failed_chunks"] = len(failed)
+    return merged
+
+
+def record_upload(ledger, source, chunk, response):
+    apps = chunk_applications(chunk)
+    if response is not None:
+        ledger.done("upload", [upload_id(app, source) for app in apps], result=response)
+        return
+    for app in apps:
+        ledger.fail("upload", upload_id(app, source), "chunk upload failed", record=app)
@@ -0,0 +1,337 @@
+import logging
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, fields
+import metrics
+from sync_state import ID_KEYS
+
+log = logging.getLogger("normalize")
+
+# Keys HrFlow warehouse writes have been seen passing record lists under
+LIST_KEYS = ("profiles", "data", "items", "candidates", "resumes", "employees", "jobs", "applicants", "applications")
+
+
+@dataclass(slots=True)
+class Profile:
+    id: str = None
+    candidate_id: str = None
+    source: str = None
+    name: str = None
+    first_name: str = None
+    last_name: str = None
+    email: str = None
+    phone: str = None
+    headline: str = None
+    summary: str = None
+    location: str = None
+    job_id: str = None
+    job_title: str = None
+    stage: str = None
+    stage_kind: str = None
+    disqualified: bool = None
+    sourced: bool = None
+    profile_url: str = None
+    resume_url: str = None
+    resume_text: str = None
+    created_at: str = None
+    updated_at: str = None
+    experience: list = None
+    education: list = None
+    skills: list = None
+
+    def to_dict(self):
+        return compact(self)
+
+
+@dataclass(slots=True)
+class Job:
+    job_id: str = None
+    source: str = None
+    code: str = None
+    reference: str = None
+    title: str = None
+    description: str = None
+    requirements: str = None
+    benefits: str = None
+    employment_type: str = None
+    department: str = None
+    location: str = None
+    state: str = None
+    url: str = None
+    created_at: str = None
+
+    @property
+    def id(self):
+        return self.job_id
+
+    def to_dict(self):
+        return compact(self)
+
+
+@dataclass(slots=True)
+class Application:
+    application_id: str = None
+    source: str = None
+    candidate_id: str = None
+    job_id: str = None
+    job_title: str = None
+    stage: str = None
+    stage_kind: str = None
+    status_id: str = None
+    disqualified: bool = None
+    created_at: str = None
+    resume_url: str = None
+    profile_url: str = None
+
+    @property
+    def id(self):
+        return self.application_id
+
+    def to_dict(self):
+        return compact(self)
+
+
+_FIELD_NAMES = {cls: tuple(f.name for f in fields(cls)) for cls in (Profile, Job, Application)}
+
+
+def compact(record):
+    """Dict of the fields that are actually set; empty values are not sent over the wire."""
+    out = {}
+    for name in _FIELD_NAMES[type(record)]:
+        value = getattr(record, name)
+        if value is not None and value != [] and value != "":
+            out[name] = value
+    return out
+
+
+def _lookup(obj, path):
+    for key in path:
+        if obj is None:
+            return None
+        if isinstance(obj, dict):
+            obj = obj.get(key)
+        elif isinstance(obj, list):
+            obj = obj[int(key)] if key.isdigit() and int(key) < len(obj) else None
+        else:
+            obj = getattr(obj, key, None)
+    return obj
+
+
+def extractor(cls, spec):
+    """Compile {field: ("a.b", "c", ...)} into a function building `cls` from a dict or object.
+
+    Each field takes the first non-empty value among its alternative dotted paths, read
+    straight from the source record without converting it to a dict first.
+    """
+    compiled = [(name, tuple(tuple(path.split(".")) for path in paths)) for name, paths in spec.items()]
+
+    def extract(record, source=None):
+        values = {}
+        for name, paths in compiled:
+            for path in paths:
+                value = _lookup(record, path)
+                if value is not None and value != "":
+                    values[name] = value
+                    break
+        values["source"] = source
+        return cls(**values)
+
+    return extract
+
+
+profile_from_workable = extractor(Profile, {
+    "id": ("id",),
+    "candidate_id": ("id",),
+    "name": ("name",),
+    "first_name": ("firstname",),
+    "last_name": ("lastname",),
+    "email": ("email",),
+    "phone": ("phone",),
+    "headline": ("headline",),
+    "summary": ("summary",),
+    "job_id": ("job.shortcode",),
+    "job_title": ("job.title",),
+    "stage": ("stage",),
+    "stage_kind": ("stage_kind",),
+    "disqualified": ("disqualified",),
+    "sourced": ("sourced",),
+    "profile_url": ("profile_url",),
+    "resume_url": ("resume_url",),
+    "created_at": ("created_at",),
+    "updated_at": ("updated_at",),
+    "experience": ("experience_entries",),
+    "education": ("education_entries",),
+})
+
+application_from_workable = extractor(Application, {
+    "application_id": ("id",),
+    "candidate_id": ("id",),
+    "job_id": ("job.shortcode",),
+    "job_title": ("job.title",),
+    "stage": ("stage",),
+    "stage_kind": ("stage_kind",),
+    "disqualified": ("disqualified",),
+    "created_at": ("created_at",),
+    "resume_url": ("resume_url",),
+    "profile_url": ("profile_url",),
+})
+
+job_from_workable = extractor(Job, {
+    "job_id": ("shortcode",),
+    "code": ("code",),
+    "reference": ("shortcode",),
+    "title": ("title",),
+    "description": ("description",),
+    "requirements": ("requirements",),
+    "benefits": ("benefits",),
+    "employment_type": ("employment_type",),
+    "department": ("department",),
+    "location": ("location.location_str",),
+    "state": ("state",),
+    "url": ("url",),
+    "created_at": ("created_at",),
+})
+
+# HrFlow-formatted records (BambooHR, Ceipal, Recruitee) plus the flat aliases the raw APIs use
+profile_from_hrflow = extractor(Profile, {
+    "id": ("reference", "id", "key", "employee_id", "candidate_id", "ProfileID"),
+    "name": ("info.full_name", "full_name", "name", "displayName"),
+    "first_name": ("info.first_name", "first_name", "firstName"),
+    "last_name": ("info.last_name", "last_name", "lastName"),
+    "email": ("info.email", "email", "work_email", "workEmail"),
+    "phone": ("info.phone", "phone", "mobilePhone"),
+    "headline": ("info.summary", "headline", "jobTitle"),
+    "summary": ("summary", "text"),
+    "location": ("info.location.text", "location.text", "location"),
+    "job_id": ("job_id", "job.id", "jobId"),
+    "job_title": ("job_title", "job.title"),
+    "profile_url": ("info.urls.from_resume", "profile_url"),
+    "resume_url": ("resume_url", "attachments.0.public_url"),
+    "created_at": ("created_at", "hireDate"),
+    "updated_at": ("updated_at",),
+    "experience": ("experiences",),
+    "education": ("educations",),
+    "skills": ("skills",),
+})
+
+job_from_hrflow = extractor(Job, {
+    "job_id": ("reference", "id", "job_id", "key"),
+    "reference": ("reference",),
+    "title": ("name", "title.label", "title"),
+    "description": ("summary", "description"),
+    "requirements": ("requirements",),
+    "employment_type": ("employment_type", "employmentStatus.label"),
+    "department": ("department", "department.label"),
+    "location": ("location.text", "location.name"),
+    "state": ("state", "status.label"),
+    "url": ("url",),
+    "created_at": ("created_at", "postedDate"),
+})
+
+application_from_hrflow = extractor(Application, {
+    "application_id": ("application_id", "id", "reference", "key"),
+    "candidate_id": ("candidate_id", "applicant.id", "employee_id", "ProfileID"),
+    "job_id": ("job_id", "job.id", "jobId", "JobID"),
+    "job_title": ("job_title", "job.title.label", "job.title"),
+    "status_id": ("status_id", "status.id"),
+    "stage": ("status.label", "stage"),
+    "created_at": ("created_at", "appliedDate"),
+    "resume_url": ("resume_url",),
+})
+
+NORMALIZERS = {
+    ("workable", "profiles"): profile_from_workable,
+    ("workable", "jobs"): job_from_workable,
+    ("workable", "applications"): application_from_workable,
+    ("hrflow", "profiles"): profile_from_hrflow,
+    ("hrflow", "jobs"): job_from_hrflow,
+    ("hrflow", "applications"): application_from_hrflow,
+}
+
+
+def normalize(record, kind, source, flavor="hrflow"):
+    return NORMALIZERS[flavor, kind](record, source)
+
+
+def _is_batch(value):
+    """Any iterable of records: not text, a single dict or a single HrFlow model (pydantic iterates its fields)."""
+    return (isinstance(value, Iterable) and not isinstance(value, (str, bytes, Mapping))
+            and not hasattr(value, "__fields__"))
+
+
+def iter_items(args, kwargs):
+    """Every record an HrFlow warehouse write was called with, however it was passed."""
+    for key in LIST_KEYS:
+        value = kwargs.get(key)
+        if _is_batch(value):
+            yield from value
+    for arg in args:
+        if _is_batch(arg):
+            yield from arg
+        elif isinstance(arg, Mapping) and any(arg.get(key) is not None for key in ID_KEYS):
+            yield arg
+
+
+class LocalWriter:
+    """Intercepts HrFlow warehouse writes, normalizing and deduping records by id as they arrive.
+
+    With a `stage` (staging.StagingStore) records are appended to disk instead of kept in memory.
+    A record that cannot be converted is skipped and handed back to HrFlow as failed rather than
+    aborting the pull; with a `ledger` (progress.Ledger) it is also dead-lettered.
+    """
+    def __init__(self, source, kind="profiles", stage=None, ledger=None):
+        self.source = source
+        self.kind = kind
+        self.stage = stage
+        self.ledger = ledger
+        self.records = {}
+        self.anonymous = []
+
+    def parameters(self, **kwargs):
+        return self
+
+    def _normalize(self, items, failed):
+        for item in items:
+            try:
+                yield normalize(item, self.kind, self.source)
+            except Exception as e:
+                failed.append(item)
+                rid = (item.get("reference") or item.get("id")) if isinstance(item, dict) else None
+                error = f"{e.__class__.__name__}: {e}"
+                if self.ledger is not None:
+                    # Conversion is deterministic, so a retry would fail the same way
+                    self.ledger.fail("convert", f"{self.kind}:{rid}", error, record=item, permanent=True)
+                else:
+                    log.warning(f"{self.source}: skipped a {self.kind} record ({rid}) that failed to convert: {error}")
+
+    def __call__(self, *args, **kwargs):
+        added, failed = 0, []
+        if self.stage is not None:
+            # Converted up front (one write's worth) so conversion and staging are timed apart
+            with metrics.span("convert", source=self.source, kind=self.kind):
+                records = [record.to_dict() for record in self._normalize(iter_items(args, kwargs), failed)]
+            added = len(self.stage.append(self.kind, records))
+        else:
+            with metrics.span("convert", source=self.source, kind=self.kind):
+                for record in self._normalize(iter_items(args, kwargs), failed):
+                    added += 1
+                    if record.id is None:
+                        self.anonymous.append(record)
+                    else:
+                        self.records[record.id] = record
+        metrics.increment("records_converted_total", added, source=self.source, kind=self.kind)
+        log.info(f"{self.source}: added {added} {self.kind} (total unique: {len(self)})")
+        # HrFlow treats the return value as the list of failed items
+        return failed
+
+    def __len__(self):
+        if self.stage is not None:
+            return self.stage.count(self.kind)
+        return len(self.records) + len(self.anonymous)
+
+    def clear(self):
+        self.records.clear()
+        self.anonymous.clear()
+
+    @property
+    def collected(self):
+        return [record.to_dict() for record in (*self.records.values(), *self.anonymous)]
@@ -0,0 +1,277 @@
+"""Durable per-record progress and dead-letter output, so a rerun picks up exactly where a run stopped.
+
+    python3 connectors/progress.py status [workable bamboohr]
+    python3 connectors/progress.py dead-letters workable [--step enrich]
+    python3 connectors/progress.py replay workable [--step enrich]
+    python3 connectors/progress.py clear workable
+
+A Ledger keeps one append-only NDJSON log per step under <PROGRESS_DIR>/<source>/:
+which record ids finished it (enrich, upload, write_back, convert) and which failed,
+with the error and the record itself. Staged records are already durable in the
+StagingStore; the ledger covers what happens to them afterwards. A failed record is
+retried by later runs until it has failed PROGRESS_MAX_ATTEMPTS times, or at once
+when the failure is permanent (e.g. a 404), after which it is written to
+dead_letter.ndjson and skipped. `replay` puts dead letters back in the queue.
+"""
+import os, json, time, shutil, logging, argparse, threading
+import serializers
+
+PROGRESS_DIR = os.getenv("PROGRESS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".progress"))
+PROGRESS_MAX_ATTEMPTS = int(os.getenv("PROGRESS_MAX_ATTEMPTS", "3"))
+
+STEPS = ("enrich", "convert", "upload", "write_back")
+
+log = logging.getLogger("progress")
+
+
+def open_log(path):
+    """Open an NDJSON log for appending, first ending any line a crash left torn so the next entry survives."""
+    f = open(path, "a+b")
+    if f.seek(0, os.SEEK_END):
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+    return f
+
+
+class Ledger:
+    """Per-record progress of one source across runs.
+
+    done(step, ids) and fail(step, id, error, record) append to the step's log at once,
+    so the ledger survives a crash at any point. Thread-safe: uploads and write-back
+    report from worker threads.
+    """
+    def __init__(self, source, progress_dir=PROGRESS_DIR, max_attempts=PROGRESS_MAX_ATTEMPTS):
+        self.source = source
+        self.dir = os.path.join(progress_dir, source)
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.files = {}
+        self.completed = {}
+        self.failures = {}
+        self.dead_letters = {}
+        self.step_results = {}
+        os.makedirs(self.dir, exist_ok=True)
+        for step in STEPS:
+            self._load(step)
+
+    def path(self, step):
+        return os.path.join(self.dir, f"{step}.ndjson")
+
+    @property
+    def dead_letter_path(self):
+        return os.path.join(self.dir, "dead_letter.ndjson")
+
+    def _load(self, step):
+        completed, failures, dead, results = {}, {}, {}, []
+        self.completed[step], self.failures[step], self.dead_letters[step] = completed, failures, dead
+        self.step_results[step] = results
+        if not os.path.exists(self.path(step)):
+            return
+        with open(self.path(step), "rb") as f:
+            for line in f:
+                try:
+                    entry = serializers.json_loads(line)
+                except ValueError:
+                    # A line torn by a crash; later runs appended after it, so keep reading
+                    continue
+                rid, status = entry.get("id"), entry["status"]
+                if status == "done":
+                    for rid in entry.get("ids") or [rid]:
+                        completed[rid] = entry.get("value")
+                        failures.pop(rid, None)
+                        dead.pop(rid, None)
+                    if "result" in entry:
+                        results.append(entry["result"])
+                elif status == "failed":
+                    failures[rid] = entry
+                elif status == "dead":
+                    failures.pop(rid, None)
+                    dead[rid] = entry
+                elif status == "requeued":
+                    dead.pop(rid, None)
+                    failures.pop(rid, None)
+
+    def _write(self, step, entries):
+        f = self.files.get(step)
+        if f is None:
+            f = self.files[step] = open_log(self.path(step))
+        f.write(b"".join(serializers.json_dumps(entry) + b"\n" for entry in entries))
+        f.flush()
+
+    def done(self, step, ids, value=None, result=None):
+        """Mark records as having finished `step`.
+
+        `value` (e.g. the status written back) is kept with each of them. A `result` (e.g.
+        the /analyze response for a chunk) is written in the same line as the ids, so a
+        crash can never keep one without the other.
+        """
+        ids = [str(rid) for rid in ids]
+        if not ids and result is None:
+            return
+        extra = {"value": value} if value is not None else {}
+        with self.lock:
+            if result is not None:
+                self._write(step, [{"ids": ids, "status": "done", "result": result, **extra}])
+                self.step_results[step].append(result)
+            else:
+                self._write(step, [{"id": rid, "status": "done", **extra} for rid in ids])
+            for rid in ids:
+                self.completed[step][rid] = value
+                self.failures[step].pop(rid, None)
+
+    def fail(self, step, rid, error, record=None, permanent=False):
+        """Record a failed attempt; returns True when the record was dead-lettered."""
+        rid = str(rid)
+        with self.lock:
+            attempts = self.failures[step].get(rid, {}).get("attempts", 0) + 1
+            entry = {"id": rid, "status": "failed", "error": str(error), "attempts": attempts, "at": round(time.time()),
+                     "record": record}
+            dead = permanent or attempts >= self.max_attempts
+            if dead:
+                entry["status"] = "dead"
+                self.failures[step].pop(rid, None)
+                self.dead_letters[step][rid] = entry
+                with open_log(self.dead_letter_path) as f:
+                    f.write(serializers.json_dumps({"source": self.source, "step": step, **entry}) + b"\n")
+            else:
+                self.failures[step][rid] = entry
+            self._write(step, [entry])
+        if dead:
+            log.warning(f"☠️  {self.source} {step} {rid}: dead-lettered after {attempts} attempt(s): {error}")
+        return dead
+
+    def is_done(self, step, rid, value=None):
+        rid = str(rid)
+        return rid in self.completed[step] and (value is None or self.completed[step][rid] == value)
+
+    def results(self, step):
+        """Every result recorded with done() for `step`, by this run and the ones it resumes."""
+        with self.lock:
+            return list(self.step_results[step])
+
+    def pending(self, step):
+        """Failed records still to retry: {id: entry with error, attempts and record}."""
+        return dict(self.failures[step])
+
+    def skipped(self, step):
+        """Ids a resumed run should not process again: finished or dead-lettered."""
+        return self.completed[step].keys() | self.dead_letters[step].keys()
+
+    def reset(self, step, keep_pending=False):
+        """Start `step` over, e.g. for a fresh (not resumed) run; `keep_pending` still retries earlier failures."""
+        with self.lock:
+            if step in self.files:
+                self.files.pop(step).close()
+            keep = list(self.failures[step].values()) if keep_pending else []
+            keep += list(self.dead_letters[step].values())
+            tmp = self.path(step) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(b"".join(serializers.json_dumps(entry) + b"\n" for entry in keep))
+            os.replace(tmp, self.path(step))
+            self.completed[step] = {}
+            self.step_results[step] = []
+            if not keep_pending:
+                self.failures[step] = {}
+
+    def requeue(self, step=None):
+        """Move dead letters (of one step, or all) back to pending; returns the entries requeued."""
+        steps = [step] if step else STEPS
+        requeued = []
+        with self.lock:
+            for name in steps:
+                entries = list(self.dead_letters[name].values())
+                if not entries:
+                    continue
+                # Requeued records start with a clean slate of attempts
+                self._write(name, [{"id": e["id"], "status": "requeued"} for e in entries]
+                            + [{**e, "status": "failed", "attempts": 0} for e in entries])
+                for e in entries:
+                    self.dead_letters[name].pop(e["id"])
+                    self.failures[name][e["id"]] = {**e, "status": "failed", "attempts": 0}
+                requeued += [{"step": name, **e} for e in entries]
+            if requeued and os.path.exists(self.dead_letter_path):
+                keep = [entry for entry in iter_dead_letters(self.dead_letter_path)
+                        if entry["step"] not in steps]
+                tmp = self.dead_letter_path + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(b"".join(serializers.json_dumps(entry) + b"\n" for entry in keep))
+                os.replace(tmp, self.dead_letter_path)
+        return requeued
+
+    def summary(self):
+        with self.lock:
+            return {step: {"done": len(self.completed[step]), "pending": len(self.failures[step]),
+                           "dead": len(self.dead_letters[step])}
+                    for step in STEPS if self.completed[step] or self.failures[step] or self.dead_letters[step]}
+
+    def close(self):
+        with self.lock:
+            for f in self.files.values():
+                f.close()
+            self.files = {}
+
+
+def for_run(source, resume=False):
+    """The source's ledger for a pull. A fresh run starts over, except that records earlier
+    runs failed to enrich are still retried and dead letters stay dead until replayed."""
+    ledger = Ledger(source)
+    if not resume:
+        for step in ("enrich", "convert", "upload"):
+            ledger.reset(step, keep_pending=step == "enrich")
+    return ledger
+
+
+def iter_dead_letters(path):
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                yield serializers.json_loads(line)
+            except ValueError:
+                continue
+
+
+def sources(progress_dir=PROGRESS_DIR):
+    return sorted(os.listdir(progress_dir)) if os.path.isdir(progress_dir) else []
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Inspect and replay per-record connector progress.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    status = commands.add_parser("status", help="done / pending / dead-lettered records per step")
+    status.add_argument("sources", nargs="*")
+    letters = commands.add_parser("dead-letters", help="print dead letters as NDJSON")
+    letters.add_argument("source")
+    letters.add_argument("--step", choices=STEPS)
+    replay = commands.add_parser("replay", help="queue dead letters for the next --resume run")
+    replay.add_argument("source")
+    replay.add_argument("--step", choices=STEPS)
+    clear = commands.add_parser("clear", help="forget all progress and dead letters of a source")
+    clear.add_argument("source")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "status":
+        report = {source: Ledger(source).summary() for source in args.sources or sources()}
+        print(json.dumps(report, indent=2))
+    elif args.command == "dead-letters":
+        for entry in iter_dead_letters(Ledger(args.source).dead_letter_path):
+            if args.step in (None, entry["step"]):
+                print(serializers.json_dumps(entry).decode())
+    elif args.command == "replay":
+        requeued = Ledger(args.source).requeue(args.step)
+        log.info(f"Requeued {len(requeued)} {args.source} records; rerun the connector with --resume to retry them"
+                 + (" (BambooHR write-back: update_status --retry)" if any(e["step"] == "write_back" for e in requeued) else ""))
+    else:
+        shutil.rmtree(os.path.join(PROGRESS_DIR, args.source), ignore_errors=True)
+        log.info(f"Cleared progress for {args.source}")
+
+
+if __name__ == "__main__":
+    from cli_output import setup_logging
+    setup_logging()
+    main()
@@ -1,135 +1,128 @@
-import sys, os, json, requests
-from collections.abc import Iterable
+import sys, os, logging, argparse
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "hrflow-connectors/src")))
 
-from hrflow_connectors.v1.connectors.recruitee.connector import Recruitee
-from hrflow_connectors.v1.connectors.hrflow.warehouse import HrFlowProfileWarehouse
-
-
-_collected_profiles = []
-
-class LocalWriter:
-    def parameters(self, **kwargs):
-        return self
-
-    def __call__(self, profiles, *args, **kwargs):
-        global _collected_profiles
-
-        print(f"\n========== LocalWriter.__call__ invoked ==========")
-        print(f"profiles type: {type(profiles)}")
-        print(f"args: {args}")
-        print(f"kwargs keys: {list(kwargs.keys())}")
-        
-        for key, value in kwargs.items():
-            print(f"kwargs['{key}']: type={type(value)}")
-            if isinstance(value, list):
-                print(f"   → LIST with {len(value)} items!")
-                if len(value) > 0:
-                    print(f"   → First item type: {type(value[0])}")
-        
-        for i, arg in enumerate(args):
-            print(f"args[{i}]: type={type(arg)}")
-            if isinstance(arg, list):
-                print(f"   → LIST with {len(arg)} items!")
-                if len(arg) > 0:
-                    print(f"   → First item type: {type(arg[0])}")
-
-        all_data = []
-        
-        for param_name in ['profiles', 'data', 'items', 'candidates', 'resumes']:
-            if param_name in kwargs and isinstance(kwargs[param_name], list):
-                all_data.extend(kwargs[param_name])
-                print(f" Found {len(kwargs[param_name])} items in kwargs['{param_name}']")
-        
-        for arg in args:
-            if isinstance(arg, list):
-                all_data.extend(arg)
-                print(f" Found {len(arg)} items in args")
-
-        print(f" Total items collected: {len(all_data)}")
-
-        simplified = []
-        for p in all_data:
-            try:
-                if hasattr(p, "to_dict"):
-                    simplified.append(p.to_dict())
-                elif isinstance(p, dict):
-                    simplified.append(p)
-                elif hasattr(p, "__dict__"):
-                    simplified.append({
-                        k: str(v)
-                        for k, v in p.__dict__.items()
-                        if not k.startswith("_")
-                    })
-                else:
-                    simplified.append(str(p))
-            except Exception as e:
-                print("Skipping one profile due to:", e)
-
-        _collected_profiles.extend(simplified)
-        print(f"Added {len(simplified)} profiles (total: {len(_collected_profiles)})\n")
-
-        return simplified
-
-HrFlowProfileWarehouse.write = LocalWriter()
+import http_client, mockai_upload, feature_index, metrics, serializers
+from sync_state import SyncCheckpoint
+from staging import StagingStore
+from normalize import LocalWriter
+from cli_output import RecordWriter, parse_command, setup_logging, sync_options
 
+log = logging.getLogger("recruitee")
 
-# === Run the Recruitee connector ===
-print("⚙️ Fetching profiles from Recruitee...")
-
-result = Recruitee.pull_profile_list(
-    workflow_id="recruitee_to_mockai_local",
-    action_parameters={"read_mode": "sync"},
-    origin_parameters={
-        "company_id": 127297,
-        "api_token": "K1NWREw5Szc3MllmRjJGdGkvTHY4dz09",
-        "recruitee_endpoint": "PRODUCTION ENDPOINT",
-        "limit": 10,
-    },
-    target_parameters={
-        "api_secret": "dummy",
-        "api_user": "dummy@example.com",
-        "source_key": "dummy_key",
-        "only_edit_fields": [],
-    },
-    connector_name="Recruitee",
-)
-
-print("DEBUG → connector result type:", type(result))
-if hasattr(result, "data"):
-    print("DEBUG → len(result.data):", len(result.data))
-elif hasattr(result, "output"):
-    print("DEBUG → len(result.output):", len(result.output))
-else:
-    print("DEBUG → result has no .data or .output attributes")
-
-print(f"Finished Recruitee pull — {len(_collected_profiles)} profiles collected.")
-
-MOCK_AI_URL = "http://localhost:3002/analyze"
 
-if not _collected_profiles:
-    print("  No profiles collected — check credentials or endpoint.")
-else:
-    try:
-        with open("recruitee_profiles.json", "w") as f:
-            json.dump(_collected_profiles, f, indent=2)
-        print(f"Saved {len(_collected_profiles)} profiles to recruitee_profiles.json")
-    except Exception as e:
-        print("Failed to save profiles:", e)
+_writer = LocalWriter("recruitee")
 
-    try:
-        print(f"Sending {len(_collected_profiles)} profiles to Mock AI …")
-        resp = requests.post(MOCK_AI_URL, json={"profiles": _collected_profiles})
-        print("Mock AI response:", resp.status_code)
-        print(resp.text[:400])
+MOCK_AI_URL = "http://localhost:3002/analyze"
 
-        with open("analyzed_profiles.json", "w") as f:
-            f.write(resp.text)
-        print("Saved analyzed results to analyzed_profiles.json")
-    except Exception as e:
-        print("Could not reach Mock AI:", e)
 
+# === Run the Recruitee connector ===
+def pull(stage):
+    """Stream the Recruitee profiles into `stage`; a resumed run that already staged them skips the pull."""
+    if stage.is_complete("profiles"):
+        log.info(f"{stage.count('profiles')} Recruitee profiles already staged, skipping pull")
+        return stage
 
+    # The HrFlow connector tree is slow to import, so only a pull pays for it
+    from hrflow_connectors.v1.connectors.recruitee.connector import Recruitee
+    from hrflow_connectors.v1.connectors.hrflow.warehouse import HrFlowProfileWarehouse
+    HrFlowProfileWarehouse.write = _writer
 
+    log.info("⚙️ Fetching profiles from Recruitee...")
+    _writer.clear()
+    _writer.stage = stage
 
+    try:
+        with http_client.route_requests():
+            result = Recruitee.pull_profile_list(
+                workflow_id="recruitee_to_mockai_local",
+                action_parameters={"read_mode": "sync"},
+                origin_parameters={
+                    "company_id": 127297,
+                    "api_token": "K1NWREw5Szc3MllmRjJGdGkvTHY4dz09",
+                    "recruitee_endpoint": "PRODUCTION ENDPOINT",
+                    "limit": 10,
+                },
+                target_parameters={
+                    "api_secret": "dummy",
+                    "api_user": "dummy@example.com",
+                    "source_key": "dummy_key",
+                    "only_edit_fields": [],
+                },
+                connector_name="Recruitee",
+            )
+
+            log.debug(f"connector result type: {type(result)}")
+    finally:
+        _writer.stage = None
+    stage.mark_complete("profiles")
+
+    log.info(f"Finished Recruitee pull — {stage.count('profiles')} profiles staged.")
+    return stage
+
+
+def iter_batches(checkpoint=None, stage=None):
+    """Yield ("profiles", records) batches from the staged pull, staging only changed profiles when a checkpoint is given."""
+    stage = stage or StagingStore("recruitee")
+    stage.checkpoint = checkpoint
+    pull(stage)
+    yield from stage.iter_batches(["profiles"])
+
+
+def main(incremental=False, output="text", resume=False, dry_run=False):
+    # Recruitee is pulled in full through the HrFlow connector; incremental runs
+    # forward only the profiles whose content changed since the last run
+    checkpoint = SyncCheckpoint("recruitee") if incremental else None
+    stage = StagingStore("recruitee", resume=resume)
+    writer = RecordWriter(output)
+    for kind, records in iter_batches(checkpoint, stage):
+        writer.write(kind, records)
+
+    if not stage.count("profiles"):
+        if checkpoint:
+            log.info("No changes since last sync.")
+        else:
+            log.warning("No profiles collected — check credentials or endpoint.")
+        writer.close()
+        return
+    log.info(f"Staged {stage.count('profiles')} profiles in {stage.path('profiles')}")
+    if dry_run:
+        log.info("Dry run: nothing sent")
+        stage.close()
+        writer.close()
+        return
+
+    log.info(f"Sending {stage.count('profiles')} profiles to Mock AI …")
+    feature_index.update_from_stage("recruitee", stage, full=not checkpoint)
+    analysis = mockai_upload.send_staged(stage, url=MOCK_AI_URL)
+    stage.close()
+    if analysis is None:
+        log.error("Could not reach Mock AI")
+        writer.close()
+        return
+
+    log.info(f"Mock AI analyzed {analysis['analyzed']} candidates ({analysis['failed_chunks']} failed chunks)")
+    serializers.write_json("analyzed_profiles.json", analysis)
+    log.info("Saved analyzed results to analyzed_profiles.json")
+    if checkpoint and not analysis["failed_chunks"]:
+        checkpoint.save()
+
+    writer.write("candidates", analysis["candidates"])
+    summary = {k: v for k, v in analysis.items() if k not in ("candidates", "status_updates")}
+    writer.result("analysis", summary, f"Analyzed {analysis['analyzed']} candidates")
+    writer.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Sync Recruitee profiles with Mock AI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("pull", parents=[sync_options()], help="pull, stage and send to Mock AI (default)")
+    commands.add_parser("dry-run", parents=[sync_options()], help="pull and stage without sending or saving the checkpoint")
+    return parser
+
+
+if __name__ == "__main__":
+    setup_logging()
+    args = parse_command(build_parser())
+    with metrics.run("recruitee"):
+        main(incremental=args.incremental, output=args.output, resume=args.resume, dry_run=args.command == "dry-run")
@@ -0,0 +1,200 @@
+import os, io, json, hashlib, zipfile, threading, logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import get_context, parent_process
+from urllib.parse import urlsplit
+from xml.etree import ElementTree
+import http_client, metrics
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # PDFs are skipped without it
+    PdfReader = None
+
+RESUME_PIPELINE = os.getenv("RESUME_PIPELINE", "1") != "0"
+RESUME_DIR = os.getenv("RESUME_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".resumes"))
+RESUME_MAX_IN_FLIGHT = int(os.getenv("RESUME_MAX_IN_FLIGHT", "4"))
+# Inside a sync_all / workable_partitioned worker the default is 1: its siblings already use the other CPUs
+RESUME_PARSE_WORKERS = int(os.getenv("RESUME_PARSE_WORKERS", str(os.cpu_count() or 2)))
+RESUME_MAX_BYTES = int(os.getenv("RESUME_MAX_BYTES", str(10 * 1024 * 1024)))
+# Extracted text sent along with a profile is cut to this many characters
+RESUME_MAX_CHARS = int(os.getenv("RESUME_MAX_CHARS", "20000"))
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+log = logging.getLogger("resumes")
+
+
+def extract_text(path):
+    """Plain text of a PDF, DOCX or text file, told apart by content rather than extension.
+
+    "" means the file cannot be read as text; None means a PDF while pypdf is not installed.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data.startswith(b"%PDF"):
+        if PdfReader is None:
+            return None
+        reader = PdfReader(io.BytesIO(data))
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+    if data.startswith(b"PK"):
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as docx:
+                root = ElementTree.fromstring(docx.read("word/document.xml"))
+        except (zipfile.BadZipFile, KeyError, ElementTree.ParseError):
+            return ""
+        return "\n".join("".join(t.text or "" for t in p.iter(f"{WORD_NS}t")) for p in root.iter(f"{WORD_NS}p"))
+    if b"\0" in data[:1024]:
+        # Legacy .doc and other binary formats
+        return ""
+    return data.decode("utf-8", errors="replace")
+
+
+def _extract(args):
+    path, text_path = args
+    try:
+        text = extract_text(path)
+    except Exception as e:
+        return path, None, f"{e.__class__.__name__}: {e}"
+    if text is not None:
+        tmp = f"{text_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, text_path)
+    return path, text, None
+
+
+def resume_version(profile):
+    """What identifies one version of a resume: the signed query string changes every fetch, the rest does not."""
+    url = profile.get("resume_url") or ""
+    parts = urlsplit(url)
+    return f"{profile.get('updated_at') or ''}|{parts.netloc}{parts.path}"
+
+
+class ResumePipeline:
+    """Downloads resumes with bounded concurrency, parses them in a process pool and caches both.
+
+    Files are kept under their sha256 and extracted text under the same hash, so a resume
+    is parsed once no matter how many candidates or runs share it. The manifest remembers
+    which file each candidate's current resume version resolved to, so unchanged resumes
+    are not downloaded again either.
+
+    Parsers are spawned rather than forked, since the download threads
+    are already running when the pool starts its first worker.
+    """
+    def __init__(self, source, directory=RESUME_DIR, max_in_flight=RESUME_MAX_IN_FLIGHT, parse_workers=None):
+        self.source = source
+        self.directory = directory
+        self.max_in_flight = max_in_flight
+        if parse_workers is None:
+            parse_workers = RESUME_PARSE_WORKERS if parent_process() is None else 1
+        self.parse_workers = parse_workers
+        self.manifest_path = os.path.join(directory, f"{source}.json")
+        self.manifest = {}
+        self.lock = threading.Lock()
+        self.stats = {"downloaded": 0, "reused": 0, "parsed": 0, "cached_text": 0, "failed": 0}
+        for sub in ("files", "text"):
+            os.makedirs(os.path.join(directory, sub), exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        self.parser = None
+
+    def __enter__(self):
+        self.parser = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=get_context("spawn"))
+        return self
+
+    def __exit__(self, *exc):
+        self.parser.shutdown()
+        self.save()
+        log.info(f"Resumes for {self.source}: {self.stats}")
+
+    def file_path(self, digest):
+        return os.path.join(self.directory, "files", digest)
+
+    def text_path(self, digest):
+        return os.path.join(self.directory, "text", f"{digest}.txt")
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+        metrics.increment("resumes_total", source=self.source, result=name)
+
+    def download(self, profile):
+        """Return the sha256 of the profile's current resume, downloading it only if its version is new."""
+        key, version = str(profile.get("id")), resume_version(profile)
+        known = self.manifest.get(key)
+        if known and known["version"] == version and os.path.exists(self.file_path(known["sha256"])):
+            self.count("reused")
+            return known["sha256"]
+
+        tmp = os.path.join(self.directory, "files", f".{key}.{threading.get_ident()}.part")
+        digest, size = hashlib.sha256(), 0
+        try:
+            # Closed on every path, or a failed download keeps its pooled connection checked out
+            with http_client.get(profile["resume_url"], cache=False, stream=True) as response:
+                if not response.ok:
+                    raise IOError(f"{response.status_code}")
+                with open(tmp, "wb") as f:
+                    for block in response.iter_content(64 * 1024):
+                        size += len(block)
+                        if size > RESUME_MAX_BYTES:
+                            raise IOError(f"larger than {RESUME_MAX_BYTES} bytes")
+                        digest.update(block)
+                        f.write(block)
+        except Exception as e:
+            log.warning(f"Resume for {key} not downloaded: {e}")
+            self.count("failed")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return None
+
+        sha = digest.hexdigest()
+        os.replace(tmp, self.file_path(sha))
+        with self.lock:
+            self.manifest[key] = {"version": version, "sha256": sha}
+        self.count("downloaded")
+        return sha
+
+    def attach(self, profiles):
+        """Set `resume_text` on each profile that has a resume_url; returns the profiles."""
+        profiles = [p for p in profiles if p.get("resume_url") and p.get("id") is not None]
+        if not profiles:
+            return profiles
+        with metrics.span("resumes", source=self.source):
+            return self._attach(profiles)
+
+    def _attach(self, profiles):
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            digests = list(pool.map(self.download, profiles))
+
+        texts, to_parse = {}, set()
+        for digest in filter(None, digests):
+            if digest in texts or digest in to_parse:
+                continue
+            if os.path.exists(self.text_path(digest)):
+                with open(self.text_path(digest)) as f:
+                    texts[digest] = f.read()
+                self.count("cached_text")
+            else:
+                to_parse.add(digest)
+
+        jobs = [(self.file_path(d), self.text_path(d)) for d in to_parse]
+        for path, text, error in self.parser.map(_extract, jobs, chunksize=4):
+            digest = os.path.basename(path)
+            if error:
+                log.warning(f"Could not parse resume {digest}: {error}")
+            if text is not None:
+                texts[digest] = text
+                self.count("parsed")
+
+        for profile, digest in zip(profiles, digests):
+            text = texts.get(digest)
+            if text:
+                profile["resume_text"] = " ".join(text.split())[:RESUME_MAX_CHARS]
+        return profiles
+
+    def save(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self.manifest_path)
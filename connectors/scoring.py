@@ -0,0 +1,163 @@
+import os, re, zlib, logging
+from collections import Counter
+import numpy as np
+
+# Hashed feature space; crc32 keeps bucket assignment identical across runs and processes
+HASH_DIM = int(os.getenv("SCORING_HASH_DIM", str(2 ** 18)))
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#.]*[a-z0-9+#]|[a-z0-9]")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or our the their this to we will with you your".split()
+)
+
+JOB_FIELDS = ("title", "description", "requirements", "benefits", "department")
+PROFILE_FIELDS = ("headline", "summary", "job_title", "resume_text")
+# Keys worth reading inside experience/education entries
+ENTRY_FIELDS = ("title", "company", "summary", "description", "degree", "field_of_study", "school", "name")
+
+log = logging.getLogger("scoring")
+
+
+def flatten(value):
+    """Text of a field that may be a string, a list of strings/dicts or a dict."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return " ".join(flatten(value.get(key)) for key in ENTRY_FIELDS)
+    if isinstance(value, (list, tuple)):
+        return " ".join(flatten(item) for item in value)
+    return str(value)
+
+
+def job_text(job):
+    return " ".join(flatten(job.get(field)) for field in JOB_FIELDS)
+
+
+def profile_text(profile):
+    fields = [profile.get(field) for field in PROFILE_FIELDS]
+    fields += [profile.get("experience"), profile.get("education"), profile.get("skills")]
+    return " ".join(flatten(field) for field in fields)
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+# token -> bucket per dim; vocabularies repeat heavily, so each token is hashed once
+_buckets = {}
+
+
+def bucket_map(tokens, dim=HASH_DIM):
+    cache = _buckets.setdefault(dim, {})
+    if len(cache) > 1_000_000:
+        cache.clear()
+    for token in set(tokens).difference(cache):
+        cache[token] = zlib.crc32(token.encode()) % dim
+    return cache
+
+
+class HashedMatrix:
+    """Sparse rows in CSR arrays (indptr, indices, data), built one document at a time.
+
+    Documents are only tokenized and counted as they are added; the arrays are built
+    in one pass by `finish()`.
+    """
+    def __init__(self, dim=HASH_DIM):
+        self.dim = dim
+        self.keys = {}
+        self.lengths, self.buckets, self.counts = [], [], []
+
+    def add(self, key, text):
+        if key is None or key in self.keys:
+            return
+        self.keys[key] = len(self.lengths)
+        counts = Counter(tokenize(text))
+        buckets = bucket_map(counts.keys(), self.dim)
+        self.lengths.append(len(counts))
+        self.buckets.extend(map(buckets.__getitem__, counts))
+        self.counts.extend(counts.values())
+
+    def finish(self):
+        rows = len(self.lengths)
+        row_ids = np.repeat(np.arange(rows, dtype=np.int64), self.lengths)
+        # Distinct tokens can share a bucket; merge them per row
+        cells, inverse = np.unique(row_ids * self.dim + np.asarray(self.buckets, dtype=np.int64), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.asarray(self.counts, dtype=np.float64), minlength=len(cells))
+        self.indices = (cells % self.dim).astype(np.int32)
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(cells // self.dim, minlength=rows))))
+        # Sublinear term frequency: one keyword stuffed 20 times is not 20x the evidence
+        self.data = (1 + np.log(counts)).astype(np.float32)
+        del self.lengths, self.buckets, self.counts
+        return self
+
+    def document_frequency(self):
+        return np.bincount(self.indices, minlength=self.dim)
+
+    def weight(self, idf):
+        """Apply idf and L2-normalize each row, so a row dot product is a cosine similarity."""
+        self.data *= idf[self.indices]
+        row_ids = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+        norms = np.sqrt(np.bincount(row_ids, weights=self.data.astype(np.float64) ** 2, minlength=len(self.indptr) - 1))
+        norms[norms == 0] = 1
+        self.data /= norms[row_ids].astype(np.float32)
+
+    def dense(self, row):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        start, end = self.indptr[row], self.indptr[row + 1]
+        vector[self.indices[start:end]] = self.data[start:end]
+        return vector
+
+    def gather(self, rows):
+        """(row position, indices, data) for all non-zeros of `rows`, without a Python loop."""
+        starts, lengths = self.indptr[rows], np.diff(self.indptr)[rows]
+        positions = np.repeat(np.arange(len(rows)), lengths)
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return positions, self.indices[offsets], self.data[offsets]
+
+
+def build(profiles, jobs, dim=HASH_DIM):
+    """TF-IDF matrices for (key, record) iterables of profiles and jobs, sharing one idf."""
+    profile_matrix, job_matrix = HashedMatrix(dim), HashedMatrix(dim)
+    for key, profile in profiles:
+        profile_matrix.add(key, profile_text(profile))
+    for key, job in jobs:
+        job_matrix.add(key, job_text(job))
+    profile_matrix.finish()
+    job_matrix.finish()
+
+    documents = len(profile_matrix.keys) + len(job_matrix.keys)
+    df = profile_matrix.document_frequency() + job_matrix.document_frequency()
+    idf = (np.log((1 + documents) / (1 + df)) + 1).astype(np.float32)
+    profile_matrix.weight(idf)
+    job_matrix.weight(idf)
+    return profile_matrix, job_matrix
+
+
+def score_pairs(profiles, jobs, pairs, dim=HASH_DIM):
+    """Cosine match (0-100) for each (profile key, job key) pair; NaN where either side is unknown.
+
+    `profiles` and `jobs` are (key, record) iterables read once. Pairs are grouped by job
+    and each group is scored with one sparse-row x dense-job product.
+    """
+    profile_matrix, job_matrix = build(profiles, jobs, dim)
+    scores = np.full(len(pairs), np.nan, dtype=np.float32)
+
+    groups = {}
+    for position, (pid, jid) in enumerate(pairs):
+        row, job_row = profile_matrix.keys.get(pid), job_matrix.keys.get(jid)
+        if row is not None and job_row is not None:
+            positions, rows = groups.setdefault(job_row, ([], []))
+            positions.append(position)
+            rows.append(row)
+
+    for job_row, (positions, rows) in groups.items():
+        job_vector = job_matrix.dense(job_row)
+        members, indices, data = profile_matrix.gather(np.asarray(rows))
+        similarity = np.bincount(members, weights=data * job_vector[indices], minlength=len(rows))
+        scores[positions] = np.round(100 * np.clip(similarity, 0, 1), 1)
+
+    log.info(f"Scored {len(pairs) - int(np.isnan(scores).sum())} of {len(pairs)} applications "
+             f"across {len(groups)} jobs")
+    return scores
@@ -0,0 +1,294 @@
+"""Record serializers for staged tables, result files and the /analyze body, plus conversion between them.
+
+    python3 connectors/serializers.py convert .staging/workable/profiles.ndjson profiles.parquet
+    python3 connectors/serializers.py convert analyzed_profiles.json candidates.msgpack --key candidates
+    python3 connectors/serializers.py export workable --to parquet --out exports/
+
+Row formats are record streams that can be appended to and read back one record at a time,
+which is what StagingStore needs: "ndjson" (one compact JSON document per line) and
+"msgpack" (concatenated MessagePack maps; smaller and faster to parse). Table formats hold
+a finished table and are only written whole: "parquet" and "arrow" (Arrow IPC), with
+nested values kept as JSON strings, and "json" (one array). JSON is encoded with orjson
+when it is installed and the stdlib otherwise; both produce the same compact JSON.
+msgpack and pyarrow are optional and only needed for their formats.
+"""
+import os, json, logging, argparse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.feather, pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# "json" forces the stdlib encoder, e.g. to compare against orjson
+JSON_BACKEND = os.getenv("CONNECTOR_JSON", "orjson" if orjson else "json")
+# Parquet's own codecs; zstd is both smaller and faster than the default snappy on text-heavy records
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+log = logging.getLogger("serializers")
+
+if JSON_BACKEND == "orjson" and orjson is not None:
+    def json_dumps(value):
+        """Compact JSON as bytes; values JSON cannot hold are written as str()."""
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+    json_loads = orjson.loads
+else:
+    def json_dumps(value):
+        """Compact JSON as bytes; values JSON cannot hold are written as str()."""
+        return json.dumps(value, separators=(",", ":"), default=str).encode()
+
+    json_loads = json.loads
+
+
+def write_json(path, value):
+    """Write one compact JSON document, atomically."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(json_dumps(value))
+    os.replace(tmp, path)
+
+
+# =================== ROW FORMATS ===================
+
+class NdjsonFormat:
+    name, extension = "ndjson", ".ndjson"
+
+    def dumps(self, record):
+        return json_dumps(record) + b"\n"
+
+    def iter(self, f):
+        """Yield (record, end offset) from a binary file, stopping at a torn last record."""
+        offset = f.tell()
+        for line in f:
+            try:
+                record = json_loads(line)
+            except ValueError:
+                return
+            offset += len(line)
+            yield record, offset
+
+    def read_at(self, f, offset):
+        f.seek(offset)
+        return json_loads(f.readline())
+
+
+class MsgpackFormat:
+    name, extension = "msgpack", ".msgpack"
+
+    def __init__(self):
+        self.packer = msgpack.Packer(default=str)
+
+    def dumps(self, record):
+        return self.packer.pack(record)
+
+    def unpacker(self, f):
+        # A small read size keeps read_at from pulling a megabyte per random access
+        return msgpack.Unpacker(f, raw=False, strict_map_key=False, read_size=16 * 1024)
+
+    def iter(self, f):
+        start = f.tell()
+        unpacker = self.unpacker(f)
+        while True:
+            try:
+                record = unpacker.unpack()
+            except msgpack.OutOfData:
+                return
+            except ValueError:
+                # Corrupt bytes after a crash mid-write
+                return
+            yield record, start + unpacker.tell()
+
+    def read_at(self, f, offset):
+        f.seek(offset)
+        return self.unpacker(f).unpack()
+
+
+ROW_FORMATS = {"ndjson": NdjsonFormat, "msgpack": MsgpackFormat}
+TABLE_FORMATS = {"json": ".json", "parquet": ".parquet", "arrow": ".arrow"}
+EXTENSIONS = {**{cls.extension: name for name, cls in ROW_FORMATS.items()},
+              **{ext: name for name, ext in TABLE_FORMATS.items()}, ".feather": "arrow", ".mpk": "msgpack"}
+
+
+def missing_dependency(name):
+    """The pip package format `name` needs but cannot import, or None."""
+    if name == "msgpack" and msgpack is None:
+        return "msgpack"
+    if name in ("parquet", "arrow") and pyarrow is None:
+        return "pyarrow"
+    return None
+
+
+def row_format(name="ndjson"):
+    if name not in ROW_FORMATS:
+        raise ValueError(f"Unknown row format {name!r}; expected one of {list(ROW_FORMATS)}")
+    package = missing_dependency(name)
+    if package:
+        raise ImportError(f"The {name} format needs `pip install {package}`")
+    return ROW_FORMATS[name]()
+
+
+def format_of(path, fmt=None):
+    if fmt:
+        return fmt
+    name = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if name is None:
+        raise ValueError(f"Cannot tell the format of {path}; pass one of {list(ROW_FORMATS) + list(TABLE_FORMATS)}")
+    return name
+
+
+# =================== TABLES ===================
+
+def to_arrow(records):
+    """A pyarrow.Table of `records`. Columns holding dicts, lists or mixed types are stored as JSON strings."""
+    records = records if isinstance(records, list) else list(records)
+    names = list(dict.fromkeys(key for record in records for key in record))
+    columns, encoded = {}, []
+    for name in names:
+        values = [record.get(name) for record in records]
+        if not any(isinstance(v, (dict, list)) for v in values):
+            try:
+                columns[name] = pyarrow.array(values)
+                continue
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+                pass
+        columns[name] = pyarrow.array([None if v is None else json_dumps(v).decode() for v in values], pyarrow.string())
+        encoded.append(name)
+    table = pyarrow.table(columns) if columns else pyarrow.table({})
+    return table.replace_schema_metadata({b"json_columns": json_dumps(encoded)})
+
+
+def from_arrow(table):
+    encoded = set(json_loads((table.schema.metadata or {}).get(b"json_columns", b"[]")))
+    for batch in table.to_batches():
+        for record in batch.to_pylist():
+            for name in encoded:
+                if record.get(name) is not None:
+                    record[name] = json_loads(record[name])
+            yield record
+
+
+# =================== FILES ===================
+
+def load_records(path, fmt=None, key=None):
+    """Iterate the records in a file of any format; `key` picks a list out of a JSON document."""
+    fmt = format_of(path, fmt)
+    package = missing_dependency(fmt)
+    if package:
+        raise ImportError(f"Reading {fmt} needs `pip install {package}`")
+    if fmt in ROW_FORMATS:
+        codec = row_format(fmt)
+        with open(path, "rb") as f:
+            yield from (record for record, _ in codec.iter(f))
+    elif fmt == "json":
+        with open(path, "rb") as f:
+            value = json_loads(f.read())
+        if key is not None:
+            value = value[key]
+        if not isinstance(value, list):
+            raise ValueError(f"{path} holds a {type(value).__name__}, not a list of records; pick one with --key")
+        yield from value
+    elif fmt == "parquet":
+        yield from from_arrow(pyarrow.parquet.read_table(path))
+    else:
+        yield from from_arrow(pyarrow.feather.read_table(path))
+
+
+def dump_records(records, path, fmt=None):
+    """Write records to `path` in `fmt` (by default from its extension); returns how many were written."""
+    fmt = format_of(path, fmt)
+    package = missing_dependency(fmt)
+    if package:
+        raise ImportError(f"Writing {fmt} needs `pip install {package}`")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    count = 0
+    if fmt in ROW_FORMATS:
+        codec = row_format(fmt)
+        with open(tmp, "wb") as f:
+            for record in records:
+                f.write(codec.dumps(record))
+                count += 1
+    elif fmt == "json":
+        records = list(records)
+        count = len(records)
+        with open(tmp, "wb") as f:
+            f.write(json_dumps(records))
+    else:
+        table = to_arrow(records)
+        count = table.num_rows
+        if fmt == "parquet":
+            pyarrow.parquet.write_table(table, tmp, compression=PARQUET_COMPRESSION)
+        else:
+            pyarrow.feather.write_feather(table, tmp, compression="zstd")
+    os.replace(tmp, path)
+    return count
+
+
+def convert(src, dst, src_format=None, dst_format=None, key=None):
+    count = dump_records(load_records(src, src_format, key), dst, dst_format)
+    log.info(f"Converted {count} records: {src} ({os.path.getsize(src) / 2 ** 20:.1f} MB) -> "
+             f"{dst} ({os.path.getsize(dst) / 2 ** 20:.1f} MB)")
+    return count
+
+
+def export_stage(source, fmt, out, staging_dir=None, staging_format=None):
+    """Write each staged table of `source` to <out>/<source>-<kind><ext>; returns the paths written."""
+    from staging import KINDS, STAGING_DIR, STAGING_FORMAT, StagingStore
+    if not os.path.isdir(os.path.join(staging_dir or STAGING_DIR, source)):
+        raise ValueError(f"Nothing staged for {source}")
+    stage = StagingStore(source, staging_dir or STAGING_DIR, resume=True, fmt=staging_format or STAGING_FORMAT)
+    os.makedirs(out, exist_ok=True)
+    paths = []
+    for kind in KINDS:
+        if not stage.count(kind):
+            continue
+        path = os.path.join(out, f"{source}-{kind}{ROW_FORMATS[fmt].extension if fmt in ROW_FORMATS else TABLE_FORMATS[fmt]}")
+        count = dump_records(stage.iter(kind), path, fmt)
+        log.info(f"Exported {count} {kind} to {path}")
+        paths.append(path)
+    stage.close()
+    return paths
+
+
+def build_parser():
+    formats = list(ROW_FORMATS) + list(TABLE_FORMATS)
+    parser = argparse.ArgumentParser(description="Convert staged records and result files between formats.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    conv = commands.add_parser("convert", help="convert one file; formats default to the file extensions")
+    conv.add_argument("src")
+    conv.add_argument("dst")
+    conv.add_argument("--from", dest="src_format", choices=formats)
+    conv.add_argument("--to", dest="dst_format", choices=formats)
+    conv.add_argument("--key", help="list to convert inside a JSON document, e.g. candidates")
+
+    export = commands.add_parser("export", help="write a source's staged tables to files")
+    export.add_argument("source")
+    export.add_argument("--to", dest="fmt", choices=formats, default="parquet")
+    export.add_argument("--out", default=".")
+    export.add_argument("--staging-dir")
+    export.add_argument("--staging-format", choices=list(ROW_FORMATS))
+    return parser
+
+
+if __name__ == "__main__":
+    from cli_output import setup_logging
+    setup_logging()
+    args = build_parser().parse_args()
+    try:
+        if args.command == "convert":
+            convert(args.src, args.dst, args.src_format, args.dst_format, args.key)
+        else:
+            export_stage(args.source, args.fmt, args.out, args.staging_dir, args.staging_format)
+    except (ImportError, ValueError, KeyError) as e:
+        raise SystemExit(f"❌ {e}")
@@ -0,0 +1,149 @@
+"""Pull every ATS source in parallel and submit one merged dataset to /analyze.
+
+    python3 connectors/sync_all.py [--sources workable,bamboohr] [--incremental] [--resume] [--no-dedupe] [--output json]
+
+Each source runs in its own process (the HrFlow-backed ones patch the same warehouse
+class, so they cannot share one) and stages its records on disk. The parent merges
+the stages into a single source-tagged dataset and uploads it once, so a sync takes
+as long as the slowest source rather than the sum of all of them. Before the upload,
+profiles of the same person in several sources are merged into one canonical
+candidate (see dedupe.py), so each person is scored once per job.
+"""
+import os, sys, logging, importlib
+from concurrent.futures import ProcessPoolExecutor
+import mockai_upload, feature_index, metrics, dedupe
+from cli_output import RecordWriter, option, output_mode, setup_logging
+from connector_worker import SOURCES
+from staging import KINDS, STAGING_DIR, StagingStore
+from sync_state import SyncCheckpoint, record_id
+
+MOCK_AI_URL = os.getenv("MOCK_AI_URL", "http://localhost:3002/analyze")
+SYNC_STAGING_DIR = os.path.join(STAGING_DIR, "sync_all")
+SYNC_DEDUPE = os.getenv("SYNC_DEDUPE", "1") != "0"
+
+log = logging.getLogger("sync_all")
+
+# Fields holding ids that /analyze joins on; they are prefixed with the source so
+# ids from different ATSes cannot collide in the merged dataset
+JOIN_FIELDS = {
+    "profiles": ("id",),
+    "jobs": ("job_id",),
+    "applications": ("candidate_id", "job_id"),
+}
+
+
+def pull_source(source, incremental=False, resume=False):
+    """Run one connector in a worker process, staging its records; returns (checkpoint, counts, metrics)."""
+    setup_logging()
+    # A forked worker inherits the parent's registry; report only this source's numbers
+    metrics.reset()
+    module = importlib.import_module(SOURCES[source])
+    checkpoint = SyncCheckpoint(source) if incremental else None
+    stage = StagingStore(source, SYNC_STAGING_DIR, resume=resume)
+    with metrics.sampling(), metrics.span("pull", source=source):
+        for kind, records in module.iter_batches(checkpoint, stage):
+            log.debug(f"{source}: staged {len(records)} {kind}")
+        feature_index.update_from_stage(source, stage, full=not incremental)
+    stage.close()
+    return checkpoint, {kind: stage.count(kind) for kind in KINDS}, metrics.snapshot()
+
+
+def tag(kind, source, record):
+    record = {**record, "source": source}
+    for field in JOIN_FIELDS[kind]:
+        if record.get(field) is not None:
+            record[field] = f"{source}:{record[field]}"
+    return record
+
+
+def merged_key(record):
+    rid = record_id(record)
+    return f"{record.get('source')}:{rid}" if rid is not None else None
+
+
+def merge(sources):
+    """Merge the per-source stages into one deduplicated, source-tagged stage."""
+    merged = StagingStore("merged", SYNC_STAGING_DIR, key=merged_key)
+    for source in sources:
+        stage = StagingStore(source, SYNC_STAGING_DIR, resume=True)
+        for kind, records in stage.iter_batches():
+            merged.append(kind, (tag(kind, source, record) for record in records))
+    return merged
+
+
+def sync(sources, incremental=False, resume=False, max_workers=None, deduplicate=SYNC_DEDUPE):
+    """Pull `sources` concurrently, merge (and deduplicate) them and upload once; returns (analysis, per-source report)."""
+    report, checkpoints = {}, {}
+    with ProcessPoolExecutor(max_workers=max_workers or len(sources)) as pool:
+        futures = {source: pool.submit(pull_source, source, incremental, resume) for source in sources}
+        for source, future in futures.items():
+            try:
+                checkpoints[source], report[source], snapshot = future.result()
+                metrics.merge(snapshot)
+                log.info(f"✅ {source}: {report[source]}")
+            except Exception as e:
+                log.error(f"❌ {source} failed: {e.__class__.__name__}: {e}")
+                report[source] = {"error": f"{e.__class__.__name__}: {e}"}
+
+    pulled = [source for source in sources if "error" not in report[source]]
+    merged, dedupe_stats = merge(pulled), None
+    if deduplicate and merged.count("profiles"):
+        tagged = merged
+        merged, dedupe_stats = dedupe.dedupe_stage(tagged, SYNC_STAGING_DIR, key=merged_key)
+        tagged.close()
+        log.info(f"🧬 {dedupe_stats['profiles']} profiles are {dedupe_stats['people']} people "
+                 f"({dedupe_stats['duplicates']} duplicates merged, {dedupe_stats['applications_dropped']} repeat applications dropped)")
+    if not merged.count():
+        log.info("Nothing to analyze.")
+        for checkpoint in checkpoints.values():
+            if checkpoint:
+                checkpoint.save()
+        return None, report
+
+    log.info(f"📤 Sending {merged.count()} merged records from {len(pulled)} sources to Mock AI "
+             f"({merged.count('profiles')} profiles, {merged.count('jobs')} jobs, {merged.count('applications')} applications)")
+    analysis = mockai_upload.send_staged(merged, url=MOCK_AI_URL)
+    merged.close()
+    if analysis is None:
+        log.error("Error sending to Mock AI: every chunk failed")
+        return None, report
+    if dedupe_stats:
+        analysis["dedupe"] = dedupe_stats
+
+    if analysis["failed_chunks"]:
+        log.warning(f"⚠️  {analysis['failed_chunks']} of {analysis['chunks']} chunks failed; checkpoints not advanced")
+    else:
+        for checkpoint in checkpoints.values():
+            if checkpoint:
+                checkpoint.save()
+    log.info(f"AI Analysis Complete: {analysis['analyzed']} candidates across {analysis['grouped_jobs']} jobs")
+    return analysis, report
+
+
+def main(sources=None, incremental=False, output="text", resume=False, deduplicate=SYNC_DEDUPE):
+    sources = sources or list(SOURCES)
+    unknown = [source for source in sources if source not in SOURCES]
+    if unknown:
+        raise SystemExit(f"Unknown sources {unknown}; expected some of {sorted(SOURCES)}")
+
+    writer = RecordWriter(output)
+    analysis, report = sync(sources, incremental, resume, deduplicate=deduplicate)
+    if analysis is not None:
+        writer.write("candidates", analysis["candidates"])
+        writer.write("status_updates", analysis["status_updates"])
+    summary = {"sources": report}
+    if analysis is not None:
+        summary.update({k: v for k, v in analysis.items() if k not in ("candidates", "status_updates")})
+    pulled = sum("error" not in counts for counts in report.values())
+    writer.result("analysis", summary, f"Analyzed {analysis['analyzed'] if analysis else 0} candidates from {pulled} sources")
+    writer.close()
+    return analysis
+
+
+if __name__ == "__main__":
+    setup_logging()
+    selected = option(sys.argv, "--sources")
+    with metrics.run("sync_all"):
+        main(sources=selected.split(",") if selected else None, incremental="--incremental" in sys.argv,
+             output=output_mode(sys.argv), resume="--resume" in sys.argv,
+             deduplicate=SYNC_DEDUPE and "--no-dedupe" not in sys.argv)
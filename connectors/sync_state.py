@@ -0,0 +1,76 @@
+import os, json, hashlib
+
+STATE_DIR = os.getenv("SYNC_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sync_state"))
+
+# Most specific first: an application also carries its job_id and candidate_id, a job only its job_id
+ID_KEYS = ("id", "reference", "key", "application_id", "job_id", "candidate_id", "employee_id")
+
+
+def record_id(record):
+    for key in ID_KEYS:
+        value = record.get(key)
+        if value not in (None, ""):
+            return str(value)
+    return None
+
+
+def content_hash(record, exclude=()):
+    if exclude:
+        record = {k: v for k, v in record.items() if k not in exclude}
+    return hashlib.sha1(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class SyncCheckpoint:
+    """Per-source high-water mark plus a content hash per record id, persisted between runs.
+
+    New hashes are only staged by `changed()`; nothing is written until `save()`, so a
+    run that fails before upload leaves the previous checkpoint untouched.
+    """
+    def __init__(self, source, state_dir=STATE_DIR):
+        self.source = source
+        self.path = os.path.join(state_dir, f"{source}.json")
+        self.high_water_mark = None
+        self.hashes = {}
+        self.pending = {}
+        self.pending_high_water_mark = None
+
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                state = json.load(f)
+            self.high_water_mark = state.get("high_water_mark")
+            self.hashes = state.get("hashes", {})
+
+    def changed(self, kind, records, exclude=()):
+        """Yield only records that are new or whose content differs from the last saved run."""
+        known = self.hashes.get(kind, {})
+        staged = self.pending.setdefault(kind, {})
+        for record in records:
+            rid = record_id(record)
+            digest = content_hash(record, exclude)
+            if rid is None or known.get(rid) != digest:
+                if rid is not None:
+                    staged[rid] = digest
+                yield record
+
+    def advance(self, timestamp):
+        if timestamp and (self.pending_high_water_mark is None or timestamp > self.pending_high_water_mark):
+            self.pending_high_water_mark = timestamp
+
+    def merge(self, pending, high_water_mark=None):
+        """Fold in what a copy of this checkpoint staged elsewhere, e.g. in a worker process."""
+        for kind, staged in pending.items():
+            self.pending.setdefault(kind, {}).update(staged)
+        self.advance(high_water_mark)
+
+    def save(self):
+        for kind, staged in self.pending.items():
+            self.hashes.setdefault(kind, {}).update(staged)
+        self.pending = {}
+        if self.pending_high_water_mark and (self.high_water_mark is None or self.pending_high_water_mark > self.high_water_mark):
+            self.high_water_mark = self.pending_high_water_mark
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"source": self.source, "high_water_mark": self.high_water_mark, "hashes": self.hashes}, f)
+        os.replace(tmp, self.path)
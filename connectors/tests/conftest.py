@@ -0,0 +1,4 @@
+import os, sys
+
+# The connectors are flat scripts importing their siblings by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,81 @@
+import dedupe
+
+PLACEHOLDER = "000-000-0000"
+
+
+def profile(pid, first, last, email=None, phone=None):
+    return {"id": pid, "source": "workable", "first_name": first, "last_name": last, "email": email, "phone": phone}
+
+
+def people(profiles):
+    out, mapping, _ = dedupe.dedupe_profiles(profiles)
+    return out, mapping
+
+
+def same(mapping, a, b):
+    return f"workable:{a}" in mapping and mapping[f"workable:{a}"] == mapping.get(f"workable:{b}")
+
+
+def test_shared_phone_needs_similar_names():
+    out, mapping = people([
+        profile("1", "Ada", "Lovelace", phone="+1 415 555 0100"),
+        profile("2", "Ada", "Lovelace", phone="(415) 555-0100"),
+        profile("3", "Grace", "Hopper", phone="+1 415 555 0100"),
+    ])
+    assert len(out) == 2
+    assert same(mapping, "1", "2")
+    assert "workable:3" not in mapping
+
+
+def test_placeholder_phone_block_only_links_identical_uncontradicted_names(monkeypatch):
+    monkeypatch.setattr(dedupe, "DEDUPE_MAX_BLOCK", 3)
+    out, mapping = people([
+        profile("1", "John", "Smith", email="john.smith@a.com", phone=PLACEHOLDER),
+        profile("2", "John", "Smith", email="jsmith@b.com", phone=PLACEHOLDER),
+        profile("3", "Jon", "Smyth", phone=PLACEHOLDER),
+        profile("4", "Mary", "Jones", phone=PLACEHOLDER),
+        profile("5", "Mary", "Jones", phone=PLACEHOLDER),
+    ])
+    assert same(mapping, "4", "5")
+    assert not same(mapping, "1", "2")
+    assert "workable:3" not in mapping
+    assert len(out) == 4
+
+
+def test_conflicting_emails_are_not_bridged_by_an_email_less_profile():
+    out, mapping = people([
+        profile("1", "John", "Smith", email="john@a.com"),
+        profile("2", "John", "Smith", email="john@b.com"),
+        profile("3", "John", "Smith"),
+    ])
+    assert not same(mapping, "1", "2")
+    assert len(out) == 2
+
+
+def test_stage_keeps_sources_with_the_same_application_number_apart(tmp_path):
+    import sync_all
+    from staging import StagingStore
+
+    records = {
+        "workable": {
+            "profiles": [profile("c1", "Ada", "Lovelace", email="ada@a.com")],
+            "applications": [{"application_id": "5", "candidate_id": "c1", "job_id": "j1"}],
+        },
+        "bamboohr": {
+            "profiles": [profile("c1", "Grace", "Hopper", email="grace@b.com"),
+                         profile("c2", "Grace", "Hopper", email="GRACE@b.com")],
+            "applications": [{"application_id": "5", "candidate_id": "c1", "job_id": "j1"},
+                             {"application_id": "6", "candidate_id": "c2", "job_id": "j1"}],
+        },
+    }
+    stage = StagingStore("merged", tmp_path, key=sync_all.merged_key)
+    for source, kinds in records.items():
+        for kind, rows in kinds.items():
+            stage.append(kind, [sync_all.tag(kind, source, {**row, "source": source}) for row in rows])
+
+    out, stats = dedupe.dedupe_stage(stage, tmp_path, key=sync_all.merged_key)
+    applications = {(app["source"], app["application_id"]): app for app in out.iter("applications")}
+    assert set(applications) == {("workable", "5"), ("bamboohr", "5")}
+    assert applications["bamboohr", "5"]["duplicate_application_ids"] == ["6"]
+    assert "duplicate_application_ids" not in applications["workable", "5"]
+    assert stats["applications_dropped"] == 1
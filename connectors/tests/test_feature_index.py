@@ -0,0 +1,31 @@
+import pytest
+import feature_index
+
+pytestmark = pytest.mark.skipif(not feature_index._load_numpy(), reason="the feature index needs NumPy")
+
+
+def profiles(*names):
+    return [{"id": name, "headline": f"{name} python developer"} for name in names]
+
+
+def test_full_update_drops_records_gone_upstream(tmp_path):
+    index = feature_index.FeatureIndex("workable", "profiles", tmp_path)
+    index.update(profiles("a", "b", "c"), lambda p: p["id"])
+    index.save()
+
+    index = feature_index.FeatureIndex("workable", "profiles", tmp_path)
+    counts = index.update(profiles("a", "c"), lambda p: p["id"], prune=True)
+    index.save()
+    assert counts["removed"] == 1
+
+    index = feature_index.FeatureIndex("workable", "profiles", tmp_path)
+    query = feature_index.embed("python developer")
+    assert {rid for rid, _ in index.search(query, k=10)} == {"a", "c"}
+
+
+def test_incremental_update_keeps_unseen_records(tmp_path):
+    index = feature_index.FeatureIndex("workable", "profiles", tmp_path)
+    index.update(profiles("a", "b"), lambda p: p["id"])
+    counts = index.update(profiles("a"), lambda p: p["id"])
+    assert "removed" not in counts
+    assert index.vector("b") is not None
@@ -0,0 +1,59 @@
+import progress
+
+
+def test_reload_skips_torn_line(tmp_path):
+    ledger = progress.Ledger("workable", tmp_path)
+    ledger.done("enrich", ["1"])
+    ledger.close()
+    with open(ledger.path("enrich"), "ab") as f:
+        f.write(b'{"id": "2", "sta')
+
+    ledger = progress.Ledger("workable", tmp_path)
+    ledger.done("enrich", ["3"])
+    ledger.close()
+
+    reloaded = progress.Ledger("workable", tmp_path)
+    assert reloaded.is_done("enrich", "1")
+    assert not reloaded.is_done("enrich", "2")
+    assert reloaded.is_done("enrich", "3")
+
+
+def test_requeued_dead_letters_survive_reload(tmp_path):
+    ledger = progress.Ledger("bamboohr", tmp_path, max_attempts=2)
+    assert not ledger.fail("write_back", "7", "503", record={"application_id": "7"})
+    assert ledger.fail("write_back", "7", "503", record={"application_id": "7"})
+    assert "7" in ledger.skipped("write_back")
+
+    assert [e["id"] for e in ledger.requeue("write_back")] == ["7"]
+    ledger.close()
+
+    reloaded = progress.Ledger("bamboohr", tmp_path, max_attempts=2)
+    assert reloaded.pending("write_back")["7"]["record"] == {"application_id": "7"}
+    assert reloaded.pending("write_back")["7"]["attempts"] == 0
+    assert "7" not in reloaded.skipped("write_back")
+    assert list(progress.iter_dead_letters(reloaded.dead_letter_path)) == []
+
+
+def test_reset_keeps_pending_and_dead_letters(tmp_path):
+    ledger = progress.Ledger("workable", tmp_path)
+    ledger.done("enrich", ["1"])
+    ledger.fail("enrich", "2", "timeout", record={"id": "2"})
+    ledger.fail("enrich", "3", "404", record={"id": "3"}, permanent=True)
+
+    ledger.reset("enrich", keep_pending=True)
+    ledger.close()
+
+    reloaded = progress.Ledger("workable", tmp_path)
+    assert not reloaded.is_done("enrich", "1")
+    assert reloaded.pending("enrich")["2"]["record"] == {"id": "2"}
+    assert reloaded.skipped("enrich") == {"3"}
+
+
+def test_results_are_stored_with_their_ids(tmp_path):
+    ledger = progress.Ledger("workable", tmp_path)
+    ledger.done("upload", ["a1", "a2"], result={"analyzed": 2})
+    ledger.close()
+
+    reloaded = progress.Ledger("workable", tmp_path)
+    assert reloaded.results("upload") == [{"analyzed": 2}]
+    assert reloaded.is_done("upload", "a1") and reloaded.is_done("upload", "a2")
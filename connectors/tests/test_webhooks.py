@@ -0,0 +1,96 @@
+import os, time
+import pytest
+import webhooks
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(webhooks.__file__)), "webhook_fixtures")
+
+SECRET = "s3cret"
+BODY = b'{"type": "application_status_changed", "data": {"applicationId": 12}}'
+
+
+def lowered(headers):
+    return {k.lower(): v for k, v in headers.items()}
+
+
+def test_bamboohr_signature_accepted():
+    headers = lowered(webhooks.signed_headers("bamboohr", BODY, SECRET, timestamp=1_000_000))
+    webhooks.verify("bamboohr", headers, BODY, SECRET, now=1_000_010)
+
+
+def test_bamboohr_bad_signature_rejected():
+    headers = lowered(webhooks.signed_headers("bamboohr", BODY, "other-secret", timestamp=1_000_000))
+    with pytest.raises(webhooks.SignatureError, match="mismatch"):
+        webhooks.verify("bamboohr", headers, BODY, SECRET, now=1_000_010)
+
+
+def test_bamboohr_tampered_body_rejected():
+    headers = lowered(webhooks.signed_headers("bamboohr", BODY, SECRET, timestamp=1_000_000))
+    with pytest.raises(webhooks.SignatureError, match="mismatch"):
+        webhooks.verify("bamboohr", headers, BODY.replace(b"12", b"13"), SECRET, now=1_000_010)
+
+
+def test_bamboohr_stale_signature_rejected():
+    headers = lowered(webhooks.signed_headers("bamboohr", BODY, SECRET, timestamp=1_000_000))
+    with pytest.raises(webhooks.SignatureError, match="off"):
+        webhooks.verify("bamboohr", headers, BODY, SECRET, now=1_000_000 + webhooks.WEBHOOK_MAX_SKEW + 1)
+
+
+def test_workable_signature_accepted():
+    headers = lowered(webhooks.signed_headers("workable", BODY, SECRET))
+    webhooks.verify("workable", headers, BODY, SECRET)
+
+
+def test_workable_bad_or_missing_signature_rejected():
+    headers = lowered(webhooks.signed_headers("workable", BODY, "other-secret"))
+    with pytest.raises(webhooks.SignatureError, match="mismatch"):
+        webhooks.verify("workable", headers, BODY, SECRET)
+    with pytest.raises(webhooks.SignatureError, match="missing"):
+        webhooks.verify("workable", {}, BODY, SECRET)
+
+
+def replay(source):
+    # A window longer than the test: everything is coalesced into the batch flushed on close
+    return webhooks.replay([os.path.join(FIXTURES, f"{source}.json")], offline=True, dry_run=True, window=60)
+
+
+def test_workable_replay_coalesces_events_per_candidate():
+    results, report, batches = replay("workable")
+    assert [r["status"] for r in results] == [202, 202, 202, 202, 202, 401]
+    assert report["workable"]["events"] == 4
+    assert report["workable"]["records"] == 2
+    assert report["workable"]["rejected"] == 1
+
+    [batch] = batches
+    applications = {app["application_id"]: app for app in batch["applications"]}
+    assert set(applications) == {"2139ea41", "2139ea42"}
+    # Three events for one candidate: only its latest state is sent
+    assert applications["2139ea41"]["stage"] == "Assessment"
+    assert [job["job_id"] for job in batch["jobs"]] == ["1E3CCCC5A3"]
+
+
+def test_bamboohr_replay_coalesces_events_per_application():
+    results, report, batches = replay("bamboohr")
+    assert [r["status"] for r in results] == [202, 202, 202, 401]
+    assert report["bamboohr"]["records"] == 2
+
+    [batch] = batches
+    applications = {app["application_id"]: app for app in batch["applications"]}
+    assert set(applications) == {"204", "205"}
+    assert applications["204"]["status_id"] == 2
+
+
+def test_full_batch_flushes_before_the_window(tmp_path):
+    receiver = webhooks.Receiver({"workable": SECRET}, window=60, max_size=2, offline=True, dry_run=True,
+                                 progress_dir=tmp_path)
+    try:
+        for cid in ("a1", "a2"):
+            body = webhooks.serializers.json_dumps({"firing_rule": "candidate_created", "data": {
+                "id": cid, "firstname": "Test", "lastname": cid, "job": {"shortcode": "J1", "title": "Dev"}}})
+            status, _ = receiver.accept("workable", webhooks.signed_headers("workable", body, SECRET), body)
+            assert status == 202
+        deadline = time.monotonic() + 5
+        while not receiver.batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert [len(batch["applications"]) for batch in receiver.batches] == [2]
+    finally:
+        receiver.close()
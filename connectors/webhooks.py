@@ -0,0 +1,455 @@
+"""Webhook receiver: Workable candidate events and BambooHR application changes, analyzed within seconds.
+
+    python3 connectors/webhooks.py serve [--port 3003] [--window 2]
+    python3 connectors/webhooks.py replay connectors/webhook_fixtures/workable.json [--offline] [--dry-run]
+
+Deliveries go to POST /webhooks/workable and /webhooks/bamboohr. Workable signs each
+one with X-Workable-Signature, the hex HMAC-SHA256 of the body keyed with the
+subscription token (WORKABLE_WEBHOOK_SECRET). BambooHR signs the body followed by
+X-BambooHR-Timestamp (BAMBOOHR_WEBHOOK_SECRET), and deliveries more than
+WEBHOOK_MAX_SKEW seconds old are refused as replays. A bad or missing signature gets a
+401, and a source without a secret accepts nothing.
+
+Accepted events are acknowledged at once and coalesced per record for WEBHOOK_WINDOW
+seconds, or until WEBHOOK_BATCH_MAX records are waiting: a candidate that fires five
+events in a burst is fetched and analyzed once, in its latest state. Each micro-batch
+fetches only its own records' details, through the same enrichment and normalization
+as a full pull, and forwards them with mockai_upload. A record whose fetch or upload
+fails is kept in the receiver's own progress ledger (WEBHOOK_PROGRESS_DIR, apart from
+the batch syncs' ledgers) and retried with the next batch.
+
+`replay` feeds recorded deliveries (a JSON list of {"source", "headers", "body"})
+through the same verification and batching, with a throwaway ledger. Deliveries
+without a signature are signed with the configured secret (or FIXTURE_SECRET), and
+--offline builds records from the event payloads instead of calling the ATS.
+"""
+import os, hmac, json, time, hashlib, logging, argparse, tempfile, threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import requests
+import mockai_upload, normalize, metrics, progress, serializers
+import Workable_to_mockai as workable
+import bamboohr_to_mockai_local as bamboohr
+from cli_output import setup_logging
+
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "3003"))
+WEBHOOK_WINDOW = float(os.getenv("WEBHOOK_WINDOW", "2"))
+WEBHOOK_BATCH_MAX = int(os.getenv("WEBHOOK_BATCH_MAX", "200"))
+WEBHOOK_MAX_SKEW = int(os.getenv("WEBHOOK_MAX_SKEW", "300"))
+WEBHOOK_MAX_BODY = 1024 * 1024
+# Not the batch syncs' ledgers: a sync's reset would replace the files under the receiver's
+# open handles, and each process would retry the other's failures
+WEBHOOK_PROGRESS_DIR = os.getenv("WEBHOOK_PROGRESS_DIR", os.path.join(progress.PROGRESS_DIR, "webhooks"))
+SECRETS = {"workable": os.getenv("WORKABLE_WEBHOOK_SECRET"), "bamboohr": os.getenv("BAMBOOHR_WEBHOOK_SECRET")}
+# Signs replayed fixtures when no real secret is configured
+FIXTURE_SECRET = "fixture-secret"
+
+SIGNATURE_HEADERS = {"workable": "x-workable-signature", "bamboohr": "x-bamboohr-signature"}
+BAMBOOHR_TIMESTAMP_HEADER = "x-bamboohr-timestamp"
+# Workable firing rules that change what /analyze sees
+WORKABLE_EVENTS = ("candidate_created", "candidate_moved")
+
+log = logging.getLogger("webhooks")
+
+
+class SignatureError(Exception):
+    pass
+
+
+# =================== SIGNATURES ===================
+
+def sign(source, body, secret, timestamp=None):
+    message = body + str(timestamp).encode() if source == "bamboohr" else body
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def signed_headers(source, body, secret, timestamp=None):
+    if source == "bamboohr":
+        timestamp = str(int(timestamp if timestamp is not None else time.time()))
+        return {"X-BambooHR-Timestamp": timestamp, "X-BambooHR-Signature": sign(source, body, secret, timestamp)}
+    return {"X-Workable-Signature": sign(source, body, secret)}
+
+
+def verify(source, headers, body, secret, now=None):
+    """Raise SignatureError unless `body` carries a valid, fresh signature; `headers` are lower-cased."""
+    if not secret:
+        raise SignatureError(f"no {source} webhook secret configured")
+    signature = headers.get(SIGNATURE_HEADERS[source])
+    if not signature:
+        raise SignatureError(f"missing {SIGNATURE_HEADERS[source]}")
+    timestamp = None
+    if source == "bamboohr":
+        timestamp = headers.get(BAMBOOHR_TIMESTAMP_HEADER)
+        try:
+            age = abs((now or time.time()) - int(timestamp))
+        except (TypeError, ValueError):
+            raise SignatureError(f"missing or invalid {BAMBOOHR_TIMESTAMP_HEADER}")
+        if age > WEBHOOK_MAX_SKEW:
+            raise SignatureError(f"timestamp is {age:.0f}s off")
+    if not hmac.compare_digest(signature.strip().lower(), sign(source, body, secret, timestamp)):
+        raise SignatureError("signature mismatch")
+
+
+# =================== EVENTS ===================
+
+def workable_events(body):
+    """[(candidate id, candidate)] for a Workable candidate event; other firing rules are ignored."""
+    if body.get("firing_rule") not in WORKABLE_EVENTS:
+        return []
+    data = body.get("data") or {}
+    candidate = data.get("candidate", data)
+    return [(str(candidate["id"]), candidate)] if candidate.get("id") else []
+
+
+def bamboohr_events(body):
+    """[(application id, event)] for a BambooHR delivery: {"applications": [{"id", "action", "fields"}]}."""
+    return [(str(event["id"]), event) for event in body.get("applications") or []
+            if event.get("id") and event.get("action") != "Deleted"]
+
+
+EVENTS = {"workable": workable_events, "bamboohr": bamboohr_events}
+
+
+# =================== RECORDS ===================
+
+def workable_records(receiver, events, ledger):
+    """Enrich the batch's candidates and map them to Mock AI records, fetching each new job once."""
+    url, headers = f"{workable.WORKABLE_BASE_URL}/candidates", workable.workable_headers()
+
+    def enrich(item):
+        rid, candidate = item
+        if receiver.offline:
+            return rid, candidate
+        try:
+            return rid, workable.enrich_candidate(url, headers, dict(candidate), strict=True)
+        except (requests.RequestException, workable.EnrichError) as e:
+            ledger.fail("enrich", rid, e, record=candidate, permanent=getattr(e, "permanent", False))
+            return rid, None
+
+    with ThreadPoolExecutor(max_workers=workable.WORKABLE_MAX_IN_FLIGHT) as pool:
+        fetched = {rid: cand for rid, cand in pool.map(enrich, events.items()) if cand is not None}
+    calls = 0 if receiver.offline else len(events)
+
+    jobs = {}
+    for candidate in fetched.values():
+        shortcode = (candidate.get("job") or {}).get("shortcode")
+        if shortcode is None or shortcode in jobs:
+            continue
+        job = receiver.jobs.get(("workable", shortcode))
+        if job is None:
+            if not receiver.offline:
+                job = workable.fetch_workable_job(shortcode)
+                calls += 1
+            # The event's own job reference still names and titles it
+            job = receiver.jobs[("workable", shortcode)] = normalize.job_from_workable(
+                job if job and job.get("shortcode") else candidate["job"], "workable").to_dict()
+        jobs[shortcode] = job
+
+    candidates = list(fetched.values())
+    return {"profiles": list(workable.transform_candidates_to_profiles(candidates)), "jobs": list(jobs.values()),
+            "applications": list(workable.create_applications_from_candidates(candidates)),
+            "fetched": {rid: events[rid] for rid in fetched}, "calls": calls}
+
+
+def bamboohr_records(receiver, events, ledger):
+    """Fetch each changed application (applicant, job and status included) and map it to Mock AI records."""
+    def fetch(item):
+        rid, event = item
+        if receiver.offline:
+            return rid, {"id": rid, **(event.get("fields") or {})}
+        try:
+            return rid, bamboohr.fetch_application(bamboohr.company_subdomain, bamboohr.access_token, rid)
+        except requests.RequestException as e:
+            status = getattr(e.response, "status_code", None)
+            ledger.fail("enrich", rid, e, record=event, permanent=status in bamboohr.PERMANENT_STATUSES)
+            return rid, None
+
+    with ThreadPoolExecutor(max_workers=bamboohr.BAMBOOHR_MAX_IN_FLIGHT) as pool:
+        fetched = {rid: detail for rid, detail in pool.map(fetch, events.items()) if detail is not None}
+
+    profiles, jobs, applications = {}, {}, []
+    for detail in fetched.values():
+        application = normalize.application_from_hrflow(detail, "bamboohr").to_dict()
+        applications.append(application)
+        if detail.get("applicant"):
+            profile = normalize.profile_from_hrflow(detail["applicant"], "bamboohr").to_dict()
+            profiles[profile.get("id")] = profile
+        if detail.get("job"):
+            job = normalize.job_from_hrflow(detail["job"], "bamboohr").to_dict()
+            jobs[job.get("job_id")] = job
+    return {"profiles": list(profiles.values()), "jobs": list(jobs.values()), "applications": applications,
+            "fetched": {rid: events[rid] for rid in fetched}, "calls": 0 if receiver.offline else len(events)}
+
+
+BUILDERS = {"workable": workable_records, "bamboohr": bamboohr_records}
+
+
+# =================== BATCHING ===================
+
+class Batcher:
+    """Coalesces events per record and hands each source's batch to `flush(source, events, received)`.
+
+    A batch is flushed `window` seconds after its first event arrived, or once `max_size`
+    records are waiting. Flushes run one at a time on the batcher's own thread, so events
+    keep being accepted (and coalesced) while a batch is fetched and uploaded.
+    """
+    def __init__(self, flush, window=WEBHOOK_WINDOW, max_size=WEBHOOK_BATCH_MAX):
+        self.flush = flush
+        self.window = window
+        self.max_size = max_size
+        self.cond = threading.Condition()
+        self.pending = {}
+        self.first_at = {}
+        self.received = Counter()
+        self.stopping = False
+        self.thread = threading.Thread(target=self._run, name="webhook-batcher", daemon=True)
+        self.thread.start()
+
+    def add(self, source, events):
+        with self.cond:
+            batch = self.pending.setdefault(source, {})
+            self.first_at.setdefault(source, time.monotonic())
+            for rid, payload in events:
+                # A later event for the same record replaces the earlier one
+                batch.pop(rid, None)
+                batch[rid] = payload
+            self.received[source] += len(events)
+            self.cond.notify()
+
+    def _due(self, now):
+        return [source for source, batch in self.pending.items()
+                if self.stopping or len(batch) >= self.max_size or now - self.first_at[source] >= self.window]
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not (due := self._due(time.monotonic())):
+                    if self.stopping:
+                        return
+                    now = time.monotonic()
+                    self.cond.wait(min((self.first_at[s] + self.window - now for s in self.pending), default=None))
+                batches = [(source, self.pending.pop(source), self.received.pop(source, 0)) for source in due]
+                for source in due:
+                    del self.first_at[source]
+            for source, batch, received in batches:
+                try:
+                    self.flush(source, batch, received)
+                except Exception as e:
+                    log.exception(f"❌ {source} webhook batch failed: {e.__class__.__name__}: {e}")
+
+    def close(self):
+        """Flush whatever is still waiting and stop."""
+        with self.cond:
+            self.stopping = True
+            self.cond.notify()
+        self.thread.join()
+
+
+class Receiver:
+    """Verifies deliveries, batches their events and forwards each batch to /analyze."""
+    def __init__(self, secrets=None, window=WEBHOOK_WINDOW, max_size=WEBHOOK_BATCH_MAX, url=None, offline=False,
+                 dry_run=False, progress_dir=WEBHOOK_PROGRESS_DIR):
+        self.secrets = {**SECRETS, **(secrets or {})}
+        self.url = url or mockai_upload.MOCK_AI_URL
+        self.offline = offline
+        self.dry_run = dry_run
+        self.progress_dir = progress_dir
+        self.ledgers = {}
+        self.jobs = {}
+        self.stats = defaultdict(Counter)
+        self.batches = []
+        self.batcher = Batcher(self.flush, window, max_size)
+
+    def ledger(self, source):
+        if source not in self.ledgers:
+            self.ledgers[source] = progress.Ledger(source, self.progress_dir)
+        return self.ledgers[source]
+
+    def accept(self, source, headers, body):
+        """Verify and queue one delivery; returns (HTTP status, response body)."""
+        if source not in EVENTS:
+            return 404, {"error": f"unknown source {source!r}"}
+        stats = self.stats[source]
+        stats["deliveries"] += 1
+        try:
+            verify(source, {k.lower(): v for k, v in headers.items()}, body, self.secrets.get(source))
+            events = EVENTS[source](serializers.json_loads(body))
+        except SignatureError as e:
+            stats["rejected"] += 1
+            metrics.increment("webhook_deliveries_total", source=source, result="rejected")
+            log.warning(f"🚫 Rejected a {source} delivery: {e}")
+            return 401, {"error": "invalid signature"}
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            stats["malformed"] += 1
+            metrics.increment("webhook_deliveries_total", source=source, result="malformed")
+            log.warning(f"Malformed {source} delivery: {e.__class__.__name__}: {e}")
+            return 400, {"error": "malformed payload"}
+        metrics.increment("webhook_deliveries_total", source=source, result="accepted" if events else "ignored")
+        stats["events"] += len(events)
+        if events:
+            self.batcher.add(source, events)
+        return 202, {"accepted": len(events)}
+
+    def flush(self, source, events, received=0):
+        ledger = self.ledger(source)
+        retried = 0
+        # Records that failed before ride along with the next batch of their source
+        for rid, entry in ledger.pending("enrich").items():
+            if entry.get("record") and rid not in events:
+                events[rid] = entry["record"]
+                retried += 1
+        with metrics.span("webhook_batch", source=source):
+            built = BUILDERS[source](self, events, ledger)
+            analysis = self.forward(source, built) if built["applications"] else None
+        if built["applications"] and analysis is None:
+            for rid, payload in built["fetched"].items():
+                ledger.fail("enrich", rid, "upload to Mock AI failed", record=payload)
+        elif built["fetched"]:
+            ledger.done("enrich", list(built["fetched"]))
+
+        stats = self.stats[source]
+        stats["batches"] += 1
+        stats["records"] += len(events)
+        stats["api_calls"] += built["calls"]
+        stats["analyzed"] += analysis["analyzed"] if analysis else 0
+        log.info(f"🔔 {source}: {received} events -> {len(events)} records"
+                 + (f" ({retried} retried)" if retried else "")
+                 + f", {built['calls']} API calls, {len(built['applications'])} applications "
+                 + ("(dry run)" if self.dry_run else f"analyzed: {analysis['analyzed']}" if analysis else "not sent"))
+
+    def forward(self, source, built):
+        records = {kind: built[kind] for kind in ("profiles", "jobs", "applications")}
+        if self.dry_run:
+            self.batches.append({"source": source, **records})
+            return {"analyzed": 0, "failed_chunks": 0}
+        analysis = mockai_upload.send_to_mock_ai(**records, url=self.url)
+        if analysis is not None and analysis["failed_chunks"]:
+            # Batches are smaller than a chunk, so this only happens for very large bursts; resending is harmless
+            return None
+        return analysis
+
+    def close(self):
+        self.batcher.close()
+        for ledger in self.ledgers.values():
+            ledger.close()
+
+    def report(self):
+        return {source: dict(stats) for source, stats in self.stats.items()}
+
+
+# =================== HTTP ===================
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    server_version = "MockAIWebhooks/1.0"
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+    def reply(self, status, body):
+        data = serializers.json_dumps(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/health":
+            return self.reply(404, {"error": "not found"})
+        receiver = self.server.receiver
+        self.reply(200, {"status": "ok", "sources": sorted(s for s in EVENTS if receiver.secrets.get(s)),
+                         "deliveries": receiver.report()})
+
+    def do_POST(self):
+        segments = [s for s in urlsplit(self.path).path.split("/") if s]
+        if len(segments) != 2 or segments[0] != "webhooks":
+            self.close_connection = True
+            return self.reply(404, {"error": "not found"})
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > WEBHOOK_MAX_BODY:
+            self.close_connection = True
+            return self.reply(413, {"error": "payload too large"})
+        body = self.rfile.read(length)
+        self.reply(*self.server.receiver.accept(segments[1], dict(self.headers.items()), body))
+
+
+def serve(host=WEBHOOK_HOST, port=WEBHOOK_PORT, window=WEBHOOK_WINDOW, max_size=WEBHOOK_BATCH_MAX):
+    receiver = Receiver(window=window, max_size=max_size)
+    server = ThreadingHTTPServer((host, port), WebhookHandler)
+    server.daemon_threads = True
+    server.receiver = receiver
+    configured = [source for source in EVENTS if receiver.secrets.get(source)]
+    if not configured:
+        log.warning("No webhook secrets configured (WORKABLE_WEBHOOK_SECRET, BAMBOOHR_WEBHOOK_SECRET); "
+                    "every delivery will be rejected")
+    log.info(f"🪝 Webhook receiver on http://{host}:{server.server_address[1]}/webhooks/<source> "
+             f"for {', '.join(configured) or 'no sources'}; batching every {window}s")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        receiver.close()
+    return receiver.report()
+
+
+# =================== REPLAY ===================
+
+def load_deliveries(path):
+    with open(path, "rb") as f:
+        deliveries = serializers.json_loads(f.read())
+    return deliveries if isinstance(deliveries, list) else [deliveries]
+
+
+def replay(paths, offline=False, dry_run=False, window=WEBHOOK_WINDOW, url=None):
+    """Run recorded deliveries through a Receiver; returns (per-delivery results, report, batches)."""
+    secrets = {source: SECRETS[source] or FIXTURE_SECRET for source in EVENTS}
+    results = []
+    with tempfile.TemporaryDirectory(prefix="webhook-replay-") as progress_dir:
+        receiver = Receiver(secrets, window, url=url, offline=offline, dry_run=dry_run, progress_dir=progress_dir)
+        for path in paths:
+            for delivery in load_deliveries(path):
+                source, body = delivery["source"], delivery["body"]
+                body = body.encode() if isinstance(body, str) else serializers.json_dumps(body)
+                headers = dict(delivery.get("headers") or {})
+                # Recorded signatures are kept as they are, e.g. to check that forged ones are refused
+                if source in SIGNATURE_HEADERS and not any(k.lower() == SIGNATURE_HEADERS[source] for k in headers):
+                    headers.update(signed_headers(source, body, secrets[source]))
+                status, response = receiver.accept(source, headers, body)
+                results.append({"source": source, "status": status, **response})
+        receiver.close()
+    return results, receiver.report(), receiver.batches
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Receive ATS webhooks and forward changed candidates to Mock AI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_cmd = commands.add_parser("serve", help="run the webhook receiver")
+    serve_cmd.add_argument("--host", default=WEBHOOK_HOST)
+    serve_cmd.add_argument("--port", type=int, default=WEBHOOK_PORT)
+    serve_cmd.add_argument("--window", type=float, default=WEBHOOK_WINDOW, help="seconds to coalesce events for")
+    serve_cmd.add_argument("--batch-max", type=int, default=WEBHOOK_BATCH_MAX, help="records that flush a batch early")
+    replay_cmd = commands.add_parser("replay", help="run recorded deliveries through the receiver")
+    replay_cmd.add_argument("paths", nargs="+")
+    replay_cmd.add_argument("--offline", action="store_true", help="build records from the events; no ATS calls")
+    replay_cmd.add_argument("--dry-run", action="store_true", help="print the batches instead of sending them")
+    replay_cmd.add_argument("--window", type=float, default=WEBHOOK_WINDOW)
+    replay_cmd.add_argument("--url", help=f"/analyze endpoint (default {mockai_upload.MOCK_AI_URL})")
+    return parser
+
+
+if __name__ == "__main__":
+    setup_logging()
+    args = build_parser().parse_args()
+    with metrics.run("webhooks"):
+        if args.command == "serve":
+            serve(args.host, args.port, args.window, args.batch_max)
+        else:
+            results, report, batches = replay(args.paths, args.offline, args.dry_run, args.window, args.url)
+            for batch in batches:
+                print(json.dumps(batch))
+            print(json.dumps({"deliveries": results, "report": report}, indent=2))
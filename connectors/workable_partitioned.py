@@ -0,0 +1,158 @@
+"""Partitioned Workable sync: candidates sharded by job across worker processes.
+
+    python3 connectors/workable_partitioned.py [--workers 8] [--shards 32] [--incremental] [--resume] [--output json]
+
+Jobs are listed once. Each shortcode hashes to one of `shards` shards, and `workers`
+processes pull shards as they free up: a shard lists and enriches only its jobs'
+candidates (`/candidates?shortcode=`), transforms them and stages them under its own
+directory, so the CPU-bound work runs in parallel instead of behind one GIL. Every
+process draws from one shared Workable rate budget. A reducer then merges the shard
+stages into a single workable stage, which is indexed and uploaded once.
+
+Shard assignment only depends on the shortcode and shard count, so --resume skips
+shards that already finished and re-pulls the rest.
+"""
+import os, zlib, logging, argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import http_client, feature_index, metrics
+import Workable_to_mockai as workable
+from cli_output import RecordWriter, setup_logging, sync_options
+from staging import KINDS, STAGING_DIR, StagingStore
+from sync_state import SyncCheckpoint
+
+PARTITION_WORKERS = int(os.getenv("WORKABLE_PARTITION_WORKERS", str(os.cpu_count() or 2)))
+# More shards than workers evens out jobs of very different sizes
+PARTITION_SHARDS = int(os.getenv("WORKABLE_PARTITION_SHARDS", "0"))
+PARTITION_STAGING_DIR = os.path.join(STAGING_DIR, "workable_partitioned")
+
+log = logging.getLogger("workable_partitioned")
+
+
+def shard_of(shortcode, shards):
+    # crc32 rather than hash(): str hashes are salted per process
+    return zlib.crc32(str(shortcode).encode()) % shards
+
+
+def partition(jobs, shards):
+    groups = defaultdict(list)
+    for job in jobs:
+        groups[shard_of(job.get("shortcode"), shards)].append(job)
+    return dict(sorted(groups.items()))
+
+
+def shard_name(index):
+    return f"workable-shard-{index}"
+
+
+def init_worker(limiter_key, limiter):
+    # Forked workers inherit the parent's logging; spawned ones start unconfigured
+    if not logging.getLogger().handlers:
+        setup_logging()
+    http_client.share_limiter(limiter_key, limiter)
+
+
+def pull_shard(index, jobs, incremental=False, resume=False, staging_dir=PARTITION_STAGING_DIR):
+    """Stage one shard's jobs and candidates; returns (counts, checkpoint changes, metrics)."""
+    # Pool processes run several shards; each reports only its own numbers
+    metrics.reset()
+    checkpoint = SyncCheckpoint("workable") if incremental else None
+    stage = StagingStore(shard_name(index), staging_dir, resume=resume)
+    with metrics.sampling(), metrics.span("shard"):
+        for kind, records in workable.iter_batches(checkpoint, stage, jobs=jobs):
+            log.debug(f"Shard {index}: staged {len(records)} {kind}")
+    stage.close()
+    changes = (checkpoint.pending, checkpoint.pending_high_water_mark) if checkpoint else None
+    return {kind: stage.count(kind) for kind in KINDS}, changes, metrics.snapshot()
+
+
+def reduce(shards, staging_dir=PARTITION_STAGING_DIR):
+    """Merge the shard stages into one workable stage, deduplicated by id."""
+    merged = StagingStore("workable", staging_dir)
+    with metrics.span("reduce"):
+        for index in shards:
+            stage = StagingStore(shard_name(index), staging_dir, resume=True)
+            for kind, records in stage.iter_batches():
+                merged.append(kind, records)
+            stage.close()
+    return merged
+
+
+def sync(workers=PARTITION_WORKERS, shards=None, incremental=False, resume=False, staging_dir=PARTITION_STAGING_DIR):
+    """Pull every shard in parallel, reduce and upload; returns (analysis, per-shard report)."""
+    shards = shards or PARTITION_SHARDS or 4 * workers
+    # One budget for the parent's job listing and every worker's requests
+    key = http_client.rate_limit_key(workable.WORKABLE_BASE_URL)
+    rate, burst = http_client.HOST_RATE_LIMITS.get(key) or http_client.HOST_RATE_LIMITS["workable.com"]
+    limiter = http_client.SharedTokenBucket(rate, burst)
+    http_client.share_limiter(key, limiter)
+
+    groups = partition(workable.fetch_workable_jobs(), shards)
+    checkpoint = SyncCheckpoint("workable") if incremental else None
+    log.info(f"Pulling {sum(map(len, groups.values()))} jobs in {len(groups)} shards with {workers} workers "
+             f"(shared budget {rate}/s, burst {burst})")
+
+    report, failed = {}, []
+    # Passed explicitly: spawned workers re-import this module and would not see an override
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(key, limiter)) as pool:
+        futures = {index: pool.submit(pull_shard, index, jobs, incremental, resume, staging_dir) for index, jobs in groups.items()}
+        for index, future in futures.items():
+            try:
+                report[index], changes, snapshot = future.result()
+            except Exception as e:
+                log.error(f"❌ Shard {index} failed: {e.__class__.__name__}: {e}")
+                report[index] = {"error": f"{e.__class__.__name__}: {e}"}
+                failed.append(index)
+                continue
+            metrics.merge(snapshot)
+            if checkpoint and changes:
+                checkpoint.merge(*changes)
+
+    if failed:
+        # Finished shards are kept, so a --resume run only pulls these again
+        log.error(f"{len(failed)} of {len(groups)} shards failed; nothing sent. Rerun with --resume to retry them.")
+        return None, report
+
+    merged = reduce(groups, staging_dir)
+    if not merged.count():
+        log.info("No changes since last sync." if checkpoint else "No candidates found.")
+        if checkpoint:
+            checkpoint.save()
+        return None, report
+
+    log.info(f"Staged {merged.count('profiles')} profiles, {merged.count('jobs')} jobs, "
+             f"{merged.count('applications')} applications from {len(groups)} shards")
+    feature_index.update_from_stage("workable", merged, full=not incremental)
+    analysis = workable.send_to_mock_ai(merged)
+    merged.close()
+    if analysis is not None and checkpoint and not analysis["failed_chunks"]:
+        checkpoint.save()
+    return analysis, report
+
+
+def main(workers=PARTITION_WORKERS, shards=None, incremental=False, output="text", resume=False):
+    writer = RecordWriter(output)
+    analysis, report = sync(workers, shards, incremental, resume)
+    summary = {"shards": report}
+    if analysis is not None:
+        writer.write("candidates", analysis["candidates"])
+        summary.update({k: v for k, v in analysis.items() if k not in ("candidates", "status_updates")})
+    writer.result("analysis", summary, f"Analyzed {analysis['analyzed'] if analysis else 0} candidates "
+                                       f"from {len(report)} shards")
+    writer.close()
+    return analysis
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Sync a large Workable account with candidates sharded across processes.",
+                                     parents=[sync_options()])
+    parser.add_argument("--workers", type=int, default=PARTITION_WORKERS, help="worker processes")
+    parser.add_argument("--shards", type=int, default=PARTITION_SHARDS or None, help="shards (default 4 per worker)")
+    return parser
+
+
+if __name__ == "__main__":
+    setup_logging()
+    args = build_parser().parse_args()
+    with metrics.run("workable_partitioned"):
+        main(args.workers, args.shards, args.incremental, args.output, args.resume)